@@ -1,83 +1,1150 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Header, Path as PathParam, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.websockets import WebSocketState
+from pymongo import InsertOne, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import InsertOneResult, UpdateResult
 import os
+import sys
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from types import FrameType
+from dataclasses import dataclass
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from typing import (Annotated, Any, Awaitable, BinaryIO, Callable, Deque, Dict, Iterable, List, Mapping,
+                    NamedTuple, Optional, Set, Tuple, Union)
+from concurrent.futures import ProcessPoolExecutor
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import random
+import secrets
+import hashlib
+import struct
+import mmap
+import multiprocessing
+import asyncio
+import contextvars
+import numpy as np
+import orjson
+import copy
+import functools
+import json
+import math
+import time
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Opened on first use rather than at import, so the memory backends and the
+# CLI never connect and a new process can start serving without waiting on
+# the database. Motor pools connections per client; this one is shared.
+_mongo_client = None
+
+
+def mongo_client():
+    global _mongo_client
+    if _mongo_client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        _mongo_client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'],
+            maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+            serverSelectionTimeoutMS=int(os.environ.get('MONGO_TIMEOUT_MS', 5000)),
+        )
+    return _mongo_client
+
+
+class LazyCollection:
+    """A collection in DB_NAME, looked up on its first use"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collection = None
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            self._collection = mongo_client()[os.environ['DB_NAME']][self.name]
+        return getattr(self._collection, attr)
+
+
+class LazyDatabase:
+    def __getattr__(self, name: str) -> LazyCollection:
+        return LazyCollection(name)
+
+
+db = LazyDatabase()
+
+
+# Startup and shutdown
+# Defined ahead of the app so it can be passed to FastAPI; the globals they
+# use are looked up when the app starts, by which point all are defined.
+async def warm_up():
+    """Do the one-time work of a first hand before taking traffic"""
+    # Full shoe pools, so the first deals never shuffle inline
+    await asyncio.to_thread(shoe_pool.fill)
+    if table_shoe_pool is not shoe_pool:
+        await asyncio.to_thread(table_shoe_pool.fill)
+    shoe_cut_point(SHOE_DECKS * len(CARDS))
+    shoe_cut_point(TABLE_DECKS * len(CARDS), hands=TABLE_SEATS + 1)
+    # A throwaway hand through the shuffler, scoring and the JSON encoder
+    shoe_seed, deck = create_shoes(1, SHOE_DECKS, SHUFFLE_RNG)[0]
+    game_session = GameSession("warm-up", deck, shoe_seed, SHUFFLE_RNG)
+    start_hand(game_session)
+    dealer_play_codes(game_session.dealer_cards, game_session.deck)
+    encode_json(game_session.to_state())
+    encode_json(Table("warm-up", deck, shoe_seed, SHUFFLE_RNG).to_state())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    sessions = await journal.start()
+    if journal.directory is not None and isinstance(session_backend.backend, MemorySessionBackend):
+        # Games written to the journal but possibly not to the backend before
+        # a crash; the journal is always at least as recent
+        for game_id, game_session in sessions.items():
+            await session_backend.create(game_id, game_session)
+        logger.info("Rebuilt %d game sessions from the event journal", len(sessions))
+    await session_backend.start()
+    await wallet_store.start()
+    await hand_export.start()
+    await warm_up()
+    app.state.shoe_refill = asyncio.create_task(shoe_pool.run())
+    app.state.stats_refresh = asyncio.create_task(play_stats.run())
+    app.state.table_tasks = [asyncio.create_task(table_sessions.run_sweeper())]
+    if table_shoe_pool is not shoe_pool:
+        app.state.table_tasks.append(asyncio.create_task(table_shoe_pool.run()))
+    app.state.ready = True
+
+    yield
+
+    app.state.ready = False
+    await session_backend.close()
+    await wallet_store.close()
+    await journal.close()
+    await hand_export.close()
+    app.state.shoe_refill.cancel()
+    app.state.stats_refresh.cancel()
+    for task in app.state.table_tasks:
+        task.cancel()
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+    if _mongo_client is not None:
+        _mongo_client.close()
+
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+# JSON responses
+# Results returned by api_router routes are written by StateResponse rather
+# than FastAPI's serializer, which would validate them against the declared
+# response_model and convert them with jsonable_encoder first. States are
+# built with model_construct from sessions that are already valid, so orjson
+# encodes them straight to bytes, reusing the cached JSON of each of the 52
+# cards (CARD_FRAGMENTS). response_model stays declared for the OpenAPI schema.
+def _json_default(obj):
+    if isinstance(obj, BaseModel):
+        fragment = CARD_FRAGMENTS.get(id(obj))
+        return fragment if fragment is not None else obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def encode_json(content) -> bytes:
+    """JSON for a reply that may hold states, models and numpy values"""
+    return orjson.dumps(content, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+class StateResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return encode_json(content)
+
+
+class StateRoute(APIRoute):
+    """APIRoute that hands whatever its endpoint returns to StateResponse"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        # include_router builds the app's copy of each route from the wrapped endpoint
+        if asyncio.iscoroutinefunction(endpoint) and not hasattr(endpoint, "__wrapped__"):
+            handler = endpoint
+
+            @functools.wraps(handler)
+            async def endpoint(*args, **kwargs):
+                result = await handler(*args, **kwargs)
+                return result if isinstance(result, Response) else StateResponse(result)
+
+        super().__init__(path, endpoint, **kwargs)
+
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=StateRoute)
 
 
 # Blackjack Game Models
 class Card(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     suit: str  # hearts, diamonds, clubs, spades
     rank: str  # A, 2, 3, 4, 5, 6, 7, 8, 9, 10, J, Q, K
     value: int  # Numerical value for game logic
     display: str  # Display name (A, 2-10, J, Q, K)
 
+@dataclass(slots=True)
+class HandTotals:
+    """Running totals of a hand, updated in O(1) per card"""
+    hard: int = 0  # aces counted as 1
+    soft: Optional[int] = None  # one ace counted as 11, when that does not bust
+
+    @classmethod
+    def of(cls, cards: Iterable[Card]) -> "HandTotals":
+        totals = cls()
+        for card in cards:
+            totals.add(card)
+        return totals
+
+    def add(self, card: Card):
+        if card.rank == 'A':
+            self.hard += 1
+            usable_ace = True
+        else:
+            self.hard += card.value
+            usable_ace = self.soft is not None
+        # Once hard + 10 busts it stays bust, so soft never comes back
+        self.soft = self.hard + 10 if usable_ace and self.hard + 10 <= 21 else None
+
+    @property
+    def best(self) -> int:
+        """Same as calculate_score over the hand's cards"""
+        return self.hard if self.soft is None else self.soft
+
+STARTING_BALANCE = 1000.0
+
 class GameState(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    player_id: Optional[str] = None  # balance lives in the player's wallet when set
+    hand: int = 0  # hands dealt in this game, part of the wallet idempotency keys
     player_cards: List[Card] = []
-    dealer_cards: List[Card] = []
+    dealer_cards: List[Card] = []  # the upcard only while playing
     player_score: int = 0
     dealer_score: int = 0
+    player_totals: HandTotals = Field(default_factory=HandTotals)
+    dealer_totals: HandTotals = Field(default_factory=HandTotals)  # visible cards only while playing
     game_status: str = "waiting"  # waiting, playing, player_win, dealer_win, push, player_bust, dealer_bust
     bet_amount: float = 0
-    balance: float = 1000.0
+    balance: float = STARTING_BALANCE
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0  # bumped on every save, used for optimistic concurrency
+
+class GameSession:
+    """A live game as held by game_sessions and the session backends.
+
+    Cards are one-byte indices into CARDS kept in bytearrays, for the hands
+    as well as the rest of the shoe, so a session is a handful of small
+    objects whatever the shoe size. The GameState model is only built from
+    it for responses, by `to_state`.
+    """
+
+    __slots__ = (
+        "id", "player_id", "player_cards", "dealer_cards", "player_totals", "dealer_totals",
+        "game_status", "bet_amount", "balance", "created_at", "version", "hand",
+        "deck", "shoe_size", "shoe_seed", "shoe_rng", "pending_payout",
+    )
+
+    def __init__(self, id: str, deck: bytearray, shoe_seed: int, shoe_rng: str,
+                 player_id: Optional[str] = None, balance: float = STARTING_BALANCE,
+                 created_at: Optional[datetime] = None):
+        self.id = id
+        self.player_id = player_id
+        self.player_cards = bytearray()
+        self.dealer_cards = bytearray()
+        self.player_totals = HandTotals()
+        self.dealer_totals = HandTotals()  # visible cards only while playing
+        self.game_status = "waiting"
+        self.bet_amount = 0.0
+        self.balance = balance
+        self.created_at = created_at or datetime.utcnow()
+        self.version = 0
+        self.hand = 0
+        self.deck = deck  # remaining shoe, dealt from the end
+        self.shoe_size = len(deck)
+        self.shoe_seed = shoe_seed
+        self.shoe_rng = shoe_rng
+        self.pending_payout = 0.0  # owed to the wallet for this hand, see credit_payout
+
+    @property
+    def player_score(self) -> int:
+        return self.player_totals.best
+
+    @property
+    def dealer_score(self) -> int:
+        return self.dealer_totals.best
+
+    @property
+    def visible_dealer_cards(self) -> bytearray:
+        """The hole card stays hidden until the dealer plays"""
+        return self.dealer_cards[:1] if self.game_status == "playing" else self.dealer_cards
+
+    def to_state(self) -> GameState:
+        """The response model for this game (built without re-validating)"""
+        return GameState.model_construct(
+            id=self.id,
+            player_id=self.player_id,
+            hand=self.hand,
+            player_cards=[CARDS[i] for i in self.player_cards],
+            dealer_cards=[CARDS[i] for i in self.visible_dealer_cards],
+            player_score=self.player_score,
+            dealer_score=self.dealer_score,
+            player_totals=HandTotals(self.player_totals.hard, self.player_totals.soft),
+            dealer_totals=HandTotals(self.dealer_totals.hard, self.dealer_totals.soft),
+            game_status=self.game_status,
+            bet_amount=self.bet_amount,
+            balance=self.balance,
+            created_at=self.created_at,
+            version=self.version,
+        )
+
+class GameDelta(BaseModel):
+    """Compact reply to hit or stand, see game_delta"""
+    id: str
+    version: int
+    player_cards: Optional[List[str]] = None  # newly dealt cards as codes, e.g. "10H"
+    dealer_cards: Optional[List[str]] = None
+    player_score: Optional[int] = None
+    dealer_score: Optional[int] = None
+    game_status: Optional[str] = None
+    balance: Optional[float] = None
+
+class ErrorReply(BaseModel):
+    error: str
+
+class Hint(BaseModel):
+    id: str
+    player_score: int
+    soft: bool
+    upcard: int  # 2-11, ace = 11
+    action: str  # hit or stand
+
+class Odds(BaseModel):
+    id: str
+    cards_unseen: int  # the remaining deck and the dealer's hole card
+    player_score: int
+    bust_probability: float  # of one more hit
+    dealer_final: Dict[str, float]  # dealer total ("bust" past 21) -> probability
+    ev_stand: float
+    ev_hit: float
+    best_action: str  # hit or stand
+
+class Wallet(BaseModel):
+    player_id: str
+    balance: float
+
+class SimResult(BaseModel):
+    hands: int
+    ev: float  # per unit bet
+    house_edge: float
+    variance: float
+    win_rate: float
+    loss_rate: float
+    push_rate: float
+    player_bust_rate: float
+    dealer_bust_rate: float
+
+class BatchTotals(SimResult):
+    bet: float
+    net: float  # winnings net of stakes
+
+class PlayStatsReply(BaseModel):
+    hands: int
+    wagered: float
+    net: float  # the players' winnings net of stakes
+    win_rate: float
+    push_rate: float
+    bust_rate: float
+    outcomes: Dict[str, int]  # hands per final game_status
+    players: int  # wallet players who have finished a hand
+    updated_at: datetime
+
+class Standing(BaseModel):
+    rank: int
+    player_id: str
+    balance: float
+    hands: int
+    wins: int
+    net: float
+
+class Leaderboard(BaseModel):
+    players: List[Standing]
+    updated_at: datetime
 
 class BetRequest(BaseModel):
-    amount: float
+    amount: float = Field(gt=0)
+
+class SimRequest(BaseModel):
+    hands: int = Field(1_000_000, ge=1, le=10_000_000)  # about 2 CPU-seconds per million
+    strategy: Union[str, dict, None] = None  # see parse_strategy; default hits below 17
+    seed: Optional[int] = None
+    decks: Optional[int] = Field(None, ge=1, le=8)  # defaults to SHOE_DECKS
+
+class BatchRequest(BaseModel):
+    hands: int = Field(1000, ge=1, le=1_000_000)
+    bet: float = Field(1.0, gt=0)
+    strategy: Union[str, dict] = "basic"  # a STRATEGIES name or a hit/stand table
+    stream: bool = False  # stream one NDJSON line per hand instead of totals
+    seed: Optional[int] = None  # replays the same hands when set
+
+# Wallet owner ids: printable ASCII, so an id also fits a URL path and the
+# one-byte length in the event journal
+PLAYER_ID: Dict[str, Any] = dict(min_length=1, max_length=64, pattern=r"^[!-~]+$")
+PlayerId = Annotated[str, Field(**PLAYER_ID)]
+
+class JoinRequest(BaseModel):
+    player_id: Optional[PlayerId] = None
+
+class SocketMessage(BaseModel):
+    """A message on /ws/game, see game_socket"""
+    action: Optional[str] = None
+    id: Any = None  # echoed back in the reply
+    game_id: Optional[str] = Field(None, max_length=64)
+    player_id: Optional[PlayerId] = None
+    amount: Optional[float] = None
+    compact: bool = False
+
+class SeatState(BaseModel):
+    seat: int
+    player_id: Optional[str] = None
+    balance: float
+    bet_amount: float = 0
+    cards: List[Card] = []
+    score: int = 0
+    status: str = "waiting"  # waiting, ready, playing, stood, or the hand's outcome
+
+class TableState(BaseModel):
+    id: str
+    phase: str  # betting, playing
+    round: int  # rounds dealt so far
+    seats: List[Optional[SeatState]]
+    dealer_cards: List[Card] = []  # the upcard only while playing
+    dealer_score: int = 0
+    version: int = 0
+    created_at: datetime
+
+class SeatJoined(BaseModel):
+    seat: int
+    table: TableState
 
 class GameAction(BaseModel):
     action: str  # hit, stand, new_game
+    compact: bool = False  # reply with a delta (see game_delta) instead of the full state
+
+
+# Metrics
+# Everything is recorded without locks: each thread writes to its own shard
+# of a histogram, and shards are only summed when /metrics is scraped.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    """Prometheus-style histogram with per-thread shards"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._shards = []
+
+    def _shard(self) -> list:
+        shard = [0] * (len(self.buckets) + 1) + [0.0]  # bucket counts, +Inf, sum
+        self._local.shard = shard
+        self._shards.append(shard)
+        return shard
+
+    def observe(self, value: float):
+        shard = getattr(self._local, "shard", None) or self._shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        """Cumulative bucket counts, total count and sum"""
+        totals = [sum(column) for column in zip(*self._shards)] or [0] * (len(self.buckets) + 2)
+        cumulative, running = [], 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+
+# Operation -> seconds spent in it, for the request being handled. Only set
+# by SlowRequestMiddleware, and only read by TracedHistogram.
+REQUEST_TRACE = contextvars.ContextVar("request_trace", default=None)
+
+
+class TracedHistogram(Histogram):
+    """Histogram that also adds each value to the current REQUEST_TRACE"""
+
+    def __init__(self, buckets, name: str):
+        super().__init__(buckets)
+        self.name = name
+
+    def observe(self, value: float):
+        super().observe(value)
+        trace = REQUEST_TRACE.get()
+        if trace is not None:
+            trace[self.name] = trace.get(self.name, 0.0) + value
+
+
+class HistogramFamily:
+    """Histograms sharing a name, one per label value combination.
+
+    With `traced`, children are TracedHistograms named after their labels.
+    """
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS,
+                 traced: bool = False):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.traced = traced
+        self._children: Dict[tuple, Histogram] = {}
+
+    def labels(self, *values) -> Histogram:
+        child = self._children.get(values)
+        if child is None:
+            histogram = (TracedHistogram(self.buckets, "/".join(values)) if self.traced
+                         else Histogram(self.buckets))
+            child = self._children.setdefault(values, histogram)
+        return child
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, child in sorted(self._children.items()):
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labelnames, values))
+            cumulative, count, total = child.snapshot()
+            for le, value in zip([*map(str, child.buckets), "+Inf"], cumulative):
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{le}"}} {value}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+REQUEST_LATENCY = HistogramFamily(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"))
+# Requests slower than this are kept in slow_requests; unset turns capture off
+SLOW_REQUEST_MS = float(os.environ['SLOW_REQUEST_MS']) if os.environ.get('SLOW_REQUEST_MS') else None
+HOT_PATH_LATENCY = HistogramFamily(
+    "blackjack_operation_duration_seconds", "Time spent in hot-path operations", ("operation",),
+    traced=SLOW_REQUEST_MS is not None)
+CREATE_DECK_TIMER = HOT_PATH_LATENCY.labels("create_deck")
+DEAL_HAND_TIMER = HOT_PATH_LATENCY.labels("deal_hand")
+DEALER_PLAY_TIMER = HOT_PATH_LATENCY.labels("dealer_play")
+SHOE_REMAINING = HistogramFamily(
+    "blackjack_shoe_cards_remaining", "Cards left in the shoe when a hand is dealt",
+    buckets=(13, 26, 52, 104, 156, 208, 260, 312, 416))
+METRIC_FAMILIES = [REQUEST_LATENCY, HOT_PATH_LATENCY, SHOE_REMAINING]
+METRIC_GAUGES = []  # (name, type, help, callable returning the current value)
+
+
+def render_metrics() -> str:
+    lines = []
+    for family in METRIC_FAMILIES:
+        lines.extend(family.expose())
+    for name, kind, help, read in METRIC_GAUGES:
+        lines.extend((f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {read()}"))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Records request latency per route template (e.g. /api/game/{game_id})"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status)
+            ).observe(time.perf_counter() - start)
+
+
+# Admission control
+# Every client gets a token bucket for creating games, one for opening
+# tables and another for acting in them. A bucket refills continuously at
+# `rate` tokens a second up to `burst`; buckets are kept in LRU order and
+# the least recently used is dropped past max_clients, which is harmless
+# since an idle client's bucket would be full anyway. Separately, at most MAX_IN_FLIGHT API requests run
+# at once and the rest are shed with a 503 before reaching a handler.
+#
+# Clients are keyed by peer address, and the limits are on by default
+# (RATE_LIMIT_CREATE, RATE_LIMIT_TABLES, RATE_LIMIT_ACTIONS; 0 turns one
+# off), so one client cannot flood /api/game/new and push everyone else's
+# sessions out of the store. Behind a proxy or ingress the peer is the
+# proxy for every player, who would then all share its buckets: set
+# RATE_LIMIT_TRUST_FORWARDED=1 there to key on the address it appends to
+# X-Forwarded-For. Never set it when clients can reach the server
+# directly, as they could then pick their own key.
+class TokenBuckets:
+    """Per-client token buckets, O(1) per request"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int):
+        self.rate = rate  # tokens per second; 0 disables the limit
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, list] = OrderedDict()  # client -> [tokens, last refill]
+        self.throttled = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, client: str) -> float:
+        """Spend one of `client`'s tokens: 0 if it had one, else seconds until it will"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [self.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        self.throttled += 1
+        return (1 - bucket[0]) / self.rate
+
+
+# POSTs that start new work rather than make a move in a game. Tables have
+# a bucket of their own: every one created can push a live table out of
+# table_sessions, see close_table.
+CREATE_PATHS = frozenset({"/api/game/new", "/api/games/batch", "/api/sim"})
+TABLE_PATH = "/api/tables"
+
+
+class Admission:
+    def __init__(self, create: TokenBuckets, actions: TokenBuckets, max_in_flight: int,
+                 trust_forwarded: bool = False, tables: Optional[TokenBuckets] = None):
+        self.buckets = {"create": create, "action": actions, "table": create if tables is None else tables}
+        self.max_in_flight = max_in_flight
+        self.trust_forwarded = trust_forwarded  # key clients on X-Forwarded-For, behind one proxy
+        self.in_flight = 0
+        self.shed = 0
+
+    def client(self, scope) -> str:
+        if self.trust_forwarded:
+            forwarded = [value for name, value in scope["headers"] if name == b"x-forwarded-for"]
+            if forwarded:
+                # The proxy appends the address it saw; entries before it are the client's to choose
+                return forwarded[-1].rsplit(b",", 1)[-1].strip().decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def take(self, scope, kind: str) -> float:
+        """Rate limit one request or socket message of `kind` (create, table or action)"""
+        return self.buckets[kind].take(self.client(scope))
+
+
+def throttled(wait: float) -> dict:
+    return {"error": "Too many requests", "retry_after": math.ceil(wait)}
+
+
+admission = Admission(
+    create=TokenBuckets(
+        rate=float(os.environ.get('RATE_LIMIT_CREATE', 2)),
+        burst=float(os.environ.get('RATE_LIMIT_CREATE_BURST', 30)),
+        max_clients=int(os.environ.get('RATE_LIMIT_CLIENTS', 100_000)),
+    ),
+    actions=TokenBuckets(
+        rate=float(os.environ.get('RATE_LIMIT_ACTIONS', 20)),
+        burst=float(os.environ.get('RATE_LIMIT_ACTIONS_BURST', 100)),
+        max_clients=int(os.environ.get('RATE_LIMIT_CLIENTS', 100_000)),
+    ),
+    max_in_flight=int(os.environ.get('MAX_IN_FLIGHT', 512)),
+    trust_forwarded=os.environ.get('RATE_LIMIT_TRUST_FORWARDED', '') == '1',
+    tables=TokenBuckets(
+        rate=float(os.environ.get('RATE_LIMIT_TABLES', 0.1)),
+        burst=float(os.environ.get('RATE_LIMIT_TABLES_BURST', 10)),
+        max_clients=int(os.environ.get('RATE_LIMIT_CLIENTS', 100_000)),
+    ),
+)
+METRIC_GAUGES.extend([
+    ("blackjack_requests_in_flight", "gauge", "API requests being handled",
+     lambda: admission.in_flight),
+    ("blackjack_requests_shed_total", "counter", "API requests refused with 503 at the in-flight cap",
+     lambda: admission.shed),
+    ("blackjack_throttled_create_total", "counter", "Game creations refused by the per-client rate limit",
+     lambda: admission.buckets["create"].throttled),
+    ("blackjack_throttled_tables_total", "counter", "Table creations refused by the per-client rate limit",
+     lambda: admission.buckets["table"].throttled),
+    ("blackjack_throttled_actions_total", "counter", "Game actions refused by the per-client rate limit",
+     lambda: admission.buckets["action"].throttled),
+    ("blackjack_rate_limit_clients", "gauge", "Clients with a tracked action bucket",
+     lambda: len(admission.buckets["action"])),
+])
+
+
+class AdmissionMiddleware:
+    """Sheds API requests past the in-flight cap and rate limits POSTs per client"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            return await self.app(scope, receive, send)
+
+        if admission.in_flight >= admission.max_in_flight:
+            admission.shed += 1
+            response = JSONResponse(status_code=503, content={"error": "Server is busy", "retry_after": 1},
+                                    headers={"Retry-After": "1"})
+            return await response(scope, receive, send)
+        if scope["method"] in ("POST", "DELETE"):
+            path = scope["path"]
+            kind = "table" if path == TABLE_PATH else "create" if path in CREATE_PATHS else "action"
+            wait = admission.take(scope, kind)
+            if wait:
+                content = throttled(wait)
+                response = JSONResponse(status_code=429, content=content,
+                                        headers={"Retry-After": str(content["retry_after"])})
+                return await response(scope, receive, send)
+
+        admission.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.in_flight -= 1
+
+
+# Profiling
+# Both tools are off unless configured, and cost nothing while off: the
+# admin routes are only mounted when ADMIN_TOKEN is set, the sampler thread
+# only runs during a profile, and SlowRequestMiddleware and the traced
+# hot-path histograms are only installed when SLOW_REQUEST_MS is set.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') or None
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000
+PROFILE_MAX_SECONDS = 60
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float, thread_ids: Optional[set] = None) -> str:
+    """Sample Python stacks for `seconds` and return them in collapsed form.
+
+    Each line is "thread;outermost frame;...;innermost frame count", the
+    input format of flamegraph.pl and speedscope. Run in its own thread;
+    samples every other thread, or only those in `thread_ids`.
+    """
+    stacks: Dict[str, int] = {}
+    me = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, top in sys._current_frames().items():
+            if ident == me or (thread_ids is not None and ident not in thread_ids):
+                continue
+            labels = []
+            frame: Optional[FrameType] = top
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            stack = ";".join(reversed(labels))
+            stacks[stack] = stacks.get(stack, 0) + 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def await_stack(coro) -> List[str]:
+    """Where a suspended coroutine is waiting, outermost frame first"""
+    labels = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is not None:
+            labels.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return labels
+
+
+class SlowRequestMiddleware:
+    """Keeps the last SLOW_REQUEST_LOG_SIZE API requests slower than SLOW_REQUEST_MS.
+
+    Each entry has the time spent per hot-path operation during the request
+    (from REQUEST_TRACE) and, if it was still waiting on something when it
+    crossed the threshold, the await stack at that moment.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stack = None
+        task = asyncio.current_task()
+
+        def capture():
+            nonlocal stack
+            stack = await_stack(task.get_coro())
+
+        threshold = SLOW_REQUEST_MS / 1000
+        timer = asyncio.get_running_loop().call_later(threshold, capture)
+        trace = {}
+        token = REQUEST_TRACE.set(trace)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            timer.cancel()
+            REQUEST_TRACE.reset(token)
+            if elapsed >= threshold:
+                route = scope.get("route")
+                slow_requests.appendleft({
+                    "at": datetime.utcnow(),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route.path if route is not None else None,
+                    "status": status,
+                    "duration_ms": elapsed * 1000,
+                    "breakdown_ms": {op: seconds * 1000 for op, seconds in trace.items()},
+                    "stack": stack,
+                })
+
+
+slow_requests: Deque[dict] = deque(maxlen=int(os.environ.get('SLOW_REQUEST_LOG_SIZE', 100)))
+admin_router = APIRouter(prefix="/api/admin", route_class=StateRoute)
+_profile_lock = asyncio.Lock()
+
+
+def admin_denied(token: Optional[str]) -> Optional[JSONResponse]:
+    # As bytes: compare_digest raises TypeError on a str that is not ASCII
+    if token is None or ADMIN_TOKEN is None:
+        return JSONResponse(status_code=403, content={"error": "Admin token required"})
+    if not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return JSONResponse(status_code=403, content={"error": "Admin token required"})
+    return None
+
+
+@admin_router.post("/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS), all_threads: bool = False,
+                  x_admin_token: Annotated[Optional[str], Header()] = None):
+    """Sample stacks for `seconds` and download them as collapsed stacks.
+
+    Only the event loop thread is sampled unless `all_threads` is set.
+    """
+    denied = admin_denied(x_admin_token)
+    if denied:
+        return denied
+    if _profile_lock.locked():
+        return JSONResponse(status_code=409, content={"error": "A profile is already running"})
+    async with _profile_lock:
+        thread_ids = None if all_threads else {threading.get_ident()}
+        stacks = await asyncio.to_thread(sample_stacks, seconds, PROFILE_INTERVAL, thread_ids)
+    filename = f"profile-{datetime.utcnow():%Y%m%dT%H%M%S}.folded"
+    return PlainTextResponse(stacks, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@admin_router.get("/slow-requests")
+async def get_slow_requests(x_admin_token: Annotated[Optional[str], Header()] = None):
+    """The slowest-recent API requests, newest first"""
+    denied = admin_denied(x_admin_token)
+    if denied:
+        return denied
+    return {"threshold_ms": SLOW_REQUEST_MS, "requests": list(slow_requests)}
 
 
 # Game Logic Functions
-def create_deck():
-    """Create a standard 52-card deck"""
-    suits = ['hearts', 'diamonds', 'clubs', 'spades']
-    ranks = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K']
-    deck = []
-    
-    for suit in suits:
-        for rank in ranks:
-            if rank == 'A':
-                value = 11  # Ace starts as 11, will be adjusted if needed
-            elif rank in ['J', 'Q', 'K']:
-                value = 10
-            else:
-                value = int(rank)
-            
-            deck.append(Card(
-                suit=suit,
-                rank=rank,
-                value=value,
-                display=rank
-            ))
-    
-    random.shuffle(deck)
+SUITS = ['hearts', 'diamonds', 'clubs', 'spades']
+RANKS = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K']
+
+
+def _rank_value(rank: str) -> int:
+    if rank == 'A':
+        return 11  # Ace starts as 11, will be adjusted if needed
+    if rank in ['J', 'Q', 'K']:
+        return 10
+    return int(rank)
+
+
+# Canonical 52-card table, built once and shared by every game. Card models
+# are frozen so a deck is just a shuffled permutation of indices into it.
+CARDS = tuple(
+    Card(suit=suit, rank=rank, value=_rank_value(rank), display=rank)
+    for suit in SUITS
+    for rank in RANKS
+)
+CARD_INDICES = tuple(range(len(CARDS)))
+CARD_INDEX = {(card.suit, card.rank): i for i, card in enumerate(CARDS)}
+# Short codes used in compact responses: rank + suit initial, e.g. "QS", "10H"
+CARD_CODES = tuple(card.rank + card.suit[0].upper() for card in CARDS)
+# Card id -> its JSON, spliced into responses as is (see StateResponse)
+CARD_FRAGMENTS = {id(card): orjson.Fragment(orjson.dumps(card.__dict__)) for card in CARDS}
+
+
+def card_code(card: Card) -> str:
+    return CARD_CODES[CARD_INDEX[card.suit, card.rank]]
+
+
+# Shuffling
+# Every shoe is a permutation of positions in `decks` ordered decks, made by
+# a Shuffler from a 128-bit seed. The shuffler's name and the seed are kept
+# with the shoe, and are all it takes to deal the same shoe again.
+def new_shoe_seed() -> int:
+    return secrets.randbits(128)
+
+
+class Shuffler(ABC):
+    """Turns seeds into permutations of range(size)"""
+
+    @abstractmethod
+    def shuffle(self, seed: int, size: int) -> List[int]:
+        ...
+
+    def shuffle_many(self, count: int, size: int) -> List[tuple]:
+        """`count` (seed, permutation) pairs from fresh seeds"""
+        return [(seed, self.shuffle(seed, size)) for seed in (new_shoe_seed() for _ in range(count))]
+
+
+class MersenneShuffler(Shuffler):
+    """random.Random seeded with the seed, as shoes were first shuffled"""
+
+    def shuffle(self, seed, size):
+        order = list(range(size))
+        random.Random(seed).shuffle(order)
+        return order
+
+
+class CryptoShuffler(Shuffler):
+    """Fisher-Yates driven by the SHAKE-256 output stream of the seed.
+
+    Each swap index is a 64-bit output reduced modulo its range, so the
+    bias is below 2**-55 for any shoe size used here.
+    """
+
+    def shuffle(self, seed, size):
+        stream = hashlib.shake_256(seed.to_bytes(16, "little")).digest(8 * (size - 1))
+        bounds = np.arange(size, 1, -1, dtype=np.uint64)
+        swaps = (np.frombuffer(stream, dtype="<u8") % bounds).tolist()
+        order = list(range(size))
+        for i, j in zip(range(size - 1, 0, -1), swaps):
+            order[i], order[j] = order[j], order[i]
+        return order
+
+
+class FastShuffler(Shuffler):
+    """NumPy PCG64 permutations, argsorted many at a time.
+
+    A seed is a 112-bit PCG64 key and a 16-bit row: the shoe is the argsort
+    of `size` uniforms drawn after skipping `row` shoes' worth of them.
+    `shuffle_many` gives every shoe its own random key and row 0, so a seed
+    disclosed for one shoe says nothing about the others dealt from the
+    pool; only the argsort is batched. Non-zero rows are from shoes that
+    once shared a key per batch, and still replay.
+    """
+
+    ROW_BITS = 16
+
+    def shuffle(self, seed, size):
+        bit_generator = np.random.PCG64(seed >> self.ROW_BITS)
+        bit_generator.advance((seed & ((1 << self.ROW_BITS) - 1)) * size)
+        return np.random.Generator(bit_generator).random(size).argsort(kind="stable").tolist()
+
+    def shuffle_many(self, count, size):
+        keys = [secrets.randbits(128 - self.ROW_BITS) for _ in range(count)]
+        if not keys:
+            return []
+        uniforms = np.stack([np.random.default_rng(key).random(size) for key in keys])
+        rows = uniforms.argsort(axis=1, kind="stable").tolist()
+        return [(key << self.ROW_BITS, order) for key, order in zip(keys, rows)]
+
+
+SHUFFLERS = {"mt": MersenneShuffler(), "crypto": CryptoShuffler(), "fast": FastShuffler()}
+SHUFFLER_NAMES = tuple(SHUFFLERS)  # position is the id used in the event journal
+SHUFFLE_RNG = os.environ.get('SHUFFLE_RNG', 'fast')
+if SHUFFLE_RNG not in SHUFFLERS:
+    raise ValueError(f"Unknown SHUFFLE_RNG: {SHUFFLE_RNG}")
+
+
+def shuffled_indices(decks: int = 1, seed: Optional[int] = None, rng: str = SHUFFLE_RNG) -> List[int]:
+    """Return a shuffled permutation of card indices into CARDS.
+
+    The same `rng` and `seed` always give the same order.
+    """
+    size = len(CARDS) * decks
+    if seed is None:
+        seed = new_shoe_seed()
+    return [position % len(CARDS) for position in SHUFFLERS[rng].shuffle(seed, size)]
+
+
+def create_deck(decks: int = 1, seed: Optional[int] = None, rng: str = SHUFFLE_RNG):
+    """Create a standard 52-card deck, or a shoe of several decks"""
+    start = time.perf_counter()
+    deck = [CARDS[i] for i in shuffled_indices(decks, seed, rng)]
+    CREATE_DECK_TIMER.observe(time.perf_counter() - start)
     return deck
 
+
+def create_shoes(count: int, decks: int, rng: str = SHUFFLE_RNG) -> List[tuple]:
+    """`count` (seed, shoe) pairs, shuffled in one batch where `rng` supports it.
+
+    Shoes are bytearrays of indices into CARDS, as GameSession keeps them.
+    """
+    if not count:
+        return []  # a full shoe pool asks for none
+    start = time.perf_counter()
+    shoes = [
+        (seed, bytearray(position % len(CARDS) for position in order))
+        for seed, order in SHUFFLERS[rng].shuffle_many(count, len(CARDS) * decks)
+    ]
+    CREATE_DECK_TIMER.observe((time.perf_counter() - start) / count)
+    return shoes
+
+
+def shoe_stream(seed: Optional[int], decks: int, batch: int = 64):
+    """Endless shoes from one PCG64 stream, for hands that are never replayed
+    one by one (simulations, batch play); the whole stream repeats with `seed`"""
+    rng = np.random.default_rng(seed)
+    size = len(CARDS) * decks
+    while True:
+        for order in (rng.random((batch, size)).argsort(axis=1, kind="stable") % len(CARDS)).tolist():
+            yield [CARDS[i] for i in order]
+
+
+# Shoe
+SHOE_DECKS = min(8, max(1, int(os.environ.get('SHOE_DECKS', 1))))
+SHOE_PENETRATION = float(os.environ.get('SHOE_PENETRATION', 0.75))  # dealt fraction at the cut card
+
+
+@functools.lru_cache(maxsize=None)
+def max_cards_per_hand(decks: int) -> int:
+    """Most cards a single hand can take from a shoe of `decks` decks.
+
+    A hand stops drawing once it is over 21 counting aces as 1, so the bound
+    is how many of the smallest cards it takes to pass 21.
+    """
+    values = sorted([1 if card.value == 11 else card.value for card in CARDS] * decks)
+    total = 0
+    for count, value in enumerate(values, 1):
+        total += value
+        if total > 21:
+            return count
+    return len(values)
+
+
+@functools.lru_cache(maxsize=None)
+def max_cards_per_round(decks: int, hands: int) -> int:
+    """Most cards `hands` hands can take between them from `decks` decks.
+
+    Besides `hands` times the single-hand bound: a hand's last card comes
+    at a hard total of 21 or less and adds at most 10, so together the hands
+    hold at most 31 per hand, and no more cards than the smallest ones that
+    fit under that.
+    """
+    values = sorted([1 if card.value == 11 else card.value for card in CARDS] * decks)
+    budget = 31 * hands
+    shared = len(values)
+    for count, value in enumerate(values):
+        budget -= value
+        if budget < 0:
+            shared = count
+            break
+    return min(hands * max_cards_per_hand(decks), shared)
+
+
+def shoe_cut_point(shoe_size: int, hands: int = 2) -> int:
+    """Reshuffle before a round once fewer than this many cards remain.
+
+    Never less than what `hands` hands (the dealer's included) can use
+    between them, so a shoe cannot run out in the middle of a round.
+    """
+    decks = shoe_size // len(CARDS)
+    return max(round(shoe_size * (1 - SHOE_PENETRATION)), max_cards_per_round(decks, hands))
+
+
+class ShoePool:
+    """A few shuffled shoes kept ready so dealing never waits on a shuffle.
+
+    A background task refills the pool in a worker thread whenever a shoe
+    is taken. If the pool is ever empty, `take` refills it inline and counts
+    a miss. Every shoe is shuffled by `rng` from its own seed, returned with it.
+    """
+
+    def __init__(self, decks: int, size: int, rng: str = SHUFFLE_RNG):
+        self.decks = decks
+        self.size = size
+        self.rng = rng
+        self._ready: Deque[Tuple[int, bytearray]] = deque()
+        self._taken = asyncio.Event()
+        self.misses = 0
+
+    def take(self) -> tuple:
+        """A (seed, shoe) pair"""
+        if not self._ready:
+            self.misses += 1
+            self.fill()
+        self._taken.set()
+        return self._ready.popleft()
+
+    def fill(self):
+        self._ready.extend(create_shoes(self.size - len(self._ready), self.decks, self.rng))
+
+    async def run(self):
+        while True:
+            while len(self._ready) < self.size:
+                await asyncio.to_thread(self.fill)
+            self._taken.clear()
+            await self._taken.wait()
+
+    def stats(self) -> dict:
+        return {"decks": self.decks, "rng": self.rng, "ready": len(self._ready), "misses": self.misses}
+
+
+shoe_pool = ShoePool(SHOE_DECKS, size=int(os.environ.get('SHOE_POOL_SIZE', 8)))
+
 def calculate_score(cards: List[Card]) -> int:
     """Calculate the best possible score for a hand"""
     score = 0
@@ -110,122 +1177,2809 @@ def determine_winner(player_score: int, dealer_score: int) -> str:
     else:
         return "push"
 
+def dealer_play(dealer_cards: List[Card], deck: List[Card]) -> HandTotals:
+    """Draw for the dealer until 17 or more and return the final totals"""
+    totals = HandTotals.of(dealer_cards)
+    
+    # Dealer hits on 16 and below
+    while totals.best < 17 and deck:
+        card = deck.pop()
+        dealer_cards.append(card)
+        totals.add(card)
+    
+    return totals
 
-# Game state storage (in production, use database)
-game_sessions = {}
 
+def dealer_play_codes(dealer_cards: bytearray, deck: bytearray) -> HandTotals:
+    """dealer_play for hands and shoes held as card indices"""
+    totals = HandTotals.of(CARDS[i] for i in dealer_cards)
+    while totals.best < 17 and deck:
+        code = deck.pop()
+        dealer_cards.append(code)
+        totals.add(CARDS[code])
+    return totals
 
-# API Routes
-@api_router.get("/")
-async def root():
-    return {"message": "Blackjack API Ready"}
 
-@api_router.post("/game/new")
-async def new_game():
-    """Start a new blackjack game"""
-    game_id = str(uuid.uuid4())
-    deck = create_deck()
-    
-    # Deal initial cards
-    player_cards = [deck.pop(), deck.pop()]
-    dealer_cards = [deck.pop(), deck.pop()]
-    
-    player_score = calculate_score(player_cards)
-    dealer_score = calculate_score([dealer_cards[0]])  # Only show first dealer card
-    
-    game_state = GameState(
-        id=game_id,
-        player_cards=player_cards,
-        dealer_cards=dealer_cards,
-        player_score=player_score,
-        dealer_score=dealer_score,
-        game_status="playing"
-    )
-    
-    # Store game state and remaining deck
-    game_sessions[game_id] = {
-        "game_state": game_state,
-        "deck": deck
-    }
-    
-    return game_state
+# Simulation
+# A hit/stand strategy is a boolean table indexed [soft, total, upcard],
+# where soft is 1 when an ace still counts as 11 and upcard is the dealer's
+# first card value (2-11, ace = 11). As JSON it is written per total as a
+# string of H/S for upcards 2, 3, ..., 10, A, e.g. {"hard": {"12": "HHSSSHHHHH"}}.
+UPCARDS = range(2, 12)
+PAYOFFS = {"player_win": 1, "dealer_bust": 1, "push": 0, "dealer_win": -1, "player_bust": -1}
+CARD_VALUES = np.array([card.value for card in CARDS], dtype=np.int16)
 
-@api_router.post("/game/{game_id}/bet")
-async def place_bet(game_id: str, bet_request: BetRequest):
-    """Place a bet for the game"""
-    if game_id not in game_sessions:
-        return {"error": "Game not found"}
-    
-    game_session = game_sessions[game_id]
-    game_state = game_session["game_state"]
-    
-    if bet_request.amount > game_state.balance:
-        return {"error": "Insufficient balance"}
-    
-    game_state.bet_amount = bet_request.amount
-    game_state.balance -= bet_request.amount
-    
-    return game_state
 
-@api_router.post("/game/{game_id}/action")
-async def game_action(game_id: str, action: GameAction):
-    """Perform a game action (hit, stand)"""
-    if game_id not in game_sessions:
-        return {"error": "Game not found"}
-    
-    game_session = game_sessions[game_id]
-    game_state = game_session["game_state"]
-    deck = game_session["deck"]
-    
-    if action.action == "hit":
-        # Deal card to player
-        if deck:
-            new_card = deck.pop()
-            game_state.player_cards.append(new_card)
-            game_state.player_score = calculate_score(game_state.player_cards)
-            
-            if game_state.player_score > 21:
-                game_state.game_status = "player_bust"
-            
-    elif action.action == "stand":
-        # Dealer plays
-        full_dealer_score = calculate_score(game_state.dealer_cards)
-        
-        # Dealer hits on 16 and below
-        while full_dealer_score < 17 and deck:
-            new_card = deck.pop()
-            game_state.dealer_cards.append(new_card)
-            full_dealer_score = calculate_score(game_state.dealer_cards)
-        
-        game_state.dealer_score = full_dealer_score
-        
-        if full_dealer_score > 21:
-            game_state.game_status = "dealer_bust"
-            # Player wins
-            game_state.balance += game_state.bet_amount * 2
-        else:
-            result = determine_winner(game_state.player_score, full_dealer_score)
-            game_state.game_status = result
-            
-            if result == "player_win":
-                game_state.balance += game_state.bet_amount * 2
-            elif result == "push":
-                game_state.balance += game_state.bet_amount
-    
-    return game_state
+# Built-in strategies, by name. "basic" is hit/stand basic strategy for
+# these rules (no doubling or splitting, dealer stands on soft 17), added
+# once it is computed in the basic strategy section below.
+STRATEGIES: Dict[str, Any] = {
+    "dealer": {},
+}
 
-@api_router.get("/game/{game_id}")
-async def get_game_state(game_id: str):
-    """Get current game state"""
-    if game_id not in game_sessions:
-        return {"error": "Game not found"}
-    
-    return game_sessions[game_id]["game_state"]
 
+def parse_strategy(spec=None) -> np.ndarray:
+    """Build a hit table from a JSON spec or a STRATEGIES name.
 
-# Include the router in the main app
+    Unlisted totals hit below 17, like the dealer.
+    """
+    if isinstance(spec, str):
+        if spec not in STRATEGIES:
+            raise ValueError(f"Unknown strategy {spec!r}, expected one of {', '.join(STRATEGIES)}")
+        spec = STRATEGIES[spec]
+    table = np.zeros((2, 32, 12), dtype=bool)
+    table[:, :17, :] = True
+    for soft, key in enumerate(("hard", "soft")):
+        for total, actions in (spec or {}).get(key, {}).items():
+            total = int(total)
+            if not 2 <= total <= 21 or len(actions) != len(UPCARDS):
+                raise ValueError(f"Invalid {key} strategy row {total}: {actions!r}")
+            for upcard, action in zip(UPCARDS, actions.upper()):
+                if action not in "HS":
+                    raise ValueError(f"Invalid action {action!r} in {key} row {total}")
+                table[soft, total, upcard] = action == "H"
+    return table
+
+
+def is_soft(cards: List[Card], score: int) -> bool:
+    """Whether `score` (from calculate_score) counts an ace as 11"""
+    return score != sum(1 if card.rank == 'A' else card.value for card in cards)
+
+
+class HandResult(NamedTuple):
+    status: str  # final game_status
+    player_cards: List[Card]
+    dealer_cards: List[Card]
+    player_score: int
+    dealer_score: int
+
+
+def play_hand(deck: List[Card], hit_table: np.ndarray) -> HandResult:
+    """Play one hand from `deck` the way new_game and game_action deal it.
+
+    The player hits while the strategy says so, then the dealer plays as in
+    the stand branch.
+    """
+    player_cards = [deck.pop(), deck.pop()]
+    dealer_cards = [deck.pop(), deck.pop()]
+    upcard = dealer_cards[0].value
+    player_score = calculate_score(player_cards)
+    while player_score <= 21 and hit_table[int(is_soft(player_cards, player_score)), player_score, upcard]:
+        player_cards.append(deck.pop())
+        player_score = calculate_score(player_cards)
+    if player_score > 21:
+        return HandResult("player_bust", player_cards, dealer_cards, player_score,
+                          calculate_score(dealer_cards))
+    dealer_score = dealer_play(dealer_cards, deck).best
+    status = "dealer_bust" if dealer_score > 21 else determine_winner(player_score, dealer_score)
+    return HandResult(status, player_cards, dealer_cards, player_score, dealer_score)
+
+
+def play_chunk(hands: int, hit_table: np.ndarray, bet: float, decks: int,
+               detail: bool, seed: Optional[int] = None) -> dict:
+    """Play `hands` hands from one shoe, reshuffling at the cut card.
+
+    Returns outcome counts and, with `detail`, one record per hand. The
+    same `seed` plays the same hands.
+    """
+    counts = dict.fromkeys(PAYOFFS, 0)
+    records = []
+    shoes = shoe_stream(seed, decks)
+    deck = next(shoes)
+    shoe_size = len(deck)
+    cut_point = shoe_cut_point(shoe_size)
+    for _ in range(hands):
+        if len(deck) < cut_point:
+            deck = next(shoes)
+        result = play_hand(deck, hit_table)
+        counts[result.status] += 1
+        if detail:
+            records.append({
+                "player_cards": [card_code(card) for card in result.player_cards],
+                "dealer_cards": [card_code(card) for card in result.dealer_cards],
+                "player_score": result.player_score,
+                "dealer_score": result.dealer_score,
+                "game_status": result.status,
+                "net": bet * PAYOFFS[result.status],
+            })
+    return {"counts": counts, "hands": records}
+
+
+def _add_card(score: np.ndarray, soft: np.ndarray, value: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Array version of adding one card under calculate_score's ace rule"""
+    score = score + value
+    soft = soft + (value == 11)
+    for _ in range(2):  # one card can force at most two aces down to 1
+        adjust = (score > 21) & (soft > 0)
+        score = score - 10 * adjust
+        soft = soft - adjust
+    return score, soft
+
+
+def simulate_batch(cards: np.ndarray, hit_table: np.ndarray) -> np.ndarray:
+    """Play a batch of hands at once and return each hand's PAYOFFS key index.
+
+    `cards` holds card values in deal order, one row per hand: what
+    successive deck.pop() calls would return. Mirrors play_hand exactly.
+    """
+    n = len(cards)
+    zeros = np.zeros(n, dtype=np.int16)
+    player, player_soft = _add_card(*_add_card(zeros, zeros, cards[:, 0]), cards[:, 1])
+    upcard = cards[:, 2]
+    dealer, dealer_soft = _add_card(*_add_card(zeros, zeros, upcard), cards[:, 3])
+    position = np.full(n, 4)
+
+    hitting = (player <= 21) & hit_table[(player_soft > 0).astype(np.intp), player, upcard]
+    while hitting.any():
+        rows = np.flatnonzero(hitting)
+        player[rows], player_soft[rows] = _add_card(
+            player[rows], player_soft[rows], cards[rows, position[rows]])
+        position[rows] += 1
+        hitting[rows] = (player[rows] <= 21) & hit_table[
+            (player_soft[rows] > 0).astype(np.intp), player[rows], upcard[rows]]
+
+    player_bust = player > 21
+    drawing = ~player_bust & (dealer < 17)
+    while drawing.any():
+        rows = np.flatnonzero(drawing)
+        dealer[rows], dealer_soft[rows] = _add_card(
+            dealer[rows], dealer_soft[rows], cards[rows, position[rows]])
+        position[rows] += 1
+        drawing[rows] = dealer[rows] < 17
+
+    outcomes = list(PAYOFFS)
+    result = np.where(player > dealer, outcomes.index("player_win"),
+                      np.where(player < dealer, outcomes.index("dealer_win"), outcomes.index("push")))
+    result[dealer > 21] = outcomes.index("dealer_bust")
+    result[player_bust] = outcomes.index("player_bust")
+    return result
+
+
+def run_simulation(hands: int, strategy: Union[str, dict, None] = None, seed: Optional[int] = None,
+                   decks: int = 1, batch_size: int = 100_000) -> Dict[str, int]:
+    """Simulate `hands` hands, each from a freshly shuffled shoe, and return outcome counts"""
+    hit_table = parse_strategy(strategy)
+    rng = np.random.default_rng(seed)
+    counts = np.zeros(len(PAYOFFS), dtype=np.int64)
+    for start in range(0, hands, batch_size):
+        n = min(batch_size, hands - start)
+        cards = rng.permuted(np.broadcast_to(np.tile(CARD_VALUES, decks), (n, len(CARDS) * decks)), axis=1)
+        counts += np.bincount(simulate_batch(cards, hit_table), minlength=len(PAYOFFS))
+    return dict(zip(PAYOFFS, counts.tolist()))
+
+
+def summarize_simulation(counts: Dict[str, int]) -> dict:
+    """EV (per unit bet), variance and outcome rates from outcome counts"""
+    hands = sum(counts.values())
+    wins = counts["player_win"] + counts["dealer_bust"]
+    losses = counts["dealer_win"] + counts["player_bust"]
+    ev = (wins - losses) / hands
+    return {
+        "hands": hands,
+        "ev": ev,
+        "house_edge": -ev,
+        "variance": (wins + losses) / hands - ev * ev,
+        "win_rate": wins / hands,
+        "loss_rate": losses / hands,
+        "push_rate": counts["push"] / hands,
+        "player_bust_rate": counts["player_bust"] / hands,
+        "dealer_bust_rate": counts["dealer_bust"] / hands,
+    }
+
+
+SIM_WORKERS = int(os.environ.get('SIM_WORKERS', os.cpu_count() or 1))
+_process_pool = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Shared pool for CPU-bound work that must not run on the event loop.
+
+    Workers are not forked from this process, whose threads (the shoe
+    refills, asyncio.to_thread) could hold a lock at the time of the fork
+    and leave it locked in the child for good.
+    """
+    global _process_pool
+    if _process_pool is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _process_pool = ProcessPoolExecutor(SIM_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _process_pool
+
+
+async def simulate_in_pool(hands: int, strategy: Union[str, dict, None] = None,
+                           seed: Optional[int] = None, decks: int = 1) -> dict:
+    """Split a simulation across the process pool and merge the counts"""
+    pool = get_process_pool()
+    parts = min(SIM_WORKERS, max(1, hands // 100_000))
+    seeds = np.random.SeedSequence(seed).generate_state(parts).tolist()
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, run_simulation, hands // parts + (i < hands % parts),
+                             strategy, seeds[i], decks)
+        for i in range(parts)
+    ))
+    counts = {outcome: sum(r[outcome] for r in results) for outcome in PAYOFFS}
+    return summarize_simulation(counts)
+
+
+# Exact odds
+# Cards are grouped by value (A, 2-9, ten-valued) and the unseen cards are
+# described by a tuple of counts per group. Since every order of the unseen
+# cards is equally likely, probabilities depend only on that composition,
+# which is what the recursions below are memoized on.
+RANK_VALUES = (11, 2, 3, 4, 5, 6, 7, 8, 9, 10)
+DEALER_TOTALS = range(17, 22)
+
+
+def rank_counts(cards: Iterable[Card]) -> tuple:
+    counts = [0] * len(RANK_VALUES)
+    for card in cards:
+        counts[RANK_VALUES.index(card.value)] += 1
+    return tuple(counts)
+
+
+# Card index -> position of its value in RANK_VALUES, as a bytes.translate table
+RANK_GROUPS = bytes(RANK_VALUES.index(card.value) for card in CARDS).ljust(256, b"\0")
+
+
+def rank_counts_of_codes(codes: Union[bytes, bytearray]) -> tuple:
+    """rank_counts for card indices, counted in C"""
+    grouped = bytes(codes).translate(RANK_GROUPS)
+    return tuple(grouped.count(group) for group in range(len(RANK_VALUES)))
+
+
+def _add_value(score: int, soft: int, value: int):
+    """Add one card value to a (score, soft aces) state like calculate_score"""
+    score += value
+    soft += value == 11
+    while score > 21 and soft:
+        score -= 10
+        soft -= 1
+    return score, soft
+
+
+def _draws(counts: tuple):
+    """Yield (probability, value, remaining counts) for each possible next card"""
+    total = sum(counts)
+    for i, count in enumerate(counts):
+        if count:
+            yield count / total, RANK_VALUES[i], counts[:i] + (count - 1,) + counts[i + 1:]
+
+
+def _stand_ev(player_score: int, dealer_final: dict) -> float:
+    return sum(p * PAYOFFS["dealer_bust" if total > 21 else determine_winner(player_score, total)]
+               for total, p in dealer_final.items())
+
+
+# Finished results, for repeated queries about the same hand
+ODDS_CACHE_SIZE = int(os.environ.get('ODDS_CACHE_SIZE', 4096))
+
+
+@functools.lru_cache(maxsize=ODDS_CACHE_SIZE)
+def exact_odds(player_score: int, soft: int, upcard: int, counts: tuple) -> dict:
+    """The dealer's final score distribution and the EVs of standing and
+    hitting, for a hand against `upcard` with `counts` unseen.
+
+    The recursions below are memoized on the composition, which changes
+    with every card dealt, so hands hardly share entries; their tables only
+    live for this call instead of growing by up to ~70k entries per hand
+    from a 6-deck shoe.
+    """
+    @functools.cache
+    def dealer_final_distribution(score: int, soft: int, counts: tuple) -> dict:
+        """Probabilities of the dealer's final score, keyed by score (22 = bust).
+
+        Follows dealer_play: draw while below 17 and cards remain.
+        """
+        if score > 21:
+            return {22: 1.0}
+        if score >= 17 or not any(counts):
+            return {score: 1.0}
+        result: Dict[int, float] = {}
+        for p, value, rest in _draws(counts):
+            for total, q in dealer_final_distribution(*_add_value(score, soft, value), rest).items():
+                result[total] = result.get(total, 0.0) + p * q
+        return result
+
+    @functools.cache
+    def stand_ev(player_score: int, counts: tuple) -> float:
+        """EV per unit bet of standing now, with the hole card still unseen"""
+        return _stand_ev(player_score, dealer_final_distribution(*_add_value(0, 0, upcard), counts))
+
+    @functools.cache
+    def hit_ev(player_score: int, soft: int, counts: tuple) -> float:
+        """EV per unit bet of hitting once, then playing on optimally"""
+        ev = 0.0
+        for p, value, rest in _draws(counts):
+            score, new_soft = _add_value(player_score, soft, value)
+            if score > 21:
+                ev -= p
+            else:
+                ev += p * max(stand_ev(score, rest), hit_ev(score, new_soft, rest))
+        return ev
+
+    dealer_final = dealer_final_distribution(*_add_value(0, 0, upcard), counts)
+    return {
+        "dealer_final": dealer_final,
+        "ev_stand": _stand_ev(player_score, dealer_final),
+        "ev_hit": hit_ev(player_score, soft, counts),
+    }
+
+
+def hand_odds(game_session: "GameSession") -> dict:
+    """Exact odds for a live hand, from the player's point of view.
+
+    The dealer's hole card is treated as unseen, so it is counted in the
+    composition along with the remaining deck.
+    """
+    unseen = rank_counts_of_codes(game_session.deck + game_session.dealer_cards[1:])
+    player_score = game_session.player_score
+    soft = int(game_session.player_totals.soft is not None)
+    upcard = CARDS[game_session.dealer_cards[0]].value
+
+    odds = exact_odds(player_score, soft, upcard, unseen)
+    dealer_final = odds["dealer_final"]
+    return {
+        "id": game_session.id,
+        "cards_unseen": sum(unseen),
+        "player_score": player_score,
+        "bust_probability": sum(p for p, value, _ in _draws(unseen)
+                                if _add_value(player_score, soft, value)[0] > 21),
+        "dealer_final": {
+            **{str(total): p for total, p in sorted(dealer_final.items()) if total < 17},
+            **{str(total): dealer_final.get(total, 0.0) for total in DEALER_TOTALS},
+            "bust": dealer_final.get(22, 0.0),
+        },
+        "ev_stand": odds["ev_stand"],
+        "ev_hit": odds["ev_hit"],
+        "best_action": "hit" if odds["ev_hit"] > odds["ev_stand"] else "stand",
+    }
+
+
+# Basic strategy
+# The best hit/stand decision for every hand against every upcard, worked
+# out once at import from the same rules as the exact odds above. Cards are
+# drawn at the shoe's full-composition frequencies throughout (the usual
+# infinite-deck approximation), so the answer does not depend on the cards
+# already dealt and a decision is one lookup into a (2, 32, 12) array laid
+# out like parse_strategy's hit tables.
+def compute_basic_strategy() -> np.ndarray:
+    """Hit table maximizing each hand's EV under the house rules"""
+    counts = rank_counts(CARDS)
+    draws = [(count / len(CARDS), value) for count, value in zip(counts, RANK_VALUES)]
+
+    @functools.cache
+    def dealer_final(score: int, soft: int) -> dict:
+        if score >= 17:
+            return {min(score, 22): 1.0}
+        result: Dict[int, float] = {}
+        for p, value in draws:
+            for total, q in dealer_final(*_add_value(score, soft, value)).items():
+                result[total] = result.get(total, 0.0) + p * q
+        return result
+
+    table = np.zeros((2, 32, 12), dtype=bool)
+    for upcard in UPCARDS:
+        final = dealer_final(*_add_value(0, 0, upcard))
+
+        @functools.cache
+        def best_ev(score: int, soft: int) -> float:
+            ev_stand = _stand_ev(score, final)
+            ev_hit = 0.0
+            for p, value in draws:
+                next_score, next_soft = _add_value(score, soft, value)
+                ev_hit += -p if next_score > 21 else p * best_ev(next_score, next_soft)
+            table[soft, score, upcard] = ev_hit > ev_stand
+            return max(ev_stand, ev_hit)
+
+        for score in range(4, 22):
+            best_ev(score, 0)
+        for score in range(12, 22):
+            best_ev(score, 1)
+    return table
+
+
+def strategy_spec(table: np.ndarray) -> dict:
+    """The JSON form of a hit table (see parse_strategy), every row spelled out"""
+    return {
+        key: {str(total): "".join("H" if table[soft, total, upcard] else "S" for upcard in UPCARDS)
+              for total in (range(4, 22) if key == "hard" else range(12, 22))}
+        for soft, key in enumerate(("hard", "soft"))
+    }
+
+
+BASIC_STRATEGY = compute_basic_strategy()
+STRATEGIES["basic"] = strategy_spec(BASIC_STRATEGY)
+
+
+def basic_action(totals: HandTotals, upcard: int) -> str:
+    return "hit" if BASIC_STRATEGY[int(totals.soft is not None), totals.best, upcard] else "stand"
+
+
+# Game state storage (in production, use database)
+class SessionStore:
+    """In-process game session store with LRU eviction and an idle TTL.
+
+    Entries are kept in access order, so the least recently used (and
+    therefore the first to expire) session is always at the front. Lookups,
+    inserts and evictions are O(1); a sweep only touches expired entries.
+    `on_evict` is called with every session evicted or expired, though not
+    with those removed by `pop` or `clear`.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, sweep_interval: float,
+                 on_evict: Optional[Callable[[Any], None]] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self.on_evict = on_evict
+        self._sessions: OrderedDict[str, list] = OrderedDict()  # game_id -> [session, last_access]
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, game_id):
+        return self.get(game_id) is not None
+
+    def __getitem__(self, game_id):
+        session = self.get(game_id)
+        if session is None:
+            raise KeyError(game_id)
+        return session
+
+    def __setitem__(self, game_id, session):
+        self._sessions[game_id] = [session, time.monotonic()]
+        self._sessions.move_to_end(game_id)
+        while len(self._sessions) > self.max_size:
+            _, entry = self._sessions.popitem(last=False)
+            self.evicted += 1
+            if self.on_evict is not None:
+                self.on_evict(entry[0])
+
+    def get(self, game_id, default=None):
+        entry = self._sessions.get(game_id)
+        if entry is None:
+            return default
+        now = time.monotonic()
+        if now - entry[1] > self.ttl_seconds:
+            del self._sessions[game_id]
+            self.expired += 1
+            if self.on_evict is not None:
+                self.on_evict(entry[0])
+            return default
+        entry[1] = now
+        self._sessions.move_to_end(game_id)
+        return entry[0]
+
+    def pop(self, game_id, default=None):
+        entry = self._sessions.pop(game_id, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self._sessions.clear()
+
+    def sweep(self, limit: Optional[int] = None) -> int:
+        """Drop expired sessions from the front of the LRU order"""
+        deadline = time.monotonic() - self.ttl_seconds
+        removed = 0
+        while self._sessions and (limit is None or removed < limit):
+            game_id, entry = next(iter(self._sessions.items()))
+            if entry[1] >= deadline:
+                break
+            del self._sessions[game_id]
+            removed += 1
+            if self.on_evict is not None:
+                self.on_evict(entry[0])
+        self.expired += removed
+        return removed
+
+    async def run_sweeper(self, batch_size: int = 1000):
+        """Periodically sweep, yielding to the event loop between batches"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            while self.sweep(limit=batch_size) == batch_size:
+                await asyncio.sleep(0)
+
+    def stats(self) -> dict:
+        return {
+            "live": len(self._sessions),
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+game_sessions = SessionStore(
+    max_size=int(os.environ.get('SESSION_MAX_SIZE', 100_000)),
+    ttl_seconds=float(os.environ.get('SESSION_TTL_SECONDS', 3600)),
+    sweep_interval=float(os.environ.get('SESSION_SWEEP_INTERVAL', 30)),
+)
+
+
+def _card_indices(cards: List[Card]) -> List[int]:
+    return [CARD_INDEX[card.suit, card.rank] for card in cards]
+
+
+def session_to_document(game_id: str, session: GameSession) -> dict:
+    """Serialize a session for MongoDB, storing cards as indices into CARDS"""
+    return {
+        "_id": game_id,
+        "player_id": session.player_id,
+        "hand": session.hand,
+        "player_cards": list(session.player_cards),
+        "dealer_cards": list(session.dealer_cards),
+        "player_score": session.player_score,
+        "dealer_score": session.dealer_score,
+        "player_totals": {"hard": session.player_totals.hard, "soft": session.player_totals.soft},
+        "dealer_totals": {"hard": session.dealer_totals.hard, "soft": session.dealer_totals.soft},
+        "game_status": session.game_status,
+        "bet_amount": session.bet_amount,
+        "balance": session.balance,
+        "created_at": session.created_at,
+        "version": session.version,
+        "deck": bytes(session.deck),  # BSON binary; older documents hold a list
+        "shoe_size": session.shoe_size,
+        "shoe_seed": f"{session.shoe_seed:032x}",  # 128 bits, more than a BSON int holds
+        "shoe_rng": session.shoe_rng,
+        "pending_payout": session.pending_payout,
+    }
+
+
+def session_from_document(document: dict) -> GameSession:
+    """Inverse of session_to_document"""
+    session = GameSession(
+        document["_id"], bytearray(document["deck"]), int(document["shoe_seed"], 16),
+        document.get("shoe_rng", "mt"), document.get("player_id"), document["balance"],
+        document["created_at"],
+    )
+    session.player_cards = bytearray(document["player_cards"])
+    session.dealer_cards = bytearray(document["dealer_cards"])
+    session.player_totals = HandTotals(**document["player_totals"])
+    session.dealer_totals = HandTotals(**document["dealer_totals"])
+    session.game_status = document["game_status"]
+    session.bet_amount = document["bet_amount"]
+    session.version = document["version"]
+    session.hand = document.get("hand", 0)
+    session.shoe_size = document["shoe_size"]
+    session.pending_payout = document.get("pending_payout", 0.0)
+    return session
+
+
+class FlushLoop:
+    """Runs `flush` from a background task every `interval` seconds, or as
+    soon as `wake` is called, until closed.
+
+    Exceptions of the `errors` types are logged with `failure` and the loop
+    carries on; flush keeps whatever it could not write for the next round.
+    """
+
+    def __init__(self, flush: Callable[[], Awaitable[Any]], interval: float,
+                 errors: Tuple[type, ...] = (), failure: str = ""):
+        self.flush = flush
+        self.interval = interval
+        self.errors = errors
+        self.failure = failure
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the loop, letting a flush in progress finish. Cancelling it
+        would lose the batch it has taken out of the buffer, or cancel under
+        a write on a worker thread; the caller then flushes what is left."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except self.errors:
+                logger.exception(self.failure)
+
+
+class SessionWriteBehind:
+    """Coalesces session writes and flushes them to MongoDB with bulk_write.
+
+    Handlers only mark a session dirty; repeated writes to the same game
+    between flushes collapse into a single upsert. Dirty sessions are also
+    consulted on reads, so a session evicted from the cache before its flush
+    is never reloaded stale from the database.
+    """
+
+    def __init__(self, collection, flush_interval: float, max_batch: int):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._dirty: Dict[str, GameSession] = {}  # game_id -> session
+        self._flusher = FlushLoop(self.flush, flush_interval)
+        self.flushed = 0
+        self.failed_flushes = 0
+
+    def mark_dirty(self, game_id: str, session: GameSession):
+        self._dirty[game_id] = session
+        if len(self._dirty) >= self.max_batch:
+            self._flusher.wake()
+
+    async def load(self, game_id: str) -> Optional[GameSession]:
+        session = self._dirty.get(game_id)
+        if session is not None:
+            return session
+        document = await self.collection.find_one({"_id": game_id})
+        return None if document is None else session_from_document(document)
+
+    async def flush(self):
+        while self._dirty:
+            batch, self._dirty = self._dirty, {}
+            requests = [
+                ReplaceOne({"_id": game_id}, session_to_document(game_id, session), upsert=True)
+                for game_id, session in batch.items()
+            ]
+            try:
+                await self.collection.bulk_write(requests, ordered=False)
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception("Failed to flush %d game sessions", len(batch))
+                # Keep newer writes made while the flush was in flight
+                batch.update(self._dirty)
+                self._dirty = batch
+                return
+            self.flushed += len(batch)
+
+    async def start(self):
+        self._flusher.start()
+
+    async def close(self):
+        await self._flusher.close()
+        await self.flush()
+
+
+class SessionConflict(Exception):
+    """Raised when a session changed in the backend since it was read"""
+
+
+class SessionBackend(ABC):
+    """Where game sessions live between requests.
+
+    `get` returns a GameSession that the handler mutates in place and hands
+    back to `save`. Every save bumps its `version`; backends shared
+    between processes only apply it if the stored version is still the one
+    that was read, and raise SessionConflict otherwise.
+    """
+
+    @abstractmethod
+    async def get(self, game_id: str) -> Optional[GameSession]:
+        ...
+
+    @abstractmethod
+    async def create(self, game_id: str, session: GameSession):
+        ...
+
+    @abstractmethod
+    async def save(self, game_id: str, session: GameSession):
+        ...
+
+    async def mark_paid(self, game_id: str, session: GameSession):
+        """Persist that the session's pending payout was credited, without
+        bumping its version. Nothing to do where the store holds the session
+        object itself."""
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemorySessionBackend(SessionBackend):
+    """Sessions held only in this process's SessionStore"""
+
+    def __init__(self, store: SessionStore):
+        self.store = store
+
+    async def get(self, game_id):
+        return self.store.get(game_id)
+
+    async def create(self, game_id, session):
+        self.store[game_id] = session
+
+    async def save(self, game_id, session):
+        session.version += 1
+        self.store[game_id] = session
+
+    async def start(self):
+        self._sweeper = asyncio.create_task(self.store.run_sweeper())
+
+    async def close(self):
+        self._sweeper.cancel()
+
+    def stats(self):
+        return self.store.stats()
+
+
+class MongoSessionBackend(MemorySessionBackend):
+    """SessionStore cache in front of MongoDB, written behind in batches.
+
+    Assumes a single writer process per game; use SharedSessionBackend when
+    several workers may serve the same game_id.
+    """
+
+    def __init__(self, store: SessionStore, persistence: SessionWriteBehind):
+        super().__init__(store)
+        self.persistence = persistence
+
+    async def get(self, game_id):
+        session = self.store.get(game_id)
+        if session is None:
+            session = await self.persistence.load(game_id)
+            if session is not None:
+                self.store[game_id] = session
+        return session
+
+    async def create(self, game_id, session):
+        await super().create(game_id, session)
+        self.persistence.mark_dirty(game_id, session)
+
+    async def save(self, game_id, session):
+        await super().save(game_id, session)
+        self.persistence.mark_dirty(game_id, session)
+
+    async def mark_paid(self, game_id, session):
+        self.persistence.mark_dirty(game_id, session)
+
+    async def start(self):
+        await super().start()
+        await self.persistence.start()
+
+    async def close(self):
+        await super().close()
+        await self.persistence.close()
+
+    def stats(self):
+        return dict(super().stats(), flushed=self.persistence.flushed,
+                    failed_flushes=self.persistence.failed_flushes)
+
+
+class SharedSessionBackend(SessionBackend):
+    """Sessions shared by every worker through a document collection.
+
+    Each request works on its own copy of the document and writes it back
+    with a compare-and-set on `version`, so two concurrent actions on the
+    same game cannot both apply. Nothing is cached locally since another
+    worker may have moved the game on.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.conflicts = 0
+
+    async def get(self, game_id):
+        document = await self.collection.find_one({"_id": game_id})
+        return None if document is None else session_from_document(document)
+
+    async def create(self, game_id, session):
+        await self.collection.insert_one(session_to_document(game_id, session))
+
+    async def save(self, game_id, session):
+        expected = session.version
+        session.version += 1
+        document = session_to_document(game_id, session)
+        del document["_id"]
+        result = await self.collection.update_one(
+            {"_id": game_id, "version": expected}, {"$set": document}
+        )
+        if result.matched_count == 0:
+            session.version = expected
+            self.conflicts += 1
+            raise SessionConflict(game_id)
+
+    async def mark_paid(self, game_id, session):
+        # A newer version was saved by a request that loaded, and so credited, the payout
+        await self.collection.update_one({"_id": game_id, "version": session.version},
+                                         {"$set": {"pending_payout": 0.0}})
+
+    def stats(self):
+        return {"conflicts": self.conflicts}
+
+
+class InMemoryCollection:
+    """Local stand-in for the subset of the motor collection API used here.
+
+    Lets the shared backend and benchmarks run without a MongoDB server.
+    Documents are copied in and out so callers never share state with it.
+    """
+
+    def __init__(self):
+        self._documents = {}
+
+    @staticmethod
+    def _matches(document: dict, query: Mapping[str, Any]) -> bool:
+        for key, condition in query.items():
+            value = document.get(key)
+            if not isinstance(condition, dict):
+                if condition not in value if isinstance(value, list) else value != condition:
+                    return False
+            elif "$ne" in condition:
+                if condition["$ne"] in value if isinstance(value, list) else value == condition["$ne"]:
+                    return False
+            elif "$gte" in condition:
+                if value is None or value < condition["$gte"]:
+                    return False
+        return True
+
+    @staticmethod
+    def _apply(document: dict, update: dict):
+        document.update(copy.deepcopy(update.get("$set", {})))
+        for key, amount in update.get("$inc", {}).items():
+            document[key] = document.get(key, 0) + amount
+        for key, pull in update.get("$pull", {}).items():
+            document[key] = [value for value in document.get(key, []) if value != pull]
+        for key, push in update.get("$push", {}).items():
+            values = document.setdefault(key, [])
+            if isinstance(push, dict) and "$each" in push:
+                values.extend(push["$each"])
+                if "$slice" in push:
+                    del values[:max(0, len(values) + push["$slice"])]
+            else:
+                values.append(push)
+
+    def _update(self, query: Mapping[str, Any], update: Any, upsert: bool) -> Optional[dict]:
+        """Apply `update` to the matching document and return it, or None"""
+        document = self._documents.get(query["_id"])
+        if document is not None and self._matches(document, query):
+            self._apply(document, update)
+            return document
+        if upsert and document is None:
+            document = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            document.update(copy.deepcopy(update.get("$setOnInsert", {})))
+            self._apply(document, update)
+            self._documents[query["_id"]] = document
+            return document
+        return None
+
+    async def find_one(self, query: dict) -> Optional[dict]:
+        document = self._documents.get(query["_id"])
+        if document is None or not self._matches(document, query):
+            return None
+        return copy.deepcopy(document)
+
+    async def insert_one(self, document: dict):
+        if document["_id"] in self._documents:
+            raise DuplicateKeyError(f"duplicate key: {document['_id']}")
+        self._documents[document["_id"]] = copy.deepcopy(document)
+        return InsertOneResult(document["_id"], True)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        existed = query["_id"] in self._documents
+        if self._update(query, update, upsert) is None:
+            return UpdateResult({"n": 0, "nModified": 0}, True)
+        if not existed:
+            return UpdateResult({"n": 1, "nModified": 0, "upserted": query["_id"]}, True)
+        return UpdateResult({"n": 1, "nModified": 1}, True)
+
+    async def find_one_and_update(self, query: dict, update: dict, upsert: bool = False,
+                                  return_document=ReturnDocument.BEFORE):
+        before = copy.deepcopy(self._documents.get(query["_id"]))
+        document = self._update(query, update, upsert)
+        if document is None:
+            return None
+        return copy.deepcopy(document) if return_document == ReturnDocument.AFTER else before
+
+    async def bulk_write(self, requests, ordered: bool = True):
+        for request in requests:
+            if isinstance(request, ReplaceOne):
+                self._documents[request._filter["_id"]] = copy.deepcopy(request._doc)
+            elif isinstance(request, UpdateOne):
+                self._update(request._filter, request._doc, request._upsert)
+            elif request._doc["_id"] not in self._documents:  # InsertOne
+                self._documents[request._doc["_id"]] = copy.deepcopy(request._doc)
+            elif ordered:
+                raise BulkWriteError({"writeErrors": [{"code": 11000}]})
+
+    def __len__(self):
+        return len(self._documents)
+
+
+def make_session_backend(kind: str) -> SessionBackend:
+    if kind == 'memory':
+        return MemorySessionBackend(game_sessions)
+    if kind == 'mongo':
+        return MongoSessionBackend(game_sessions, SessionWriteBehind(
+            db.game_sessions,
+            flush_interval=float(os.environ.get('SESSION_FLUSH_INTERVAL', 0.5)),
+            max_batch=int(os.environ.get('SESSION_FLUSH_BATCH', 500)),
+        ))
+    if kind == 'shared':
+        return SharedSessionBackend(db.game_sessions)
+    if kind == 'shared-local':
+        return SharedSessionBackend(InMemoryCollection())
+    raise ValueError(f"Unknown SESSION_BACKEND: {kind}")
+
+
+class TimedSessionBackend(SessionBackend):
+    """Wraps a backend to record get/create/save latency"""
+
+    def __init__(self, backend: SessionBackend):
+        self.backend = backend
+        self._timers = {op: HOT_PATH_LATENCY.labels(f"session_{op}") for op in ("get", "create", "save")}
+
+    async def get(self, game_id):
+        start = time.perf_counter()
+        try:
+            return await self.backend.get(game_id)
+        finally:
+            self._timers["get"].observe(time.perf_counter() - start)
+
+    async def create(self, game_id, session):
+        start = time.perf_counter()
+        try:
+            await self.backend.create(game_id, session)
+        finally:
+            self._timers["create"].observe(time.perf_counter() - start)
+
+    async def save(self, game_id, session):
+        start = time.perf_counter()
+        try:
+            await self.backend.save(game_id, session)
+        finally:
+            self._timers["save"].observe(time.perf_counter() - start)
+
+    async def mark_paid(self, game_id, session):
+        await self.backend.mark_paid(game_id, session)
+
+    async def start(self):
+        await self.backend.start()
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self):
+        return self.backend.stats()
+
+
+session_backend = TimedSessionBackend(make_session_backend(os.environ.get('SESSION_BACKEND', 'mongo')))
+METRIC_GAUGES.extend([
+    ("blackjack_sessions_live", "gauge", "Game sessions held in this process",
+     lambda: session_backend.stats().get("live", 0)),
+    ("blackjack_sessions_evicted_total", "counter", "Sessions evicted by the LRU size bound",
+     lambda: session_backend.stats().get("evicted", 0)),
+    ("blackjack_sessions_expired_total", "counter", "Sessions dropped after the idle TTL",
+     lambda: session_backend.stats().get("expired", 0)),
+    ("blackjack_shoe_pool_ready", "gauge", "Pre-shuffled shoes waiting in the pool",
+     lambda: shoe_pool.stats()["ready"]),
+    ("blackjack_shoe_pool_misses_total", "counter", "Shoes shuffled inline because the pool was empty",
+     lambda: shoe_pool.misses),
+])
+
+
+# Player wallets
+# A wallet is {_id: player_id, balance, keys}, where keys holds the idempotency
+# keys of the last WALLET_KEYS entries applied to it. Every bet and payout is
+# one $inc guarded by {keys: {$ne: key}}, so replaying an entry is a no-op, and
+# one ledger document recording it.
+WALLET_KEYS = 64
+
+
+class WalletStore:
+    """Player balances with an append-only ledger.
+
+    With `write_behind` the store assumes it is the only process writing
+    these wallets (as MongoSessionBackend does for sessions): balances and
+    recent keys are cached, entries are checked and applied in memory, and
+    the matching updates are flushed with bulk_write in the background.
+    At most `max_cached` wallets are cached, least recently used evicted
+    first, except that a wallet with entries not yet flushed is kept, as
+    the cache holds its only up-to-date balance. Otherwise every entry is a
+    find_one_and_update against the collection, which is safe with any
+    number of workers.
+    """
+
+    def __init__(self, wallets, ledger, write_behind: bool, flush_interval: float = 0.5,
+                 max_batch: int = 500, max_cached: int = 100_000):
+        self.wallets = wallets
+        self.ledger = ledger
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_cached = max_cached
+        self._cache: OrderedDict[str, list] = OrderedDict()  # player_id -> [balance, deque of recent keys]
+        self._unflushed: Dict[str, int] = {}  # player_id -> its entries in _wallet_ops
+        self._wallet_ops: List[UpdateOne] = []
+        self._ledger_ops: List[InsertOne] = []
+        self._op_players: List[str] = []  # the player of each of _wallet_ops
+        self.evicted = 0
+        self._flusher = FlushLoop(self.flush, flush_interval)
+        self.flushed = 0
+        self.failed_flushes = 0
+
+    async def _load(self, player_id: str) -> dict:
+        """The player's wallet document, created with the starting balance if new"""
+        return await self.wallets.find_one_and_update(
+            {"_id": player_id},
+            {"$setOnInsert": {"balance": STARTING_BALANCE, "keys": []}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+
+    async def _cached(self, player_id: str) -> list:
+        wallet = self._cache.get(player_id)
+        if wallet is None:
+            document = await self._load(player_id)
+            wallet = self._cache.setdefault(
+                player_id, [document["balance"], deque(document["keys"], maxlen=WALLET_KEYS)])
+            self._cache.move_to_end(player_id)
+            self._evict()
+        else:
+            self._cache.move_to_end(player_id)
+        return wallet
+
+    def _evict(self):
+        excess = len(self._cache) - self.max_cached
+        if excess <= 0:
+            return
+        evictable = []
+        for player_id in self._cache:
+            if player_id not in self._unflushed:
+                evictable.append(player_id)
+                if len(evictable) == excess:
+                    break
+        for player_id in evictable:
+            del self._cache[player_id]
+        self.evicted += len(evictable)
+
+    async def balance(self, player_id: str) -> float:
+        if self.write_behind:
+            return (await self._cached(player_id))[0]
+        return (await self._load(player_id))["balance"]
+
+    async def peek(self, player_id: str) -> float:
+        """The balance, or the starting balance for a wallet not created yet,
+        without creating or caching it"""
+        wallet = self._cache.get(player_id)
+        if wallet is not None:
+            return wallet[0]
+        document = await self.wallets.find_one({"_id": player_id})
+        return STARTING_BALANCE if document is None else document["balance"]
+
+    def _ledger_entry(self, player_id: str, amount: float, key: str, kind: str, game_id: str,
+                      balance: float) -> dict:
+        return {"_id": str(uuid.uuid4()), "key": key, "player_id": player_id, "game_id": game_id,
+                "kind": kind, "amount": amount, "balance": balance, "at": datetime.utcnow()}
+
+    def _queue(self, player_id: str, wallet_op, entry: dict):
+        self._wallet_ops.append(wallet_op)
+        self._ledger_ops.append(InsertOne(entry))
+        self._op_players.append(player_id)
+        self._unflushed[player_id] = self._unflushed.get(player_id, 0) + 1
+        if len(self._wallet_ops) >= self.max_batch:
+            self._flusher.wake()
+
+    async def apply(self, player_id: str, amount: float, key: str, kind: str,
+                    game_id: str) -> tuple:
+        """Add `amount` (negative for bets) unless `key` was already applied.
+
+        Returns (balance, applied): balance is None when a debit would take
+        the wallet below zero, applied is False when nothing changed.
+        """
+        update = {"$inc": {"balance": amount}, "$push": {"keys": {"$each": [key], "$slice": -WALLET_KEYS}}}
+        if self.write_behind:
+            wallet = await self._cached(player_id)
+            if key in wallet[1]:
+                return wallet[0], False
+            if wallet[0] + amount < 0:
+                return None, False
+            wallet[0] += amount
+            wallet[1].append(key)
+            self._queue(player_id, UpdateOne({"_id": player_id, "keys": {"$ne": key}}, update),
+                        self._ledger_entry(player_id, amount, key, kind, game_id, wallet[0]))
+            return wallet[0], True
+
+        document = await self.wallets.find_one_and_update(
+            {"_id": player_id, "keys": {"$ne": key}, "balance": {"$gte": -amount}},
+            update, return_document=ReturnDocument.AFTER,
+        )
+        if document is None:
+            # Already applied, not enough funds, or the wallet does not exist yet
+            document = await self._load(player_id)
+            if key in document["keys"]:
+                return document["balance"], False
+            if document["balance"] + amount < 0:
+                return None, False
+            return await self.apply(player_id, amount, key, kind, game_id)
+        await self.ledger.insert_one(
+            self._ledger_entry(player_id, amount, key, kind, game_id, document["balance"]))
+        return document["balance"], True
+
+    async def revert(self, player_id: str, amount: float, key: str, game_id: str) -> float:
+        """Undo an entry applied by this request, so a retry applies it again"""
+        update = {"$inc": {"balance": -amount}, "$pull": {"keys": key}}
+        if self.write_behind:
+            wallet = await self._cached(player_id)
+            if key in wallet[1]:
+                wallet[0] -= amount
+                wallet[1].remove(key)
+                self._queue(player_id, UpdateOne({"_id": player_id, "keys": key}, update),
+                            self._ledger_entry(player_id, -amount, key, "revert", game_id, wallet[0]))
+            return wallet[0]
+
+        document = await self.wallets.find_one_and_update(
+            {"_id": player_id, "keys": key}, update, return_document=ReturnDocument.AFTER)
+        if document is None:
+            return await self.balance(player_id)
+        await self.ledger.insert_one(
+            self._ledger_entry(player_id, -amount, key, "revert", game_id, document["balance"]))
+        return document["balance"]
+
+    async def flush(self):
+        while self._wallet_ops:
+            wallet_ops, self._wallet_ops = self._wallet_ops, []
+            ledger_ops, self._ledger_ops = self._ledger_ops, []
+            players, self._op_players = self._op_players, []
+            try:
+                # Wallet updates are guarded by their keys and ledger entries
+                # by their _id, so a partly applied batch is safe to replay
+                await self.wallets.bulk_write(wallet_ops, ordered=True)
+                try:
+                    await self.ledger.bulk_write(ledger_ops, ordered=False)
+                except BulkWriteError as exc:
+                    if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+                        raise
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception("Failed to flush %d wallet entries", len(wallet_ops))
+                self._wallet_ops[:0] = wallet_ops
+                self._ledger_ops[:0] = ledger_ops
+                self._op_players[:0] = players
+                return
+            self.flushed += len(wallet_ops)
+            for player_id in players:
+                if self._unflushed[player_id] == 1:
+                    del self._unflushed[player_id]
+                else:
+                    self._unflushed[player_id] -= 1
+
+    async def start(self):
+        if self.write_behind:
+            self._flusher.start()
+
+    async def close(self):
+        if self.write_behind:
+            await self._flusher.close()
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {"cached": len(self._cache), "evicted": self.evicted, "pending": len(self._wallet_ops),
+                "flushed": self.flushed, "failed_flushes": self.failed_flushes}
+
+
+def make_wallet_store(kind: str) -> WalletStore:
+    """Wallets to match SESSION_BACKEND: cached unless sessions are shared"""
+    flush: Dict[str, Any] = dict(flush_interval=float(os.environ.get('SESSION_FLUSH_INTERVAL', 0.5)),
+                 max_batch=int(os.environ.get('SESSION_FLUSH_BATCH', 500)),
+                 max_cached=int(os.environ.get('WALLET_CACHE_SIZE', 100_000)))
+    if kind == 'memory':
+        return WalletStore(InMemoryCollection(), InMemoryCollection(), write_behind=True, **flush)
+    if kind == 'mongo':
+        return WalletStore(db.wallets, db.wallet_ledger, write_behind=True, **flush)
+    if kind == 'shared':
+        return WalletStore(db.wallets, db.wallet_ledger, write_behind=False)
+    if kind == 'shared-local':
+        return WalletStore(InMemoryCollection(), InMemoryCollection(), write_behind=False)
+    raise ValueError(f"Unknown SESSION_BACKEND: {kind}")
+
+
+wallet_store = make_wallet_store(os.environ.get('SESSION_BACKEND', 'mongo'))
+METRIC_GAUGES.extend([
+    ("blackjack_wallet_pending", "gauge", "Wallet entries applied in memory and not yet flushed",
+     lambda: len(wallet_store._wallet_ops)),
+    ("blackjack_wallet_failed_flushes_total", "counter", "Wallet write-behind flushes that failed",
+     lambda: wallet_store.failed_flushes),
+])
+
+
+# Play stats
+# Outcome counters kept up to date as each hand is settled, so reporting
+# never scans sessions or collections. The totals cover every hand; rows per
+# player and the balance leaderboard only cover wallet players, since an
+# anonymous balance ends with its game. The leaderboard is a list kept
+# sorted by (-balance, player_id). /stats and /leaderboard serve JSON encoded
+# at most `refresh_interval` ago by `run`, rather than building it per request.
+class PlayStats:
+    def __init__(self, top: int, refresh_interval: float):
+        self.top = top
+        self.refresh_interval = refresh_interval
+        self.outcomes = dict.fromkeys(PAYOFFS, 0)
+        self.hands = 0
+        self.wagered = 0.0
+        self.net = 0.0  # the players' winnings net of stakes
+        self.players: Dict[str, list] = {}  # player_id -> [hands, wins, pushes, busts, net, balance]
+        self._ranking: List[tuple] = []
+        self.version = 0  # bumped per hand, so run only re-encodes after a change
+        self._encoded_version = -1
+        self._stats = self._leaderboard = b""  # until the first encode
+
+    def record(self, player_id: Optional[str], status: str, bet: float, payout: float, balance: float):
+        """Count a settled hand; `balance` is the player's after the payout"""
+        self.outcomes[status] += 1
+        self.hands += 1
+        self.wagered += bet
+        self.net += payout - bet
+        self.version += 1
+        if player_id is None:
+            return
+        row = self.players.get(player_id)
+        if row is None:
+            row = self.players[player_id] = [0, 0, 0, 0, 0.0, balance]
+        else:
+            del self._ranking[bisect_left(self._ranking, (-row[5], player_id))]
+        row[0] += 1
+        row[1] += PAYOFFS[status] > 0
+        row[2] += status == "push"
+        row[3] += status == "player_bust"
+        row[4] += payout - bet
+        row[5] = balance
+        insort(self._ranking, (-balance, player_id))
+
+    def encode(self):
+        """Rebuild the cached /stats and /leaderboard replies"""
+        hands = self.hands or 1
+        now = datetime.utcnow()
+        self._stats = encode_json({
+            "hands": self.hands,
+            "wagered": self.wagered,
+            "net": self.net,
+            "win_rate": (self.outcomes["player_win"] + self.outcomes["dealer_bust"]) / hands,
+            "push_rate": self.outcomes["push"] / hands,
+            "bust_rate": self.outcomes["player_bust"] / hands,
+            "outcomes": self.outcomes,
+            "players": len(self.players),
+            "updated_at": now,
+        })
+        standings = []
+        for rank, (balance, player_id) in enumerate(self._ranking[:self.top], 1):
+            row = self.players[player_id]
+            standings.append({"rank": rank, "player_id": player_id, "balance": -balance,
+                              "hands": row[0], "wins": row[1], "net": row[4]})
+        self._leaderboard = encode_json({"players": standings, "updated_at": now})
+        self._encoded_version = self.version
+
+    def stats_json(self) -> bytes:
+        if not self._stats:
+            self.encode()
+        return self._stats
+
+    def leaderboard_json(self) -> bytes:
+        if not self._leaderboard:
+            self.encode()
+        return self._leaderboard
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            if self.version != self._encoded_version:
+                self.encode()
+
+
+play_stats = PlayStats(
+    top=int(os.environ.get('LEADERBOARD_SIZE', 100)),
+    refresh_interval=float(os.environ.get('STATS_REFRESH_INTERVAL', 2)),
+)
+METRIC_GAUGES.extend([
+    ("blackjack_hands_settled_total", "counter", "Hands played to an outcome", lambda: play_stats.hands),
+])
+
+
+# Event journal
+# Every game is also written to an append-only log of fixed 48-byte records
+# (JOURNAL_RECORD), buffered in memory and appended to segment files with
+# one write and fsync per batch. Records of a game, in order, are enough to
+# replay it exactly: the shoe is rebuilt from its seed and every dealt card
+# is checked against the recorded one-byte code (its index into CARDS).
+# Every segment starts with a checkpoint of the games still live in the
+# segments before it, which are then removed, so a replay only ever reads
+# from the newest checkpoint. A checkpoint is renamed into place once it is
+# written and fsynced, so a crash can never leave a partial one.
+JOURNAL_RECORD = struct.Struct("<BBBxIQ16s16s")  # event, count, rng, hand, time_ns, game id, payload
+JOURNAL_DTYPE = np.dtype([
+    ("event", "u1"), ("count", "u1"), ("rng", "u1"), ("reserved", "u1"), ("hand", "<u4"),
+    ("time_ns", "<u8"), ("game", "V16"), ("payload", "u1", 16),
+])
+AMOUNTS = struct.Struct("<dd")
+
+EVENT_GAME = 1  # count = length of player_id, payload = its first 16 bytes
+EVENT_PLAYER = 2  # the next 16 bytes of player_id
+EVENT_SHOE = 3  # count = decks, rng = index into SHUFFLER_NAMES, payload = 128-bit seed
+EVENT_DEAL = 4  # payload = player, player, dealer, dealer card codes
+EVENT_BET = 5  # payload = amount, balance
+EVENT_HIT = 6  # payload = the card
+EVENT_STAND = 7  # count = cards the dealer drew, payload = those cards
+EVENT_OUTCOME = 8  # count = index into OUTCOMES, payload = payout, balance
+EVENT_CHECKPOINT = 9  # first record of a segment starting with a checkpoint
+# count = index into OUTCOMES (past the end while playing), rng = 1 once the
+# dealer played, payload = RESUME
+EVENT_RESUME = 10
+OUTCOMES = tuple(PAYOFFS)
+# version, cards dealt from the shoe before the hand, player cards, dealer cards
+RESUME = struct.Struct("<IHBB")
+
+
+class JournalError(Exception):
+    """Raised when journal records do not replay against their shoe"""
+
+
+class EventJournal:
+    """Buffered writer for the event journal.
+
+    Handlers append records after the state change they describe is saved.
+    A FlushLoop writes and fsyncs the buffer every `fsync_interval` seconds, or
+    sooner once `max_buffer` bytes are waiting, so an action never waits on
+    the disk. Each process start opens a new segment, so a record torn by a
+    crash can only be at the end of a segment. The next batch goes to a new
+    segment once one has `segment_bytes` of records after its checkpoint,
+    which keeps the games with a record in the last `ttl_seconds`. Disabled
+    when `directory` is None.
+    """
+
+    def __init__(self, directory: Optional[Path], segment_bytes: int, fsync_interval: float,
+                 max_buffer: int, ttl_seconds: float):
+        self.directory = directory
+        self.segment_bytes = segment_bytes - segment_bytes % JOURNAL_RECORD.size
+        self.ttl_seconds = ttl_seconds
+        self.fsync_interval = fsync_interval
+        self.max_buffer = max_buffer
+        self._buffer = bytearray()
+        self._flusher = FlushLoop(self.flush, fsync_interval, (OSError,),
+                                  "Failed to write the event journal")
+        self._lock = asyncio.Lock()
+        self._file: Optional[BinaryIO] = None
+        self.records = 0
+        self.fsyncs = 0
+
+    def _append(self, event: int, count: int, hand: int, game_id: str, payload: bytes = b"",
+                rng: int = 0):
+        self._buffer += JOURNAL_RECORD.pack(event, count, rng, hand, time.time_ns(),
+                                            bytes.fromhex(game_id.replace("-", "")), payload)
+        self.records += 1
+        if len(self._buffer) >= self.max_buffer:
+            self._flusher.wake()
+
+    def _cards(self, event: int, game_session: GameSession, codes: bytearray):
+        self._append(event, len(codes), game_session.hand, game_session.id, bytes(codes))
+
+    def game_started(self, game_session: GameSession):
+        if self.directory is None:
+            return
+        player_id = (game_session.player_id or "").encode()
+        self._append(EVENT_GAME, len(player_id), 0, game_session.id, player_id[:16])
+        for offset in range(16, len(player_id), 16):
+            self._append(EVENT_PLAYER, 0, 0, game_session.id, player_id[offset:offset + 16])
+        self.hand_dealt(game_session, reshuffled=True)
+
+    def hand_dealt(self, game_session: GameSession, reshuffled: bool):
+        if self.directory is None:
+            return
+        if reshuffled:
+            self._append(EVENT_SHOE, game_session.shoe_size // len(CARDS), game_session.hand,
+                         game_session.id, game_session.shoe_seed.to_bytes(16, "little"),
+                         SHUFFLER_NAMES.index(game_session.shoe_rng))
+        self._cards(EVENT_DEAL, game_session, game_session.player_cards + game_session.dealer_cards)
+
+    def bet(self, state: GameSession):
+        if self.directory is not None:
+            self._append(EVENT_BET, 0, state.hand, state.id, AMOUNTS.pack(state.bet_amount, state.balance))
+
+    def hit(self, state: GameSession):
+        if self.directory is not None:
+            self._cards(EVENT_HIT, state, state.player_cards[-1:])
+
+    def stand(self, state: GameSession):
+        if self.directory is not None:
+            self._cards(EVENT_STAND, state, state.dealer_cards[2:])
+
+    def outcome(self, state: GameSession, payout: float):
+        if self.directory is not None:
+            self._append(EVENT_OUTCOME, OUTCOMES.index(state.game_status), state.hand, state.id,
+                         AMOUNTS.pack(payout, state.balance))
+
+    def _open_segment(self, checkpoint: bool = True) -> Dict[str, GameSession]:
+        """Start the next segment with a checkpoint of the games still live,
+        then remove the older segments. Returns the checkpointed games."""
+        directory = self.directory
+        assert directory is not None  # only written to when enabled
+        directory.mkdir(parents=True, exist_ok=True)
+        for path in directory.glob("*.journal.tmp"):
+            path.unlink()  # a checkpoint that was never completed
+        segments = sorted(directory.glob("*.journal"))
+        index = int(segments[-1].stem) + 1 if segments else 0
+        path = directory / f"{index:010d}.journal"
+        sessions: Dict[str, GameSession] = {}
+        if checkpoint:
+            since_ns = time.time_ns() - int(self.ttl_seconds * 1e9)
+            data, sessions = journal_checkpoint(directory, since_ns)
+            # Written in full under another name first: a segment that
+            # starts with a checkpoint is trusted to replace all before it
+            partial = path.with_name(path.name + ".tmp")
+            with open(partial, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(partial, path)
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            for segment in segments:
+                segment.unlink()
+        self._file = open(path, "ab", buffering=0)
+        self._written = 0
+        return sessions
+
+    def _next_segment(self):
+        try:
+            self._open_segment()
+        except JournalError:
+            # Keep everything for a replay to report; the next segment checkpoints again
+            logger.exception("Failed to checkpoint the event journal")
+            self._open_segment(checkpoint=False)
+
+    def _write(self, data: bytes):
+        # Batches are never split, as all records of an action are appended
+        # together and a checkpoint must not fall between them
+        if self._file is not None and self._written >= self.segment_bytes:
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            self._next_segment()
+        file = self._file
+        assert file is not None  # opened by _next_segment
+        file.write(data)
+        self._written += len(data)
+        os.fsync(file.fileno())
+
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            data, self._buffer = self._buffer, bytearray()
+            await asyncio.to_thread(self._write, data)
+            self.fsyncs += 1
+
+    async def start(self) -> Dict[str, GameSession]:
+        """Open this process's segment, returning the games checkpointed in it.
+        Raises JournalError if the journal does not replay."""
+        if self.directory is None:
+            return {}
+        sessions = await asyncio.to_thread(self._open_segment)
+        self._flusher.start()
+        return sessions
+
+    async def close(self):
+        if self.directory is not None:
+            await self._flusher.close()
+            await self.flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def journal_segments(directory: Path):
+    """Yield each segment's records, from the newest checkpoint on, as a
+    structured array over an mmap.
+
+    Nothing is copied or parsed: fields are read straight from the page
+    cache, e.g. `records["event"] == EVENT_OUTCOME`. A partly written
+    record at the end of a segment is ignored.
+    """
+    paths = sorted(Path(directory).glob("*.journal"))
+    for start in range(len(paths) - 1, 0, -1):
+        with open(paths[start], "rb") as f:
+            if f.read(1) == bytes((EVENT_CHECKPOINT,)):
+                break
+    else:
+        start = 0
+    for path in paths[start:]:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            count = size // JOURNAL_DTYPE.itemsize
+            if not count:
+                continue
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        yield np.frombuffer(mapped, dtype=JOURNAL_DTYPE, count=count)
+
+
+def replay_journal(directory: Path, since_ns: int = 0) -> Dict[str, GameSession]:
+    """Rebuild sessions, keyed by game id, from the journal in `directory`.
+
+    Games whose last record is older than `since_ns` are left out. Raises
+    JournalError if a game's records are inconsistent with its shoe.
+    """
+    sessions, last_seen = replay_segments(directory)
+    return {game_id: session for game_id, session in sessions.items() if last_seen[game_id] >= since_ns}
+
+
+def replay_segments(directory: Path) -> Tuple[Dict[str, GameSession], Dict[str, int]]:
+    """replay_journal, also returning the time of each game's last record"""
+    sessions = {}
+    player_id_lengths = {}
+    last_seen = {}
+    for records in journal_segments(directory):
+        for event, count, rng, _, hand, time_ns, game, payload in records.tolist():
+            if event == EVENT_CHECKPOINT:
+                continue
+            payload = bytes(payload)
+            last_seen[game] = time_ns  # keyed by the id's bytes, formatted once per game
+            if event == EVENT_GAME:
+                sessions[game] = GameSession(str(uuid.UUID(bytes=game)), bytearray(), 0, SHUFFLER_NAMES[0],
+                                             player_id=payload[:count].decode() or None,
+                                             created_at=datetime.utcfromtimestamp(time_ns / 1e9))
+                player_id_lengths[game] = count
+                continue
+            session = sessions.get(game)
+            if session is None:
+                continue  # started in a segment that was removed
+            if event == EVENT_PLAYER:
+                player_id = (session.player_id or "").encode() + payload
+                session.player_id = player_id[:player_id_lengths[game]].decode()
+            elif event == EVENT_SHOE:
+                session.shoe_seed = int.from_bytes(payload, "little")
+                session.shoe_rng = SHUFFLER_NAMES[rng]
+                session.deck = bytearray(shuffled_indices(count, session.shoe_seed, session.shoe_rng))
+                session.shoe_size = len(session.deck)
+            elif event == EVENT_DEAL:
+                if session.hand:
+                    session.version += 1
+                start_hand(session)
+                if session.player_cards + session.dealer_cards != payload[:4]:
+                    raise JournalError(f"Game {session.id}: dealt cards do not match the shoe")
+            elif event == EVENT_BET:
+                session.bet_amount, session.balance = AMOUNTS.unpack(payload)
+                session.version += 1
+            elif event == EVENT_HIT:
+                code = session.deck.pop()
+                if code != payload[0]:
+                    raise JournalError(f"Game {session.id}: dealt cards do not match the shoe")
+                session.player_cards.append(code)
+                session.player_totals.add(CARDS[code])
+                session.version += 1
+            elif event == EVENT_STAND:
+                session.dealer_totals = dealer_play_codes(session.dealer_cards, session.deck)
+                if session.dealer_cards[2:] != payload[:count]:
+                    raise JournalError(f"Game {session.id}: dealer cards do not match the shoe")
+                session.version += 1
+            elif event == EVENT_OUTCOME:
+                session.game_status = OUTCOMES[count]
+                _, session.balance = AMOUNTS.unpack(payload)
+            elif event == EVENT_RESUME:
+                # The hand is dealt again from where the shoe was, after the BET record
+                bet_amount = session.bet_amount
+                session.version, dealt, player_cards, dealer_cards = RESUME.unpack(payload[:RESUME.size])
+                del session.deck[len(session.deck) - dealt:]
+                session.hand = hand - 1
+                start_hand(session)
+                session.bet_amount = bet_amount
+                for _ in range(player_cards - 2):
+                    code = session.deck.pop()
+                    session.player_cards.append(code)
+                    session.player_totals.add(CARDS[code])
+                if rng:
+                    session.dealer_totals = dealer_play_codes(session.dealer_cards, session.deck)
+                if count < len(OUTCOMES):
+                    session.game_status = OUTCOMES[count]
+                if len(session.dealer_cards) != dealer_cards:
+                    raise JournalError(f"Game {session.id}: dealer cards do not match the shoe")
+    live = [(game, session) for game, session in sessions.items() if session.shoe_size]
+    return ({session.id: session for _, session in live},
+            {session.id: last_seen[game] for game, session in live})
+
+
+def journal_checkpoint(directory: Path, since_ns: int) -> Tuple[bytes, Dict[str, GameSession]]:
+    """Records that start a segment with every game in the journal whose
+    last record is at or after `since_ns`, and those games.
+
+    A game is written as its GAME, PLAYER and SHOE records followed by BET
+    for the amounts and RESUME, which deals the current hand again from the
+    shoe; records keep the game's creation and last record times.
+    """
+    sessions, last_seen = replay_segments(directory)
+    sessions = {game_id: session for game_id, session in sessions.items() if last_seen[game_id] >= since_ns}
+    records = [JOURNAL_RECORD.pack(EVENT_CHECKPOINT, 0, 0, 0, time.time_ns(), bytes(16), b"")]
+    for game_id, session in sessions.items():
+        game = uuid.UUID(game_id).bytes
+        seen = last_seen[game_id]
+        created_ns = (session.created_at - datetime(1970, 1, 1)) // timedelta(microseconds=1) * 1000
+        player_id = (session.player_id or "").encode()
+        records.append(JOURNAL_RECORD.pack(
+            EVENT_GAME, len(player_id), 0, 0, created_ns, game, player_id[:16]))
+        for offset in range(16, len(player_id), 16):
+            records.append(JOURNAL_RECORD.pack(
+                EVENT_PLAYER, 0, 0, 0, seen, game, player_id[offset:offset + 16]))
+        records.append(JOURNAL_RECORD.pack(
+            EVENT_SHOE, session.shoe_size // len(CARDS), SHUFFLER_NAMES.index(session.shoe_rng),
+            session.hand, seen, game, session.shoe_seed.to_bytes(16, "little")))
+        records.append(JOURNAL_RECORD.pack(EVENT_BET, 0, 0, session.hand, seen, game,
+                                           AMOUNTS.pack(session.bet_amount, session.balance)))
+        in_hand = len(session.player_cards) + len(session.dealer_cards)
+        status = OUTCOMES.index(session.game_status) if session.game_status in OUTCOMES else len(OUTCOMES)
+        # Also set between a STAND record and its OUTCOME, while the status is still "playing"
+        upcard = HandTotals.of(CARDS[i] for i in session.dealer_cards[:1])
+        dealer_played = session.dealer_totals.hard != upcard.hard
+        records.append(JOURNAL_RECORD.pack(
+            EVENT_RESUME, status, dealer_played, session.hand, seen, game,
+            RESUME.pack(session.version, session.shoe_size - len(session.deck) - in_hand,
+                        len(session.player_cards), len(session.dealer_cards))))
+    return b"".join(records), sessions
+
+
+JOURNAL_DIR = os.environ.get('JOURNAL_DIR')
+journal = EventJournal(
+    Path(JOURNAL_DIR) if JOURNAL_DIR else None,
+    segment_bytes=int(os.environ.get('JOURNAL_SEGMENT_BYTES', 64 << 20)),
+    fsync_interval=float(os.environ.get('JOURNAL_FSYNC_INTERVAL', 0.05)),
+    max_buffer=int(os.environ.get('JOURNAL_MAX_BUFFER', 1 << 20)),
+    ttl_seconds=game_sessions.ttl_seconds,
+)
+METRIC_GAUGES.extend([
+    ("blackjack_journal_records_total", "counter", "Event journal records appended",
+     lambda: journal.records),
+    ("blackjack_journal_fsyncs_total", "counter", "Batched event journal writes fsynced",
+     lambda: journal.fsyncs),
+])
+
+
+# Hand export
+# Every finished hand is also exported for offline analysis, as a row of
+# zstd-compressed Parquet with a new file every `rotate_seconds`. Handlers
+# only put a tuple on a bounded queue; a FlushLoop drains it every
+# `flush_interval` (or once `max_batch` rows wait) and writes the batch as a
+# row group from a worker thread. When the queue is full, rows are dropped,
+# or with overflow="spill" set aside and appended to a JSON-lines file by
+# the next write; either is counted. A file is written under a .partial
+# name and renamed once it is complete. Disabled when `directory` is None.
+HAND_COLUMNS = (
+    "finished_at", "game_id", "seat", "player_id", "hand", "created_at", "player_cards",
+    "dealer_cards", "player_score", "dealer_score", "status", "bet", "payout", "balance",
+)
+
+
+def hand_schema():
+    import pyarrow as pa  # type: ignore[import-untyped]
+
+    return pa.schema([
+        ("finished_at", pa.timestamp("ns", tz="UTC")),
+        ("game_id", pa.string()),  # or the table id
+        ("seat", pa.int8()),  # null outside tables
+        ("player_id", pa.string()),
+        ("hand", pa.int32()),  # hand number in the game, or the table round
+        ("created_at", pa.timestamp("us", tz="UTC")),  # of the game or table
+        ("player_cards", pa.list_(pa.string())),  # card codes, e.g. "10H"
+        ("dealer_cards", pa.list_(pa.string())),
+        ("player_score", pa.int8()),
+        ("dealer_score", pa.int8()),  # as shown to the player, the upcard only after a bust
+        ("status", pa.dictionary(pa.int8(), pa.string())),
+        ("bet", pa.float64()),
+        ("payout", pa.float64()),  # stake returned plus winnings
+        ("balance", pa.float64()),
+    ])
+
+
+class HandExporter:
+    def __init__(self, directory: Optional[Path], rotate_seconds: float, flush_interval: float,
+                 max_queue: int, max_batch: int, overflow: str = "spill"):
+        if overflow not in ("spill", "drop"):
+            raise ValueError(f"Unknown HAND_EXPORT_OVERFLOW: {overflow}")
+        self.directory = directory
+        self.rotate_seconds = rotate_seconds
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.overflow = overflow
+        self._queue: asyncio.Queue[tuple] = asyncio.Queue(max_queue)
+        self._spill: List[tuple] = []
+        self._flusher = FlushLoop(self.flush, flush_interval, (Exception,),
+                                  "Failed to export finished hands")
+        self._lock = asyncio.Lock()
+        self._writer: Any = None  # a pyarrow.parquet.ParquetWriter
+        self._path = Path()
+        self._rotate_at = 0.0
+        self.exported = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.files = 0
+
+    def _put(self, row: tuple):
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            if self.overflow == "spill" and len(self._spill) < self._queue.maxsize:
+                self._spill.append(row)
+                self.spilled += 1
+            else:
+                self.dropped += 1
+            self._flusher.wake()
+            return
+        if self._queue.qsize() >= self.max_batch:
+            self._flusher.wake()
+
+    def game_finished(self, state: GameSession, payout: float):
+        if self.directory is not None:
+            self._put((time.time_ns(), state.id, None, state.player_id, state.hand, state.created_at,
+                       bytes(state.player_cards), bytes(state.dealer_cards), state.player_score,
+                       state.dealer_score, state.game_status, state.bet_amount, payout, state.balance))
+
+    def seat_finished(self, table: "Table", number: int, payout: float):
+        if self.directory is not None:
+            seat = table.seats[number]
+            assert seat is not None  # settled before the seat is left
+            self._put((time.time_ns(), table.id, number, seat.player_id, table.round, table.created_at,
+                       bytes(seat.cards), bytes(table.dealer_cards), seat.totals.best,
+                       table.dealer_totals.best, seat.status, seat.bet_amount, payout, seat.balance))
+
+    def _columns(self, rows: List[tuple]) -> dict:
+        columns: Dict[str, Any] = dict(zip(HAND_COLUMNS, zip(*rows)))
+        for name in ("player_cards", "dealer_cards"):
+            columns[name] = [[CARD_CODES[i] for i in codes] for codes in columns[name]]
+        return columns
+
+    def _table(self, rows: List[tuple]):
+        """Column arrays for a batch, with the card and timestamp columns built in bulk"""
+        import pyarrow as pa  # type: ignore[import-untyped]
+
+        columns = dict(zip(HAND_COLUMNS, zip(*rows)))
+        schema = hand_schema()
+        arrays = []
+        for field in schema:
+            values = columns[field.name]
+            if field.name in ("player_cards", "dealer_cards"):
+                lengths = np.fromiter(map(len, values), np.int32, len(values))
+                offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int32)))
+                codes = np.frombuffer(b"".join(values), np.uint8)
+                arrays.append(pa.ListArray.from_arrays(offsets, pa.array(CARD_CODES).take(codes)))
+            elif field.name == "finished_at":
+                # Converting ints one by one to a timestamp with a time zone is very slow
+                arrays.append(pa.array(values, pa.int64()).cast(field.type))
+            else:
+                arrays.append(pa.array(values, field.type))
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    def _close_file(self):
+        self._writer.close()
+        self._writer = None
+        os.replace(self._path.with_name(self._path.name + ".partial"), self._path)
+        self.files += 1
+
+    def _write(self, rows: List[tuple], spilled: List[tuple], final: bool = False):
+        import pyarrow.parquet as pq  # type: ignore[import-untyped]
+
+        if self._writer is not None and time.time() >= self._rotate_at:
+            self._close_file()
+        if not rows and not spilled:
+            if final and self._writer is not None:
+                self._close_file()
+            return
+        directory = self.directory
+        assert directory is not None  # rows are only queued when enabled
+        directory.mkdir(parents=True, exist_ok=True)
+        if spilled:
+            columns = self._columns(spilled)
+            with open(directory / f"hands-{os.getpid()}-spill.jsonl", "ab") as f:
+                f.write(b"".join(encode_json(dict(zip(columns, row))) + b"\n"
+                                 for row in zip(*columns.values())))
+        if rows:
+            if self._writer is None:
+                stamp = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{os.getpid()}-{self.files}"
+                self._path = directory / f"hands-{stamp}.parquet"
+                self._writer = pq.ParquetWriter(self._path.with_name(self._path.name + ".partial"),
+                                                hand_schema(), compression="zstd")
+                self._rotate_at = time.time() + self.rotate_seconds
+            self._writer.write_table(self._table(rows))
+        self.exported += len(rows) + len(spilled)
+        if final and self._writer is not None:
+            self._close_file()
+
+    async def flush(self, final: bool = False):
+        async with self._lock:
+            rows = [self._queue.get_nowait() for _ in range(self._queue.qsize())]
+            spilled, self._spill = self._spill, []
+            if rows or spilled or final or self._writer is not None:
+                try:
+                    await asyncio.to_thread(self._write, rows, spilled, final)
+                except Exception:
+                    self.dropped += len(rows) + len(spilled)
+                    raise
+
+    async def start(self):
+        if self.directory is not None:
+            import pyarrow.parquet  # noqa: F401  fail at startup rather than on the first write
+
+            self._flusher.start()
+
+    async def close(self):
+        if self.directory is not None:
+            await self._flusher.close()
+            await self.flush(final=True)
+
+
+HAND_EXPORT_DIR = os.environ.get('HAND_EXPORT_DIR')
+hand_export = HandExporter(
+    Path(HAND_EXPORT_DIR) if HAND_EXPORT_DIR else None,
+    rotate_seconds=float(os.environ.get('HAND_EXPORT_ROTATE_SECONDS', 3600)),
+    flush_interval=float(os.environ.get('HAND_EXPORT_FLUSH_INTERVAL', 5)),
+    max_queue=int(os.environ.get('HAND_EXPORT_QUEUE', 100_000)),
+    max_batch=int(os.environ.get('HAND_EXPORT_BATCH', 10_000)),
+    overflow=os.environ.get('HAND_EXPORT_OVERFLOW', 'spill'),
+)
+METRIC_GAUGES.extend([
+    ("blackjack_hands_exported_total", "counter", "Finished hands written to export files",
+     lambda: hand_export.exported),
+    ("blackjack_hands_export_spilled_total", "counter",
+     "Finished hands spilled to JSON lines with the queue full", lambda: hand_export.spilled),
+    ("blackjack_hands_export_dropped_total", "counter", "Finished hands not exported",
+     lambda: hand_export.dropped),
+    ("blackjack_hand_export_queue", "gauge", "Finished hands waiting to be exported",
+     lambda: hand_export._queue.qsize()),
+    ("blackjack_hand_export_files_total", "counter", "Completed hand export files",
+     lambda: hand_export.files),
+])
+
+
+def conflict_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=409,
+        content={"error": "Game was updated concurrently, reload and retry"},
+    )
+
+
+# API Routes
+@api_router.get("/")
+async def root():
+    return {"message": "Blackjack API Ready"}
+
+@api_router.get("/stats", response_model=PlayStatsReply)
+async def get_stats():
+    """Hands played, outcome rates and net winnings, at most STATS_REFRESH_INTERVAL old"""
+    return Response(play_stats.stats_json(), media_type="application/json")
+
+@api_router.get("/leaderboard", response_model=Leaderboard)
+async def get_leaderboard():
+    """Wallet players with the highest balances, at most STATS_REFRESH_INTERVAL old"""
+    return Response(play_stats.leaderboard_json(), media_type="application/json")
+
+@api_router.get("/sessions/stats")
+async def session_stats():
+    """Session backend counters (live, evicted, expired, conflicts...)"""
+    return session_backend.stats()
+
+def deal_hand(game_session: GameSession) -> bool:
+    """Deal a fresh hand from the session's shoe, reshuffling at the cut card.
+
+    Returns True when the hand came from a new shoe.
+    """
+    start = time.perf_counter()
+    reshuffled = len(game_session.deck) < shoe_cut_point(game_session.shoe_size)
+    if reshuffled:
+        game_session.shoe_seed, game_session.deck = shoe_pool.take()
+        game_session.shoe_rng = shoe_pool.rng
+        game_session.shoe_size = len(game_session.deck)
+    start_hand(game_session)
+    SHOE_REMAINING.labels().observe(len(game_session.deck))
+    DEAL_HAND_TIMER.observe(time.perf_counter() - start)
+    return reshuffled
+
+def start_hand(game_session: GameSession):
+    """Deal the initial cards of the next hand from the top of the shoe"""
+    deck = game_session.deck
+    game_session.player_cards = bytearray((deck.pop(), deck.pop()))
+    game_session.dealer_cards = bytearray((deck.pop(), deck.pop()))
+    game_session.player_totals = HandTotals.of(CARDS[i] for i in game_session.player_cards)
+    # Only show first dealer card
+    game_session.dealer_totals = HandTotals.of((CARDS[game_session.dealer_cards[0]],))
+    game_session.bet_amount = 0.0
+    game_session.hand += 1
+    game_session.game_status = "playing"
+
+@api_router.post("/game/new", response_model=Union[GameState, ErrorReply])
+async def new_game(player_id: Annotated[Optional[str], Query(**PLAYER_ID)] = None):
+    """Start a new blackjack game, playing from `player_id`'s wallet if given"""
+    game_id = str(uuid.uuid4())
+    shoe_seed, deck = shoe_pool.take()
+    game_session = GameSession(game_id, deck, shoe_seed, shoe_pool.rng, player_id=player_id)
+    if player_id is not None:
+        game_session.balance = await wallet_store.balance(player_id)
+    deal_hand(game_session)
+    
+    # Store game state and remaining shoe
+    await session_backend.create(game_id, game_session)
+    journal.game_started(game_session)
+    
+    return game_session.to_state()
+
+@api_router.post("/game/{game_id}/bet", response_model=Union[GameState, ErrorReply],
+                 responses={409: {"model": ErrorReply}})
+async def place_bet(game_id: str, bet_request: BetRequest):
+    """Place a bet for the game"""
+    game_session = await session_backend.get(game_id)
+    if game_session is None:
+        return {"error": "Game not found"}
+    
+    amount = bet_request.amount
+    if game_session.bet_amount == amount:
+        return game_session.to_state()  # a retried request, already applied
+    if game_session.game_status != "playing":
+        return {"error": "Game is not in progress"}
+    if len(game_session.player_cards) > 2:
+        return {"error": "Bets are placed before the first card is drawn"}
+    if amount > game_session.balance:
+        return {"error": "Insufficient balance"}
+    if game_session.bet_amount:
+        return {"error": "Bet already placed"}
+    
+    if game_session.player_id is None:
+        game_session.balance -= amount
+        applied = False
+    else:
+        # The amount is part of the key, so a different bet on the same hand
+        # can never pass for a retry of this one
+        key = f"{game_id}:{game_session.hand}:bet:{amount!r}"
+        balance, applied = await wallet_store.apply(game_session.player_id, -amount, key, "bet", game_id)
+        if balance is None:
+            return {"error": "Insufficient balance"}
+        if not applied:
+            # Debited by a concurrent request for this bet that has not saved
+            # yet, or that failed before saving; only it may stake the bet
+            return conflict_response()
+        game_session.balance = balance
+    
+    game_session.bet_amount = amount
+    try:
+        await session_backend.save(game_id, game_session)
+    except SessionConflict:
+        if applied:
+            await wallet_store.revert(game_session.player_id, -amount, key, game_id)
+        return conflict_response()
+    journal.bet(game_session)
+    
+    return game_session.to_state()
+
+async def credit_payout(game_session: GameSession):
+    """Credit the wallet payout saved with the hand's outcome, then clear it.
+
+    A stand saves the payout owed together with the outcome and credits it
+    once that save went through. If the credit fails, or the process dies
+    first, the next request to load the game credits it again; the key makes
+    that a no-op when the earlier credit did apply.
+    """
+    key = f"{game_session.id}:{game_session.hand}:payout"
+    assert game_session.player_id is not None  # only wallet games owe a payout
+    try:
+        game_session.balance, _ = await wallet_store.apply(
+            game_session.player_id, game_session.pending_payout, key, "payout", game_session.id)
+        game_session.pending_payout = 0.0
+        await session_backend.mark_paid(game_session.id, game_session)
+    except Exception:
+        logger.exception("Failed to credit the payout of game %s", game_session.id)
+
+async def load_game(game_id: str) -> Optional[GameSession]:
+    """The game's session, with any payout still owed to its wallet credited"""
+    game_session = await session_backend.get(game_id)
+    if game_session is not None and game_session.pending_payout:
+        await credit_payout(game_session)
+    return game_session
+
+def game_delta(before: dict, game_session: GameSession) -> dict:
+    """Compact reply for an action: only what changed since `before`.
+
+    `before` is the snapshot taken by `delta_snapshot` when the action
+    started. Newly dealt cards are sent as short codes; scores, status and
+    balance only when they changed. Clients that see a version gap should
+    fetch the full state from GET /game/{game_id}.
+    """
+    delta = {"id": game_session.id, "version": game_session.version}
+    new_player_cards = game_session.player_cards[before["player_cards"]:]
+    new_dealer_cards = game_session.visible_dealer_cards[before["dealer_cards"]:]
+    if new_player_cards:
+        delta["player_cards"] = [CARD_CODES[i] for i in new_player_cards]
+    if new_dealer_cards:
+        delta["dealer_cards"] = [CARD_CODES[i] for i in new_dealer_cards]
+    for field in ("player_score", "dealer_score", "game_status", "balance"):
+        value = getattr(game_session, field)
+        if value != before[field]:
+            delta[field] = value
+    return delta
+
+
+def delta_snapshot(game_session: GameSession) -> dict:
+    return {
+        "player_cards": len(game_session.player_cards),
+        "dealer_cards": len(game_session.visible_dealer_cards),
+        "player_score": game_session.player_score,
+        "dealer_score": game_session.dealer_score,
+        "game_status": game_session.game_status,
+        "balance": game_session.balance,
+    }
+
+
+@api_router.post("/game/{game_id}/action", response_model=Union[GameState, GameDelta, ErrorReply],
+                 responses={409: {"model": ErrorReply}})
+async def game_action(game_id: str, action: GameAction):
+    """Perform a game action (hit, stand, or new_game to deal the next hand),
+    optionally replying with a delta"""
+    game_session = await load_game(game_id)
+    if game_session is None:
+        return {"error": "Game not found"}
+    
+    before = delta_snapshot(game_session) if action.compact else None
+    
+    if action.action == "new_game":
+        # Next hand in the same game, from the same shoe
+        if game_session.game_status == "playing":
+            return {"error": "Hand is still in progress"}
+        reshuffled = deal_hand(game_session)
+        before = None
+    elif game_session.game_status != "playing":
+        return {"error": "Game is not in progress"}
+        
+    elif action.action == "hit":
+        # Deal card to player; the cut card guarantees the shoe has enough
+        code = game_session.deck.pop()
+        game_session.player_cards.append(code)
+        game_session.player_totals.add(CARDS[code])
+        
+        if game_session.player_score > 21:
+            game_session.game_status = "player_bust"
+            
+    elif action.action == "stand":
+        # Dealer plays
+        start = time.perf_counter()
+        game_session.dealer_totals = dealer_play_codes(game_session.dealer_cards, game_session.deck)
+        DEALER_PLAY_TIMER.observe(time.perf_counter() - start)
+        full_dealer_score = game_session.dealer_score
+        
+        if full_dealer_score > 21:
+            game_session.game_status = "dealer_bust"
+        else:
+            game_session.game_status = determine_winner(game_session.player_score, full_dealer_score)
+        # Winnings pay 1:1 on top of the returned stake, a push returns the stake
+        payout = game_session.bet_amount * (1 + PAYOFFS[game_session.game_status])
+        if payout and game_session.player_id is None:
+            game_session.balance += payout
+        elif payout:
+            # Credited only once the outcome is saved, so a conflicting action cannot pay out
+            game_session.pending_payout = payout
+    else:
+        return {"error": f"Unknown action: {action.action}"}
+
+    try:
+        await session_backend.save(game_id, game_session)
+    except SessionConflict:
+        return conflict_response()
+    if game_session.pending_payout:
+        await credit_payout(game_session)
+    
+    if action.action == "new_game":
+        journal.hand_dealt(game_session, reshuffled)
+    elif action.action == "hit":
+        journal.hit(game_session)
+        if game_session.game_status == "player_bust":
+            journal.outcome(game_session, 0)
+            play_stats.record(game_session.player_id, "player_bust", game_session.bet_amount,
+                              0, game_session.balance)
+            hand_export.game_finished(game_session, 0)
+    elif action.action == "stand":
+        journal.stand(game_session)
+        journal.outcome(game_session, payout)
+        play_stats.record(game_session.player_id, game_session.game_status, game_session.bet_amount,
+                          payout, game_session.balance)
+        hand_export.game_finished(game_session, payout)
+    if before is not None:
+        return game_delta(before, game_session)
+    return game_session.to_state()
+
+@api_router.get("/game/{game_id}/odds", response_model=Union[Odds, ErrorReply])
+async def game_odds(game_id: str):
+    """Exact bust probability, dealer outcome distribution and hit/stand EV"""
+    game_session = await session_backend.get(game_id)
+    if game_session is None:
+        return {"error": "Game not found"}
+    if game_session.game_status != "playing":
+        return {"error": "Game is not in progress"}
+    
+    # A hand's first query walks the full recursion; keep it off the event loop
+    return await asyncio.to_thread(hand_odds, game_session)
+
+@api_router.get("/game/{game_id}/hint", response_model=Union[Hint, ErrorReply])
+async def game_hint(game_id: str):
+    """The basic strategy play for the current hand"""
+    game_session = await session_backend.get(game_id)
+    if game_session is None:
+        return {"error": "Game not found"}
+    if game_session.game_status != "playing":
+        return {"error": "Game is not in progress"}
+    totals = game_session.player_totals
+    upcard = CARDS[game_session.dealer_cards[0]].value
+    return {
+        "id": game_id,
+        "player_score": totals.best,
+        "soft": totals.soft is not None,
+        "upcard": upcard,
+        "action": basic_action(totals, upcard),
+    }
+
+@api_router.get("/strategy")
+async def get_strategy():
+    """The basic strategy table, one H/S string per total for upcards 2-10, A"""
+    return STRATEGIES["basic"]
+
+@api_router.get("/game/{game_id}", response_model=Union[GameState, ErrorReply])
+async def get_game_state(game_id: str):
+    """Get current game state"""
+    game_session = await load_game(game_id)
+    if game_session is None:
+        return {"error": "Game not found"}
+    
+    if game_session.player_id is not None:
+        # Other games of the same player move the wallet too
+        game_session.balance = await wallet_store.balance(game_session.player_id)
+    return game_session.to_state()
+
+@api_router.get("/players/{player_id}/wallet", response_model=Wallet)
+async def player_wallet(player_id: Annotated[str, PathParam(**PLAYER_ID)]):
+    """A player's balance: the starting balance until their wallet is first
+    played from, which this does not create"""
+    return {"player_id": player_id, "balance": await wallet_store.peek(player_id)}
+
+
+@api_router.post("/sim", response_model=Union[SimResult, ErrorReply])
+async def simulate(sim_request: SimRequest):
+    """Monte Carlo EV and outcome rates for a strategy under the house rules"""
+    try:
+        parse_strategy(sim_request.strategy)
+    except (ValueError, TypeError, AttributeError) as exc:
+        return {"error": f"Invalid strategy: {exc}"}
+    return await simulate_in_pool(sim_request.hands, sim_request.strategy,
+                                  sim_request.seed, sim_request.decks or SHOE_DECKS)
+
+BATCH_CHUNK_HANDS = int(os.environ.get('BATCH_CHUNK_HANDS', 5000))
+
+
+@api_router.post("/games/batch", response_model=Union[BatchTotals, ErrorReply],
+                 responses={200: {"content": {"application/x-ndjson": {}}}})
+async def batch_play(batch: BatchRequest):
+    """Play many hands server-side with one strategy, for bots and QA.
+
+    Hands are split into chunks played in the process pool with the same
+    deck, scoring and dealer rules as live games. Returns aggregated results,
+    or with `stream` one NDJSON line per hand followed by the totals.
+    """
+    try:
+        hit_table = parse_strategy(batch.strategy)
+    except (ValueError, TypeError, AttributeError) as exc:
+        return {"error": f"Invalid strategy: {exc}"}
+
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    chunks = [min(BATCH_CHUNK_HANDS, batch.hands - start)
+              for start in range(0, batch.hands, BATCH_CHUNK_HANDS)]
+    seeds = np.random.SeedSequence(batch.seed).generate_state(len(chunks)).tolist()
+    futures = [
+        loop.run_in_executor(pool, play_chunk, hands, hit_table, batch.bet, SHOE_DECKS,
+                             batch.stream, seed)
+        for hands, seed in zip(chunks, seeds)
+    ]
+
+    def totals(counts: dict) -> dict:
+        summary = summarize_simulation(counts)
+        wins = counts["player_win"] + counts["dealer_bust"]
+        losses = counts["dealer_win"] + counts["player_bust"]
+        return dict(summary, bet=batch.bet, net=batch.bet * (wins - losses))
+
+    if not batch.stream:
+        results = await asyncio.gather(*futures)
+        return totals({outcome: sum(r["counts"][outcome] for r in results) for outcome in PAYOFFS})
+
+    async def lines():
+        counts = dict.fromkeys(PAYOFFS, 0)
+        hand = 0
+        try:
+            for future in futures:
+                result = await future
+                for record in result["hands"]:
+                    hand += 1
+                    yield json.dumps({"hand": hand, **record}) + "\n"
+                for outcome, count in result["counts"].items():
+                    counts[outcome] += count
+            yield json.dumps({"totals": totals(counts)}) + "\n"
+        finally:
+            for future in futures:
+                future.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@api_router.websocket("/ws/game")
+async def game_socket(websocket: WebSocket):
+    """Play over one persistent connection instead of a POST per action.
+
+    Each message is a JSON object with an `action` of new_game, bet, hit,
+    stand or next_hand, plus `game_id` (defaults to the last game on this
+    connection), `amount` for bets and an optional `player_id` for new_game.
+    An optional `id` is echoed back for correlation. The
+    server answers every message with the updated state, or an error. Hit
+    and stand accept `compact: true` to get a delta instead of the state.
+    """
+    await websocket.accept()
+    current_game_id = None
+    try:
+        while True:
+            try:
+                message = SocketMessage.model_validate(await websocket.receive_json())
+                action = message.action
+                game_id = message.game_id or current_game_id
+                wait = admission.take(websocket.scope, "create" if action == "new_game" else "action")
+                if wait:
+                    result = throttled(wait)
+                elif action == "new_game":
+                    result = await new_game(message.player_id)
+                elif game_id is None:
+                    result = {"error": "Game not found"}
+                elif action == "bet":
+                    result = await place_bet(game_id, BetRequest.model_validate({"amount": message.amount}))
+                elif action in ("hit", "stand"):
+                    result = await game_action(game_id, GameAction(action=action, compact=message.compact))
+                elif action == "next_hand":
+                    result = await game_action(game_id, GameAction(action="new_game"))
+                else:
+                    result = {"error": f"Unknown action: {action}"}
+            except (ValidationError, ValueError) as exc:
+                await websocket.send_json({"type": "error", "error": f"Invalid message: {exc}"})
+                continue
+
+            reply = {"id": message.id}
+            if isinstance(result, GameState):
+                current_game_id = result.id
+                reply.update(type="state", state=result)
+            elif isinstance(result, JSONResponse):
+                reply.update(type="error", status=result.status_code,
+                             **json.loads(result.body))
+            elif "error" not in result:
+                reply.update(type="delta", delta=result)
+            else:
+                reply.update(type="error", **result)
+            await websocket.send_text(encode_json(reply).decode())
+    except WebSocketDisconnect:
+        pass
+
+
+# Tables
+# A table seats up to TABLE_SEATS players against one dealer hand, dealt
+# from one shared shoe. A round goes: seats bet, someone deals, each seat in
+# the round hits or stands in any order (or is stood for once
+# TABLE_TURN_SECONDS are up), and once the last one is done the dealer
+# plays a single time and every seat is settled against that hand.
+# Tables live in this process only, next to the WebSockets watching them.
+# A table evicted or expired from table_sessions is closed and the wallet
+# stakes still in play at it refunded (close_table).
+TABLE_SEATS = 7
+TABLE_DECKS = min(8, max(1, int(os.environ.get('TABLE_DECKS', 6))))
+# Seats still playing this long after the deal are stood for, so one idle
+# player cannot hold up the round for the whole table
+TABLE_TURN_SECONDS = float(os.environ.get('TABLE_TURN_SECONDS', 30))
+SEAT_DONE = ("stood", "player_bust")
+
+
+class Seat:
+    __slots__ = ("player_id", "balance", "bet_amount", "bet_round", "cards", "totals", "status")
+
+    def __init__(self, player_id: Optional[str], balance: float):
+        self.player_id = player_id
+        self.balance = balance
+        self.bet_amount = 0.0
+        self.bet_round = 0  # the round bet_amount is staked on
+        self.cards = bytearray()
+        self.totals = HandTotals()
+        self.status = "waiting"  # waiting, ready, playing, stood, then the hand's outcome
+
+
+class Table:
+    """A table as held in table_sessions; cards are indices into CARDS"""
+
+    __slots__ = ("id", "seats", "dealer_cards", "dealer_totals", "phase", "round", "version",
+                 "created_at", "deck", "shoe_size", "shoe_seed", "shoe_rng", "lock", "turn_timer")
+
+    def __init__(self, id: str, deck: bytearray, shoe_seed: int, shoe_rng: str):
+        self.id = id
+        self.seats: List[Optional[Seat]] = [None] * TABLE_SEATS
+        self.dealer_cards = bytearray()
+        self.dealer_totals = HandTotals()  # upcard only while playing
+        self.phase = "betting"  # betting, playing, closed once dropped from table_sessions
+        self.round = 0
+        self.version = 0
+        self.created_at = datetime.utcnow()
+        self.deck = deck
+        self.shoe_size = len(deck)
+        self.shoe_seed = shoe_seed
+        self.shoe_rng = shoe_rng
+        self.lock = asyncio.Lock()  # held across wallet calls so actions apply one at a time
+        self.turn_timer: Optional[asyncio.Task] = None  # see turn_timeout
+
+    def in_round(self) -> List[tuple]:
+        """(seat number, seat) for the seats dealt into the current round"""
+        return [(number, seat) for number, seat in enumerate(self.seats)
+                if seat is not None and seat.bet_round == self.round and seat.cards]
+
+    def to_state(self) -> TableState:
+        playing = self.phase == "playing"
+        return TableState.model_construct(
+            id=self.id,
+            phase=self.phase,
+            round=self.round,
+            seats=[
+                None if seat is None else SeatState.model_construct(
+                    seat=number, player_id=seat.player_id, balance=seat.balance,
+                    bet_amount=seat.bet_amount, cards=[CARDS[i] for i in seat.cards],
+                    score=seat.totals.best, status=seat.status,
+                )
+                for number, seat in enumerate(self.seats)
+            ],
+            # The hole card stays hidden until the dealer plays
+            dealer_cards=[CARDS[i] for i in (self.dealer_cards[:1] if playing else self.dealer_cards)],
+            dealer_score=self.dealer_totals.best,
+            version=self.version,
+            created_at=self.created_at,
+        )
+
+
+class TableHub:
+    """WebSockets watching each table.
+
+    Every change is serialized once and the same text queued for all of
+    them, without waiting on any socket, so handlers can publish while they
+    hold the table lock. A sender task per socket writes its queue out in
+    order, replies to its own messages included. A socket more than
+    `max_queue` messages behind, or whose send takes over `send_timeout`
+    seconds, is closed.
+    """
+
+    def __init__(self, max_queue: int, send_timeout: float):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self._watchers: Dict[str, Dict[WebSocket, asyncio.Queue]] = {}
+        self.broadcasts = 0
+        self.dropped = 0
+
+    def watch(self, table_id: str, websocket: WebSocket) -> asyncio.Task:
+        """Start sending to `websocket`; the task ends once it is unwatched"""
+        queue: asyncio.Queue[Optional[str]] = asyncio.Queue()
+        self._watchers.setdefault(table_id, {})[websocket] = queue
+        return asyncio.create_task(self._sender(table_id, websocket, queue))
+
+    def unwatch(self, table_id: str, websocket: WebSocket):
+        watchers = self._watchers.get(table_id)
+        if watchers is None or websocket not in watchers:
+            return
+        watchers.pop(websocket).put_nowait(None)
+        if not watchers:
+            del self._watchers[table_id]
+
+    def send(self, table_id: str, websocket: WebSocket, message: str):
+        queue = self._watchers.get(table_id, {}).get(websocket)
+        if queue is None:
+            return
+        if queue.qsize() >= self.max_queue:
+            # Too far behind to catch up: skip the backlog and close it
+            self.dropped += 1
+            while not queue.empty():
+                queue.get_nowait()
+            self.unwatch(table_id, websocket)
+        else:
+            queue.put_nowait(message)
+
+    def publish(self, table: Table, state: TableState):
+        watchers = self._watchers.get(table.id)
+        if not watchers:
+            return
+        message = encode_json({"type": "table", "table": state}).decode()
+        self.broadcasts += 1
+        for websocket in list(watchers):
+            self.send(table.id, websocket, message)
+
+    async def _sender(self, table_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        try:
+            while (message := await queue.get()) is not None:
+                await asyncio.wait_for(websocket.send_text(message), self.send_timeout)
+        except Exception:
+            self.unwatch(table_id, websocket)
+        if websocket.client_state == WebSocketState.CONNECTED:
+            # Dropped rather than gone: its receive loop then ends with a disconnect
+            try:
+                await asyncio.wait_for(websocket.close(), self.send_timeout)
+            except Exception:
+                pass
+
+
+async def close_table(table: Table):
+    """Refund the wallet stakes still in play at a table that was evicted or
+    expired, and close it to the handlers that looked it up before that"""
+    global tables_refunded
+    async with table.lock:
+        if table.phase == "closed":
+            return
+        if table.turn_timer is not None:
+            table.turn_timer.cancel()
+            table.turn_timer = None
+        for number, seat in enumerate(table.seats):
+            if seat is None:
+                continue
+            # As leave_table: a bet on the next round, or on this one until it is settled
+            staked = seat.bet_round > table.round or (
+                seat.bet_round == table.round and table.phase == "playing")
+            if staked and seat.player_id is not None:
+                key = f"{table.id}:{seat.bet_round}:{number}:refund"
+                seat.balance, _ = await wallet_store.apply(seat.player_id, seat.bet_amount, key,
+                                                           "refund", table.id)
+                tables_refunded += 1
+        table.phase = "closed"
+        changed(table)
+
+
+_closing_tables: Set[asyncio.Task] = set()  # close_table tasks, held until they finish
+tables_refunded = 0  # wallet stakes refunded by close_table
+
+
+def table_dropped(table: Table):
+    task = asyncio.get_running_loop().create_task(close_table(table))
+    _closing_tables.add(task)
+    task.add_done_callback(_closing_tables.discard)
+
+
+table_sessions = SessionStore(
+    max_size=int(os.environ.get('TABLE_MAX_SIZE', 10_000)),
+    ttl_seconds=float(os.environ.get('SESSION_TTL_SECONDS', 3600)),
+    sweep_interval=float(os.environ.get('SESSION_SWEEP_INTERVAL', 30)),
+    on_evict=table_dropped,
+)
+table_shoe_pool = shoe_pool if TABLE_DECKS == SHOE_DECKS else ShoePool(
+    TABLE_DECKS, size=int(os.environ.get('SHOE_POOL_SIZE', 8)))
+table_hub = TableHub(
+    max_queue=int(os.environ.get('TABLE_SOCKET_QUEUE', 64)),
+    send_timeout=float(os.environ.get('TABLE_SOCKET_SEND_TIMEOUT', 5)),
+)
+METRIC_GAUGES.extend([
+    ("blackjack_tables_live", "gauge", "Tables held in this process", lambda: len(table_sessions)),
+    ("blackjack_table_refunds_total", "counter", "Stakes refunded from tables evicted or expired",
+     lambda: tables_refunded),
+    ("blackjack_table_broadcasts_total", "counter", "Table states sent to watching sockets",
+     lambda: table_hub.broadcasts),
+    ("blackjack_table_sockets_dropped_total", "counter", "Table sockets closed for falling behind",
+     lambda: table_hub.dropped),
+])
+
+
+def changed(table: Table) -> TableState:
+    """Bump the table version and queue the new state for everyone watching"""
+    table.version += 1
+    state = table.to_state()
+    table_hub.publish(table, state)
+    return state
+
+
+def table_seat(table_id: str, seat: int):
+    """(table, None), or an error reply in place of None.
+
+    Handlers check the seat is still taken again once they hold the table
+    lock, since a leave may have got the lock first.
+    """
+    table = table_sessions.get(table_id)
+    if table is None:
+        return None, {"error": "Table not found"}
+    if not 0 <= seat < TABLE_SEATS or table.seats[seat] is None:
+        return table, {"error": "Seat is empty"}
+    return table, None
+
+
+async def turn_timeout(table: Table, round: int):
+    """Stand for every seat still playing `round` after TABLE_TURN_SECONDS"""
+    await asyncio.sleep(TABLE_TURN_SECONDS)
+    async with table.lock:
+        if table.round != round or table.phase != "playing":
+            return
+        for _, seat in table.in_round():
+            if seat.status == "playing":
+                seat.status = "stood"
+        await settle_round(table)
+        changed(table)
+
+
+async def settle_round(table: Table):
+    """Play the dealer hand once and pay every seat in the round against it"""
+    if table.turn_timer is not None and table.turn_timer is not asyncio.current_task():
+        table.turn_timer.cancel()
+    table.turn_timer = None
+    seats = table.in_round()
+    if any(seat.status == "stood" for _, seat in seats):
+        start = time.perf_counter()
+        table.dealer_totals = dealer_play_codes(table.dealer_cards, table.deck)
+        DEALER_PLAY_TIMER.observe(time.perf_counter() - start)
+    else:
+        # Everyone busted: the dealer only turns the hole card over
+        table.dealer_totals = HandTotals.of(CARDS[i] for i in table.dealer_cards)
+    dealer_score = table.dealer_totals.best
+    for number, seat in seats:
+        if seat.status == "stood":
+            if dealer_score > 21:
+                seat.status = "dealer_bust"
+            else:
+                seat.status = determine_winner(seat.totals.best, dealer_score)
+        payout = seat.bet_amount * (1 + PAYOFFS[seat.status])
+        if payout and seat.player_id is None:
+            seat.balance += payout
+        elif payout:
+            key = f"{table.id}:{table.round}:{number}:payout"
+            seat.balance, _ = await wallet_store.apply(seat.player_id, payout, key, "payout", table.id)
+        play_stats.record(seat.player_id, seat.status, seat.bet_amount, payout, seat.balance)
+        hand_export.seat_finished(table, number, payout)
+    table.phase = "betting"
+
+
+@api_router.post("/tables", response_model=TableState)
+async def create_table():
+    """Open a table with TABLE_SEATS empty seats and a fresh shoe"""
+    shoe_seed, deck = table_shoe_pool.take()
+    table = Table(str(uuid.uuid4()), deck, shoe_seed, table_shoe_pool.rng)
+    table_sessions[table.id] = table
+    return table.to_state()
+
+@api_router.get("/tables/{table_id}", response_model=Union[TableState, ErrorReply])
+async def get_table(table_id: str):
+    table = table_sessions.get(table_id)
+    if table is None:
+        return {"error": "Table not found"}
+    return table.to_state()
+
+@api_router.post("/tables/{table_id}/seats", response_model=Union[SeatJoined, ErrorReply])
+async def join_table(table_id: str, join: JoinRequest):
+    """Take the first free seat, playing from `player_id`'s wallet if given"""
+    table = table_sessions.get(table_id)
+    if table is None:
+        return {"error": "Table not found"}
+    async with table.lock:
+        if None not in table.seats:
+            return {"error": "Table is full"}
+        balance = STARTING_BALANCE
+        if join.player_id is not None:
+            balance = await wallet_store.balance(join.player_id)
+        number = table.seats.index(None)
+        table.seats[number] = Seat(join.player_id, balance)
+        return {"seat": number, "table": changed(table)}
+
+@api_router.delete("/tables/{table_id}/seats/{seat}", response_model=Union[TableState, ErrorReply])
+async def leave_table(table_id: str, seat: int):
+    table, error = table_seat(table_id, seat)
+    if error:
+        return error
+    async with table.lock:
+        player = table.seats[seat]
+        if player is None:
+            return {"error": "Seat is empty"}
+        # A bet on the next round, or on this one until it is settled
+        if player.bet_round > table.round or (player.bet_round == table.round and table.phase == "playing"):
+            return {"error": "Seat has a bet in play"}
+        table.seats[seat] = None
+        return changed(table)
+
+@api_router.post("/tables/{table_id}/seats/{seat}/bet", response_model=Union[TableState, ErrorReply])
+async def table_bet(table_id: str, seat: int, bet_request: BetRequest):
+    """Stake a bet on the next round"""
+    table, error = table_seat(table_id, seat)
+    if error:
+        return error
+    async with table.lock:
+        player = table.seats[seat]
+        if player is None:
+            return {"error": "Seat is empty"}
+        amount = bet_request.amount
+        next_round = table.round + 1
+        if table.phase != "betting":
+            return {"error": "Round is in progress"}
+        if player.bet_round == next_round:
+            if player.bet_amount == amount:
+                return table.to_state()  # a retried request, already applied
+            return {"error": "Bet already placed"}
+        if amount > player.balance:
+            return {"error": "Insufficient balance"}
+        if player.player_id is None:
+            player.balance -= amount
+        else:
+            key = f"{table_id}:{next_round}:{seat}:bet"
+            balance, _ = await wallet_store.apply(player.player_id, -amount, key, "bet", table_id)
+            if balance is None:
+                return {"error": "Insufficient balance"}
+            player.balance = balance
+        player.bet_amount = amount
+        player.bet_round = next_round
+        player.cards = bytearray()
+        player.totals = HandTotals()
+        player.status = "ready"
+        return changed(table)
+
+@api_router.post("/tables/{table_id}/deal", response_model=Union[TableState, ErrorReply])
+async def table_deal(table_id: str):
+    """Deal the next round to every seat with a bet on it"""
+    table = table_sessions.get(table_id)
+    if table is None:
+        return {"error": "Table not found"}
+    async with table.lock:
+        if table.phase != "betting":
+            return {"error": "Round is in progress"}
+        seats = [seat for seat in table.seats if seat is not None and seat.bet_round == table.round + 1]
+        if not seats:
+            return {"error": "No bets placed"}
+        if len(table.deck) < shoe_cut_point(table.shoe_size, hands=len(seats) + 1):
+            table.shoe_seed, table.deck = table_shoe_pool.take()
+            table.shoe_rng = table_shoe_pool.rng
+            table.shoe_size = len(table.deck)
+        table.round += 1
+        for seat in table.seats:
+            if seat is not None and seat not in seats:
+                seat.cards, seat.totals, seat.status = bytearray(), HandTotals(), "waiting"
+        # One card each, dealer included, then a second round of cards
+        deck = table.deck
+        table.dealer_cards = bytearray()
+        for seat in seats:
+            seat.cards = bytearray((deck.pop(),))
+        table.dealer_cards.append(deck.pop())
+        for seat in seats:
+            seat.cards.append(deck.pop())
+            seat.totals = HandTotals.of(CARDS[i] for i in seat.cards)
+            seat.status = "playing"
+        table.dealer_cards.append(deck.pop())
+        table.dealer_totals = HandTotals.of((CARDS[table.dealer_cards[0]],))
+        table.phase = "playing"
+        table.turn_timer = asyncio.create_task(turn_timeout(table, table.round))
+        SHOE_REMAINING.labels().observe(len(deck))
+        return changed(table)
+
+@api_router.post("/tables/{table_id}/seats/{seat}/action",
+                 response_model=Union[TableState, ErrorReply])
+async def table_action(table_id: str, seat: int, action: GameAction):
+    """Hit or stand for one seat; the last seat to finish triggers the dealer"""
+    table, error = table_seat(table_id, seat)
+    if error:
+        return error
+    async with table.lock:
+        player = table.seats[seat]
+        if player is None:
+            return {"error": "Seat is empty"}
+        if table.phase != "playing" or player.status != "playing":
+            return {"error": "Seat is not in play"}
+        if action.action == "hit":
+            code = table.deck.pop()
+            player.cards.append(code)
+            player.totals.add(CARDS[code])
+            if player.totals.best > 21:
+                player.status = "player_bust"
+        elif action.action == "stand":
+            player.status = "stood"
+        else:
+            return {"error": f"Unknown action: {action.action}"}
+        if all(other.status in SEAT_DONE for _, other in table.in_round()):
+            await settle_round(table)
+        return changed(table)
+
+
+@api_router.websocket("/ws/tables/{table_id}")
+async def table_socket(websocket: WebSocket, table_id: str):
+    """Watch a table and play at it over one connection.
+
+    The current state is sent on connect, then again to every watcher after
+    each change, whoever made it. Messages take an `action` of join, leave,
+    bet, deal, hit or stand, with `seat` (defaults to the seat joined on this
+    connection), `amount` for bets and `player_id` for join. Successful
+    messages are acknowledged with their `id`; errors go only to the sender.
+    """
+    await websocket.accept()
+    table = table_sessions.get(table_id)
+    if table is None:
+        await websocket.send_json({"type": "error", "error": "Table not found"})
+        await websocket.close()
+        return
+    # Everything after this goes through the hub, to keep replies in order with states
+    table_hub.watch(table_id, websocket)
+    table_hub.send(table_id, websocket, encode_json({"type": "table", "table": table.to_state()}).decode())
+    my_seat = None
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+                action = message.get("action")
+                seat = message.get("seat", my_seat)
+                wait = admission.take(websocket.scope, "action")
+                if wait:
+                    result = throttled(wait)
+                elif action == "join":
+                    result = await join_table(table_id, JoinRequest(player_id=message.get("player_id")))
+                elif action == "deal":
+                    result = await table_deal(table_id)
+                elif seat is None:
+                    result = {"error": "Seat is empty"}
+                elif action == "leave":
+                    result = await leave_table(table_id, seat)
+                elif action == "bet":
+                    result = await table_bet(table_id, seat, BetRequest(amount=message.get("amount")))
+                elif action in ("hit", "stand"):
+                    result = await table_action(table_id, seat, GameAction(action=action))
+                else:
+                    result = {"error": f"Unknown action: {action}"}
+            except (ValueError, AttributeError, TypeError) as exc:
+                reply = {"type": "error", "error": f"Invalid message: {exc}"}
+                table_hub.send(table_id, websocket, encode_json(reply).decode())
+                continue
+
+            reply = {"id": message.get("id")}
+            if isinstance(result, dict) and "error" in result:
+                reply.update(type="error", **result)
+            else:
+                reply.update(type="ack")
+                if action == "join":
+                    my_seat = reply["seat"] = result["seat"]
+                elif action == "leave":
+                    my_seat = None
+            table_hub.send(table_id, websocket, encode_json(reply).decode())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        table_hub.unwatch(table_id, websocket)
+
+
+# Include the router in the main app
 app.include_router(api_router)
+if ADMIN_TOKEN is not None:
+    app.include_router(admin_router)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of latency histograms and gauges"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
+if SLOW_REQUEST_MS is not None:
+    app.add_middleware(SlowRequestMiddleware)
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -233,6 +3987,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -241,6 +3996,69 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+@app.get("/healthz", include_in_schema=False)
+async def liveness():
+    """The process is up and its event loop is answering"""
+    return {"status": "alive"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readiness():
+    """Warmed up, and MongoDB answers a ping when the session backend uses it"""
+    checks = {"warm": getattr(app.state, "ready", False)}
+    if os.environ.get('SESSION_BACKEND', 'mongo') in ('mongo', 'shared'):
+        try:
+            await asyncio.wait_for(mongo_client().admin.command("ping"), timeout=2)
+            checks["mongo"] = True
+        except Exception as exc:
+            logger.warning("Readiness check could not reach MongoDB: %s", exc)
+            checks["mongo"] = False
+    ready = all(checks.values())
+    return JSONResponse(status_code=200 if ready else 503,
+                        content={"status": "ready" if ready else "not ready", "checks": checks})
+
+
+if __name__ == "__main__":
+    import typer
+
+    cli = typer.Typer(help="Blackjack backend tools")
+
+    @cli.callback()
+    def main():
+        pass
+
+    @cli.command()
+    def sim(hands: int = 1_000_000, strategy: Optional[Path] = None, seed: Optional[int] = None,
+            decks: int = SHOE_DECKS):
+        """Simulate HANDS hands and print EV, variance and outcome rates"""
+        spec = json.loads(strategy.read_text()) if strategy else None
+        start = time.perf_counter()
+        summary = asyncio.run(simulate_in_pool(hands, spec, seed, decks))
+        summary["hands_per_second"] = round(hands / (time.perf_counter() - start))
+        print(json.dumps(summary, indent=2))
+
+    @cli.command()
+    def shoe(seed: str, rng: str = SHUFFLE_RNG, decks: int = SHOE_DECKS):
+        """Print the cards of the shoe shuffled from SEED (hex, as stored with a game)"""
+        print(" ".join(CARD_CODES[i] for i in reversed(shuffled_indices(decks, int(seed, 16), rng))))
+
+    @cli.command()
+    def journal_audit(directory: Path, replay: bool = False):
+        """Outcome totals of the hands since a journal's last checkpoint, optionally replaying each game"""
+        start = time.perf_counter()
+        records = outcomes = 0
+        counts = np.zeros(len(OUTCOMES), dtype=np.int64)
+        paid = 0.0
+        for segment in journal_segments(directory):
+            records += len(segment)
+            done = segment[segment["event"] == EVENT_OUTCOME]
+            outcomes += len(done)
+            counts += np.bincount(done["count"], minlength=len(OUTCOMES))
+            paid += np.ascontiguousarray(done["payload"]).view("<f8")[:, 0].sum()
+        summary = {"records": records, "hands": outcomes, "paid_out": paid,
+                   "outcomes": dict(zip(OUTCOMES, counts.tolist()))}
+        if replay:
+            summary["games_replayed"] = len(replay_journal(directory))
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        print(json.dumps(summary, indent=2))
+
+    cli()
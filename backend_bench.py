@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for the Blackjack backend
+Runs in-process against backend/server.py, no network or database needed.
+SESSION_BACKEND defaults to memory; set it to shared-local to run the shared
+backend against the in-process stand-in for MongoDB. Per-client rate limits
+are off unless RATE_LIMIT_CREATE / RATE_LIMIT_ACTIONS are set.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+os.environ.setdefault("SESSION_BACKEND", "memory")
+# Every simulated player shares one client address; measure the game, not the limiter
+os.environ.setdefault("RATE_LIMIT_CREATE", "0")
+os.environ.setdefault("RATE_LIMIT_ACTIONS", "0")
+
+import server  # noqa: E402
+from server import Card  # noqa: E402
+
+
+def legacy_create_deck(decks=1):
+    """create_deck as it was before the shared card table (baseline)"""
+    suits = ['hearts', 'diamonds', 'clubs', 'spades']
+    ranks = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K']
+    deck = []
+    for suit in suits:
+        for rank in ranks:
+            if rank == 'A':
+                value = 11
+            elif rank in ['J', 'Q', 'K']:
+                value = 10
+            else:
+                value = int(rank)
+            deck.append(Card(suit=suit, rank=rank, value=value, display=rank))
+    random.shuffle(deck)
+    return deck
+
+
+def timeit(fn, iterations: int) -> float:
+    """Run fn `iterations` times and return calls per second"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - start)
+
+
+def run_async(coro_fn, iterations: int) -> float:
+    """Await coro_fn() `iterations` times on one loop and return calls per second"""
+    async def loop():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await coro_fn()
+        return iterations / (time.perf_counter() - start)
+
+    return asyncio.run(loop())
+
+
+def bench_new_game(args) -> dict:
+    """Deck construction and full new_game handler throughput, before and after.
+
+    The new_game baseline deals without the shoe pool: each game shuffles
+    its own shoe with random.Random when it starts, as before the pool and
+    the batched PCG64 shuffler. The shuffle is a small part of the handler
+    for a single deck; run with SHOE_DECKS=6 to see it at casino shoe sizes.
+    """
+    iterations = args.iterations
+    results = {
+        "create_deck": {
+            "before": timeit(legacy_create_deck, iterations),
+            "after": timeit(server.create_deck, iterations),
+        }
+    }
+
+    class UnpooledShoes:
+        rng = "mt"
+
+        def take(self):
+            seed = server.new_shoe_seed()
+            return seed, bytearray(server.shuffled_indices(server.SHOE_DECKS, seed, rng=self.rng))
+
+    current = server.shoe_pool
+    try:
+        server.shoe_pool = UnpooledShoes()
+        before = run_async(server.new_game, iterations)
+    finally:
+        server.shoe_pool = current
+    server.game_sessions.clear()
+    after = run_async(server.new_game, iterations)
+    server.game_sessions.clear()
+    results["new_game"] = {"before": before, "after": after}
+    return results
+
+
+def bench_shuffle(args) -> dict:
+    """Shoes per second from each shuffler, and batch play with per-shoe
+    Mersenne shuffles versus one batched PCG64 stream"""
+    iterations = args.iterations
+    size = len(server.CARDS) * server.SHOE_DECKS
+    results = {}
+    for name, shuffler in server.SHUFFLERS.items():
+        seeds = [server.new_shoe_seed() for _ in range(iterations)]
+        start = time.perf_counter()
+        orders = [shuffler.shuffle(seed, size) for seed in seeds]
+        single = iterations / (time.perf_counter() - start)
+        start = time.perf_counter()
+        batch = shuffler.shuffle_many(iterations, size)
+        batched = iterations / (time.perf_counter() - start)
+        # Every seed must replay to the same shoe, whether dealt alone or in a batch
+        pairs = batch[:100] + list(zip(seeds, orders))[:100]
+        if any(shuffler.shuffle(seed, size) != order for seed, order in pairs):
+            raise AssertionError(f"{name} shuffle does not replay from its seed")
+        if sorted(batch[0][1]) != list(range(size)):
+            raise AssertionError(f"{name} shuffle is not a permutation")
+        results[name] = {"single_per_second": single, "batch_per_second": batched}
+
+    hit_table = server.parse_strategy("basic")
+    current = server.shoe_stream
+    try:
+        server.shoe_stream = lambda seed, decks: iter(lambda: server.create_deck(decks, rng="mt"), None)
+        start = time.perf_counter()
+        server.play_chunk(iterations, hit_table, 1.0, server.SHOE_DECKS, False)
+        before = iterations / (time.perf_counter() - start)
+    finally:
+        server.shoe_stream = current
+    start = time.perf_counter()
+    server.play_chunk(iterations, hit_table, 1.0, server.SHOE_DECKS, False)
+    after = iterations / (time.perf_counter() - start)
+    first = server.play_chunk(1000, hit_table, 1.0, server.SHOE_DECKS, True, seed=1)
+    if server.play_chunk(1000, hit_table, 1.0, server.SHOE_DECKS, True, seed=1) != first:
+        raise AssertionError("play_chunk does not replay from its seed")
+    results["play_chunk"] = {"before": before, "after": after}
+    return results
+
+
+def bench_sim(args) -> dict:
+    """Vectorized simulator against the scalar play_hand, on identical decks"""
+    iterations = args.iterations
+    import numpy as np
+
+    hit_table = server.parse_strategy()
+    decks = [server.shuffled_indices() for _ in range(iterations)]
+    outcomes = list(server.PAYOFFS)
+
+    start = time.perf_counter()
+    scalar = [outcomes.index(server.play_hand([server.CARDS[i] for i in deck], hit_table).status)
+              for deck in decks]
+    scalar_rate = iterations / (time.perf_counter() - start)
+
+    # deck.pop() deals from the end, so deal order is the reversed deck
+    cards = server.CARD_VALUES[np.array(decks)[:, ::-1]]
+    start = time.perf_counter()
+    vectorized = server.simulate_batch(cards, hit_table)
+    vector_rate = iterations / (time.perf_counter() - start)
+
+    mismatches = int((vectorized != np.array(scalar)).sum())
+    if mismatches:
+        raise AssertionError(f"simulate_batch disagrees with play_hand on {mismatches} hands")
+    return {"hands": {"before": scalar_rate, "after": vector_rate}}
+
+
+def bench_odds(args) -> dict:
+    """hand_odds on fresh hands (cold memo) versus repeated queries (warm)"""
+    iterations = args.iterations
+    hands = max(1, iterations // 100)
+    sessions = []
+    for seed, deck in server.create_shoes(hands, server.SHOE_DECKS):
+        session = server.GameSession(str(seed), deck, seed, server.SHUFFLE_RNG)
+        server.start_hand(session)
+        sessions.append(session)
+
+    server.exact_odds.cache_clear()
+    start = time.perf_counter()
+    for session in sessions:
+        server.hand_odds(session)
+    cold = hands / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for session in sessions:
+        server.hand_odds(session)
+    warm = hands / (time.perf_counter() - start)
+    return {"queries": {"before": cold, "after": warm}}
+
+
+def bench_totals(args) -> dict:
+    """Scoring a hand card by card: rescanning with calculate_score vs HandTotals"""
+    iterations = args.iterations
+    hands = [server.create_deck()[:6] for _ in range(iterations)]
+
+    start = time.perf_counter()
+    for cards in hands:
+        for i in range(2, len(cards) + 1):
+            server.calculate_score(cards[:i])
+    before = iterations / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for cards in hands:
+        totals = server.HandTotals.of(cards[:2])
+        for card in cards[2:]:
+            totals.add(card)
+            totals.best
+    after = iterations / (time.perf_counter() - start)
+    return {"six_card_hands": {"before": before, "after": after}}
+
+
+class RescanTotals:
+    """HandTotals as before it was incremental: each card rescans the hand"""
+
+    def __init__(self, hard: int = 0, soft=None):
+        self.cards = []
+        self.hard, self.soft = hard, soft
+
+    @classmethod
+    def of(cls, cards):
+        totals = cls()
+        for card in cards:
+            totals.add(card)
+        return totals
+
+    def add(self, card):
+        self.cards.append(card)
+        best = server.calculate_score(self.cards)
+        self.soft = best if server.is_soft(self.cards, best) else None
+        self.hard = best - 10 if self.soft is not None else best
+
+    @property
+    def best(self) -> int:
+        return self.hard if self.soft is None else self.soft
+
+
+def bench_action(args) -> dict:
+    """game_action throughput over whole hands (hit below 17, then stand),
+    rescanning each hand (before) vs HandTotals"""
+    iterations = args.iterations
+
+    async def play():
+        game_ids = [(await server.new_game()).id for _ in range(iterations)]
+        hit, stand = server.GameAction(action="hit"), server.GameAction(action="stand")
+        actions = 0
+        start = time.perf_counter()
+        for game_id in game_ids:
+            state = await server.game_action(game_id, hit)
+            actions += 1
+            while state.game_status == "playing" and state.player_score < 17:
+                state = await server.game_action(game_id, hit)
+                actions += 1
+            if state.game_status == "playing":
+                await server.game_action(game_id, stand)
+                actions += 1
+        return actions / (time.perf_counter() - start)
+
+    hand_totals = server.HandTotals
+    server.HandTotals = RescanTotals
+    try:
+        before = asyncio.run(play())
+    finally:
+        server.HandTotals = hand_totals
+    server.game_sessions.clear()
+    after = asyncio.run(play())
+    server.game_sessions.clear()
+    return {"actions_per_second": {"before": before, "after": after}}
+
+
+def resident_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def serialization_samples() -> dict:
+    """One reply of each kind the game endpoints send"""
+    dealt = await server.new_game()
+    await server.place_bet(dealt.id, server.BetRequest(amount=10))
+    hit = server.GameAction(action="hit")
+    finished = await server.game_action(dealt.id, hit)
+    while finished.game_status == "playing":
+        finished = await server.game_action(dealt.id, hit)
+    delta_game = await server.new_game()
+    delta = await server.game_action(delta_game.id, server.GameAction(action="stand", compact=True))
+
+    table = await server.create_table()
+    for seat in range(server.TABLE_SEATS):
+        await server.join_table(table.id, server.JoinRequest())
+        await server.table_bet(table.id, seat, server.BetRequest(amount=10))
+    table = await server.table_deal(table.id)
+    return {"new_game": dealt, "action": finished, "compact_action": delta, "table": table}
+
+
+def bench_serialize(args) -> dict:
+    """Reply bodies per endpoint: jsonable_encoder + JSONResponse vs StateResponse"""
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    iterations = args.iterations
+    results = {}
+    for name, content in asyncio.run(serialization_samples()).items():
+        before_body = JSONResponse(jsonable_encoder(content)).body
+        after_body = server.StateResponse(content).body
+        assert json.loads(before_body) == json.loads(after_body), name
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            JSONResponse(jsonable_encoder(content)).body
+        before = iterations / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            server.StateResponse(content).body
+        after = iterations / (time.perf_counter() - start)
+        results[name] = {"before": before, "after": after}
+    return results
+
+
+COLD_START = """
+import time
+start = time.perf_counter()
+import asyncio, json, sys
+sys.path.insert(0, {backend!r})
+import server
+imported = time.perf_counter()
+import httpx
+
+async def first_requests():
+    entered = time.perf_counter()
+    async with server.app.router.lifespan_context(server.app):
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            request = time.perf_counter()
+            game = (await client.post("/api/game/new")).json()
+            first = time.perf_counter()
+            await client.post(f"/api/game/{{game['id']}}/action", json={{"action": "stand"}})
+            return entered, started, request, first, time.perf_counter()
+
+entered, started, request, first, second = asyncio.run(first_requests())
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - entered) * 1000,
+    "first_request_ms": (first - request) * 1000,
+    "second_request_ms": (second - first) * 1000,
+    "import_to_first_response_ms": (imported - start + started - entered + first - request) * 1000,
+}}))
+"""
+
+
+def bench_cold_start(args) -> dict:
+    """Fresh interpreters: import, lifespan startup and the first requests, medians of 5"""
+    import statistics
+    import subprocess
+
+    script = COLD_START.format(backend=str(Path(__file__).parent / "backend"))
+    runs = []
+    for _ in range(5):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                check=True, env=os.environ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {"cold_start": {key: statistics.median(run[key] for run in runs) for key in runs[0]}}
+
+
+def measure_sessions(count: int, legacy: bool) -> dict:
+    """Resident memory and gc-tracked objects added per live session, mid-hand.
+
+    `legacy` holds each game the way game_sessions did before GameSession: a
+    dict with a GameState and the remaining shoe as a list of Card objects.
+    """
+    import gc
+    import uuid
+
+    store = server.SessionStore(max_size=count, ttl_seconds=3600, sweep_interval=60)
+    gc.collect()
+    rss, objects = resident_bytes(), len(gc.get_objects())
+    for start in range(0, count, 1000):
+        for seed, deck in server.create_shoes(min(1000, count - start), server.SHOE_DECKS):
+            session = server.GameSession(str(uuid.uuid4()), deck, seed, server.SHUFFLE_RNG)
+            server.start_hand(session)
+            if legacy:
+                store[session.id] = {
+                    "game_state": session.to_state(),
+                    "deck": [server.CARDS[i] for i in session.deck],
+                    "shoe_size": session.shoe_size,
+                    "shoe_seed": session.shoe_seed,
+                    "shoe_rng": session.shoe_rng,
+                }
+            else:
+                store[session.id] = session
+    gc.collect()
+    return {"bytes": (resident_bytes() - rss) / count,
+            "objects": (len(gc.get_objects()) - objects) / count}
+
+
+def bench_memory(args) -> dict:
+    """Bytes per live session in game_sessions, before and after GameSession"""
+    import multiprocessing
+
+    results = {}
+    for count in args.sessions:
+        row = {}
+        for label, legacy in (("before", True), ("after", False)):
+            # A fresh process each time, so freed memory is not reused
+            with multiprocessing.get_context("fork").Pool(1) as pool:
+                row[label] = pool.apply(measure_sessions, (count, legacy))
+        results[f"{count:,} sessions"] = {
+            "bytes_before": round(row["before"]["bytes"]),
+            "bytes_after": round(row["after"]["bytes"]),
+            "objects_before": round(row["before"]["objects"], 1),
+            "objects_after": round(row["after"]["objects"], 1),
+        }
+    return results
+
+
+def bench_journal(args) -> dict:
+    """Cost of journaling game_action, then scanning and replaying the journal"""
+    import tempfile
+    import numpy as np
+
+    async def play(games: int) -> float:
+        hit, stand = server.GameAction(action="hit"), server.GameAction(action="stand")
+        bet = server.BetRequest(amount=10)
+        start = time.perf_counter()
+        for _ in range(games):
+            game_id = (await server.new_game()).id
+            state = await server.place_bet(game_id, bet)
+            while state.game_status == "playing" and state.player_score < 17:
+                state = await server.game_action(game_id, hit)
+            if state.game_status == "playing":
+                await server.game_action(game_id, stand)
+        await server.journal.flush()
+        return games / (time.perf_counter() - start)
+
+    games = args.iterations
+    results = {"games": {"before": asyncio.run(play(games))}}
+    current = server.journal
+    with tempfile.TemporaryDirectory() as directory:
+        server.journal = server.EventJournal(Path(directory), segment_bytes=64 << 20,
+                                             fsync_interval=1, max_buffer=1 << 20,
+                                             ttl_seconds=3600)
+        try:
+            results["games"]["after"] = asyncio.run(play(games))
+            server.journal._file.close()
+        finally:
+            server.journal = current
+        server.game_sessions.clear()
+
+        start = time.perf_counter()
+        records = hands = 0
+        for segment in server.journal_segments(directory):
+            records += len(segment)
+            hands += int(np.count_nonzero(segment["event"] == server.EVENT_OUTCOME))
+        results["scan"] = {"records": records, "hands": hands,
+                           "records_per_second": records / (time.perf_counter() - start)}
+
+        start = time.perf_counter()
+        replayed = len(server.replay_journal(directory))
+        results["replay"] = {"games": replayed,
+                             "games_per_second": replayed / (time.perf_counter() - start)}
+    return results
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def play_game(client, latencies: dict, next_hand: bool, player_id=None):
+    """One realistic game: new game, bet, hit below 17, stand, read the state"""
+    async def call(method: str, route: str, url: str, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        latencies[f"{method} {route}"].append(time.perf_counter() - start)
+        response.raise_for_status()
+        return response.json()
+
+    state = await call("POST", "/api/game/new", "/api/game/new",
+                       params={"player_id": player_id} if player_id else None)
+    game_id = state["id"]
+    for hand in range(1 + next_hand):
+        if hand:
+            state = await call("POST", "/api/game/{game_id}/action", f"/api/game/{game_id}/action",
+                               json={"action": "new_game"})
+        await call("POST", "/api/game/{game_id}/bet", f"/api/game/{game_id}/bet", json={"amount": 10})
+        while state["game_status"] == "playing" and state["player_score"] < 17:
+            state = await call("POST", "/api/game/{game_id}/action", f"/api/game/{game_id}/action",
+                               json={"action": "hit"})
+        if state["game_status"] == "playing":
+            state = await call("POST", "/api/game/{game_id}/action", f"/api/game/{game_id}/action",
+                               json={"action": "stand"})
+        await call("GET", "/api/game/{game_id}", f"/api/game/{game_id}")
+
+
+async def run_load(args) -> dict:
+    import httpx
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    latencies = defaultdict(list)
+    remaining = iter(range(args.iterations))
+
+    async def worker(client):
+        for game in remaining:
+            player_id = f"bench-{game % args.players}" if args.players else None
+            await play_game(client, latencies, args.next_hand, player_id)
+
+    async def drive(client):
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        return time.perf_counter() - start
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url) as client:
+            elapsed = await drive(client)
+    else:
+        transport = httpx.ASGITransport(app=server.app)
+        async with server.app.router.lifespan_context(server.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                elapsed = await drive(client)
+
+    results = {}
+    for route, samples in sorted(latencies.items()):
+        samples.sort()
+        results[route] = {
+            "requests": len(samples),
+            "rps": len(samples) / elapsed,
+            "p50_ms": percentile(samples, 0.50) * 1000,
+            "p95_ms": percentile(samples, 0.95) * 1000,
+            "p99_ms": percentile(samples, 0.99) * 1000,
+        }
+    total = sum(len(samples) for samples in latencies.values())
+    results["total"] = {"requests": total, "rps": total / elapsed}
+    return results
+
+
+def bench_load(args) -> dict:
+    """Concurrent game flows through the HTTP stack, per-route latency percentiles"""
+    return asyncio.run(run_load(args))
+
+
+BENCHMARKS = {
+    "new_game": bench_new_game,
+    "shuffle": bench_shuffle,
+    "sim": bench_sim,
+    "odds": bench_odds,
+    "totals": bench_totals,
+    "action": bench_action,
+    "journal": bench_journal,
+    "memory": bench_memory,
+    "serialize": bench_serialize,
+    "load": bench_load,
+    "cold_start": bench_cold_start,
+}
+
+
+def print_results(name: str, results: dict):
+    print(f"\n{name}")
+    for label, row in results.items():
+        if "before" in row and "after" in row:
+            speedup = row["after"] / row["before"]
+            print(f"  {label:<24} before {row['before']:>12,.0f}/s   "
+                  f"after {row['after']:>12,.0f}/s   x{speedup:.2f}")
+        else:
+            print(f"  {label:<24} " + "   ".join(
+                f"{k} {v:,}" if isinstance(v, int) else f"{k} {v:,.2f}" for k, v in row.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK",
+                        help=f"any of {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("-n", "--iterations", type=int, default=20000)
+    parser.add_argument("-c", "--concurrency", type=int, default=32,
+                        help="load: concurrent game flows")
+    parser.add_argument("--url", help="load: base URL of a running server instead of in-process")
+    parser.add_argument("--next-hand", action="store_true",
+                        help="load: play a second hand per game from the same shoe")
+    parser.add_argument("--players", type=int, default=0,
+                        help="load: play from this many wallets instead of anonymous balances")
+    parser.add_argument("--sessions", type=lambda v: [int(n) for n in v.split(",")],
+                        default=[100_000, 1_000_000],
+                        help="memory: comma-separated live session counts")
+    parser.add_argument("--json", type=Path, help="also write results to this file")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    all_results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        all_results[name] = BENCHMARKS[name](args)
+        print_results(name, all_results[name])
+
+    if args.json:
+        args.json.write_text(json.dumps(all_results, indent=2))
@@ -1,21 +1,36 @@
 #!/usr/bin/env python3
 """
 Comprehensive Backend Testing for Blackjack API
-Tests all endpoints and game logic as requested
+Tests all endpoints and game logic as requested.
+
+Runs against the FastAPI app in-process by default (memory session backend,
+no MongoDB or network needed). Pass --url to test a running server instead,
+e.g. --url http://localhost:8001/api
 """
 
+import argparse
+import os
 import requests
 import json
 import sys
+import uuid
+from pathlib import Path
 from typing import Dict, Any
 
-# Use the production URL from frontend/.env
-BASE_URL = "https://d38a9f67-b884-4873-bc8f-c7fdc919a5a8.preview.emergentagent.com/api"
 
 class BlackjackAPITester:
-    def __init__(self):
-        self.base_url = BASE_URL
-        self.session = requests.Session()
+    def __init__(self, base_url: str = None):
+        if base_url:
+            self.base_url = base_url.rstrip("/")
+            self.session = requests.Session()
+        else:
+            sys.path.insert(0, str(Path(__file__).parent / "backend"))
+            os.environ.setdefault("SESSION_BACKEND", "memory")
+            from fastapi.testclient import TestClient
+            from server import app
+
+            self.base_url = "/api"
+            self.session = TestClient(app)
         self.test_results = []
         
     def log_test(self, test_name: str, success: bool, details: str = ""):
@@ -69,8 +84,8 @@ class BlackjackAPITester:
                     self.log_test("New Game Creation", False, f"Player should have 2 cards, got {len(data['player_cards'])}")
                     return None
                     
-                if len(data["dealer_cards"]) != 2:
-                    self.log_test("New Game Creation", False, f"Dealer should have 2 cards, got {len(data['dealer_cards'])}")
+                if len(data["dealer_cards"]) != 1:
+                    self.log_test("New Game Creation", False, f"Only the dealer's upcard should be shown, got {len(data['dealer_cards'])} cards")
                     return None
                     
                 if data["game_status"] != "playing":
@@ -280,6 +295,234 @@ class BlackjackAPITester:
         else:
             self.log_test("Ace Score Calculation", True, "No Aces found in sample games (normal probability)")
             
+    def test_player_wallet(self):
+        """Test GET /api/players/{player_id}/wallet - games of a player share its balance"""
+        try:
+            player_id = f"tester-{uuid.uuid4().hex[:8]}"
+            game = self.session.post(f"{self.base_url}/game/new", params={"player_id": player_id}).json()
+            for _ in range(2):  # a retried bet is only debited once
+                self.session.post(f"{self.base_url}/game/{game['id']}/bet", json={"amount": 100.0})
+            wallet = self.session.get(f"{self.base_url}/players/{player_id}/wallet").json()
+            if wallet != {"player_id": player_id, "balance": 900.0}:
+                self.log_test("Player Wallet", False, f"Expected a balance of 900 after one bet: {wallet}")
+                return False
+
+            second = self.session.post(f"{self.base_url}/game/new", params={"player_id": player_id}).json()
+            if second.get("balance") != 900.0:
+                self.log_test("Player Wallet", False, f"A new game should start from the wallet: {second}")
+                return False
+
+            response = self.session.post(f"{self.base_url}/game/new", params={"player_id": "two words"})
+            if response.status_code != 422:
+                self.log_test("Player Wallet", False, f"Invalid player_id accepted: {response.status_code}")
+                return False
+            self.log_test("Player Wallet", True, f"Balance: {wallet['balance']}")
+            return True
+        except Exception as e:
+            self.log_test("Player Wallet", False, f"Exception: {str(e)}")
+            return False
+
+    def test_table_round(self):
+        """Test /api/tables - two seats bet, are dealt, stand and are settled against one dealer hand"""
+        try:
+            table = self.session.post(f"{self.base_url}/tables").json()
+            url = f"{self.base_url}/tables/{table['id']}"
+            seats = [self.session.post(f"{url}/seats", json={}).json()["seat"] for _ in range(2)]
+            for seat in seats:
+                self.session.post(f"{url}/seats/{seat}/bet", json={"amount": 50.0})
+            table = self.session.post(f"{url}/deal").json()
+            if table.get("phase") != "playing" or len(table["dealer_cards"]) != 1:
+                self.log_test("Table Round", False, f"Deal should show the upcard only: {table}")
+                return False
+            for seat in seats:
+                if table["seats"][seat]["status"] == "playing":
+                    table = self.session.post(f"{url}/seats/{seat}/action", json={"action": "stand"}).json()
+
+            if table.get("phase") != "betting" or len(table["dealer_cards"]) < 2:
+                self.log_test("Table Round", False, f"Round should be settled once every seat stood: {table}")
+                return False
+            payoffs = {"player_win": 1, "dealer_bust": 1, "push": 0, "dealer_win": -1, "player_bust": -1}
+            for seat in seats:
+                state = table["seats"][seat]
+                if state["status"] not in payoffs or state["balance"] != 950.0 + 50.0 * (1 + payoffs[state["status"]]):
+                    self.log_test("Table Round", False, f"Seat {seat} settled wrong: {state}")
+                    return False
+
+            left = self.session.delete(f"{url}/seats/{seats[0]}").json()
+            if left["seats"][seats[0]] is not None:
+                self.log_test("Table Round", False, f"Seat should be empty after leaving: {left}")
+                return False
+            statuses = [table["seats"][seat]["status"] for seat in seats]
+            self.log_test("Table Round", True, f"Dealer: {table['dealer_score']}, seats: {statuses}")
+            return True
+        except Exception as e:
+            self.log_test("Table Round", False, f"Exception: {str(e)}")
+            return False
+
+    def test_session_stats(self):
+        """Test GET /api/sessions/stats - live game count and the store's limits"""
+        try:
+            stats = self.session.get(f"{self.base_url}/sessions/stats").json()
+            if stats.get("live", 0) < 1 or not {"evicted", "expired", "max_size", "ttl_seconds"} <= stats.keys():
+                self.log_test("Session Stats", False, f"Unexpected stats: {stats}")
+                return False
+            self.log_test("Session Stats", True, f"Stats: {stats}")
+            return True
+        except Exception as e:
+            self.log_test("Session Stats", False, f"Exception: {str(e)}")
+            return False
+
+    def test_game_socket(self):
+        """Test /api/ws/game - a hand played over the WebSocket, replies matched by id"""
+        if not hasattr(self.session, "websocket_connect"):
+            print("⏭️ SKIP Game WebSocket (only against the in-process app)")
+            return None
+        try:
+            with self.session.websocket_connect(f"{self.base_url}/ws/game") as websocket:
+                websocket.send_json({"action": "new_game", "id": 1})
+                reply = websocket.receive_json()
+                if reply.get("type") != "state" or reply.get("id") != 1:
+                    self.log_test("Game WebSocket", False, f"Unexpected reply to new_game: {reply}")
+                    return False
+                websocket.send_json({"action": "bet", "amount": 10, "id": 2})
+                websocket.send_json({"action": "stand", "id": 3})
+                replies = [websocket.receive_json() for _ in range(2)]
+                if [r.get("id") for r in replies] != [2, 3] or replies[1]["state"]["game_status"] == "playing":
+                    self.log_test("Game WebSocket", False, f"Unexpected replies: {replies}")
+                    return False
+                websocket.send_json({"action": "fold", "id": 4})
+                if websocket.receive_json().get("type") != "error":
+                    self.log_test("Game WebSocket", False, "An unknown action should be an error")
+                    return False
+            self.log_test("Game WebSocket", True, f"Outcome: {replies[1]['state']['game_status']}")
+            return True
+        except Exception as e:
+            self.log_test("Game WebSocket", False, f"Exception: {str(e)}")
+            return False
+
+    def test_simulation(self):
+        """Test POST /api/sim - seeded Monte Carlo EV and outcome rates for a strategy"""
+        try:
+            request = {"hands": 20000, "strategy": "basic", "seed": 7}
+            result = self.session.post(f"{self.base_url}/sim", json=request).json()
+            rates = result.get("win_rate", 0) + result.get("loss_rate", 0) + result.get("push_rate", 0)
+            if result.get("hands") != 20000 or abs(rates - 1) > 1e-9 or not -0.2 < result["ev"] < 0.1:
+                self.log_test("Simulation", False, f"Unexpected result: {result}")
+                return False
+            again = self.session.post(f"{self.base_url}/sim", json=request).json()
+            if again != result:
+                self.log_test("Simulation", False, f"The same seed should give the same result: {again}")
+                return False
+            invalid = self.session.post(f"{self.base_url}/sim", json={"hands": 10, "strategy": "martingale"}).json()
+            if "Invalid strategy" not in invalid.get("error", ""):
+                self.log_test("Simulation", False, f"Unknown strategy accepted: {invalid}")
+                return False
+            self.log_test("Simulation", True, f"EV: {result['ev']:.4f}")
+            return True
+        except Exception as e:
+            self.log_test("Simulation", False, f"Exception: {str(e)}")
+            return False
+
+    def test_hand_odds(self):
+        """Test GET /api/game/{game_id}/odds - exact probabilities for the live hand"""
+        try:
+            game = self.session.post(f"{self.base_url}/game/new").json()
+            odds = self.session.get(f"{self.base_url}/game/{game['id']}/odds").json()
+            if "error" in odds:
+                self.log_test("Hand Odds", False, f"Error: {odds['error']}")
+                return False
+            total = sum(odds["dealer_final"].values())
+            if abs(total - 1) > 1e-9 or not 0 <= odds["bust_probability"] <= 1:
+                self.log_test("Hand Odds", False, f"Probabilities out of range: {odds}")
+                return False
+            if odds["player_score"] != game["player_score"] or odds["cards_unseen"] % 52 != 49:  # three cards are seen
+                self.log_test("Hand Odds", False, f"Odds are not for this hand: {odds}")
+                return False
+            self.log_test("Hand Odds", True, f"Bust: {odds['bust_probability']:.3f}")
+            return True
+        except Exception as e:
+            self.log_test("Hand Odds", False, f"Exception: {str(e)}")
+            return False
+
+    def test_metrics(self):
+        """Test GET /metrics - Prometheus text with per-route latency histograms"""
+        try:
+            root = self.base_url[:-len("/api")] if self.base_url.endswith("/api") else self.base_url
+            response = self.session.get(f"{root}/metrics")
+            if response.status_code != 200 or "text/plain" not in response.headers.get("content-type", ""):
+                self.log_test("Metrics", False, f"Status: {response.status_code}")
+                return False
+            if 'route="/api/game/{game_id}/bet"' not in response.text:
+                self.log_test("Metrics", False, "No latency histogram for the bet route")
+                return False
+            self.log_test("Metrics", True, f"{len(response.text.splitlines())} lines")
+            return True
+        except Exception as e:
+            self.log_test("Metrics", False, f"Exception: {str(e)}")
+            return False
+
+    def test_batch_play(self):
+        """Test POST /api/games/batch - headless hands as totals, or streamed as NDJSON"""
+        try:
+            request = {"hands": 50, "bet": 2.0, "strategy": "basic", "seed": 3}
+            totals = self.session.post(f"{self.base_url}/games/batch", json=request).json()
+            if totals.get("hands") != 50 or totals.get("bet") != 2.0:
+                self.log_test("Batch Play", False, f"Unexpected totals: {totals}")
+                return False
+            response = self.session.post(f"{self.base_url}/games/batch", json={**request, "stream": True})
+            lines = [json.loads(line) for line in response.text.splitlines()]
+            if len(lines) != 51 or lines[-1]["totals"] != totals:
+                self.log_test("Batch Play", False, f"Stream should be 50 hands then the same totals: {lines[-1]}")
+                return False
+            if sum(line["net"] for line in lines[:-1]) != totals["net"]:
+                self.log_test("Batch Play", False, "Hand results do not add up to the net")
+                return False
+            self.log_test("Batch Play", True, f"Net: {totals['net']}")
+            return True
+        except Exception as e:
+            self.log_test("Batch Play", False, f"Exception: {str(e)}")
+            return False
+
+    def test_strategy_hint(self):
+        """Test GET /api/game/{game_id}/hint against the table from GET /api/strategy"""
+        try:
+            strategy = self.session.get(f"{self.base_url}/strategy").json()
+            game = self.session.post(f"{self.base_url}/game/new").json()
+            hint = self.session.get(f"{self.base_url}/game/{game['id']}/hint").json()
+            if "error" in hint:
+                self.log_test("Strategy Hint", False, f"Error: {hint['error']}")
+                return False
+            # One H/S per upcard 2-10, A
+            plays = strategy["soft" if hint["soft"] else "hard"].get(str(hint["player_score"]), "S" * 10)
+            expected = {"H": "hit", "S": "stand"}[plays[hint["upcard"] - 2]]
+            if hint["action"] != expected:
+                self.log_test("Strategy Hint", False, f"Hint {hint} disagrees with the table: {expected}")
+                return False
+            self.log_test("Strategy Hint", True, f"{hint['player_score']} against {hint['upcard']}: {hint['action']}")
+            return True
+        except Exception as e:
+            self.log_test("Strategy Hint", False, f"Exception: {str(e)}")
+            return False
+
+    def test_stats_and_leaderboard(self):
+        """Test GET /api/stats and /api/leaderboard - aggregates refreshed in the background"""
+        try:
+            stats = self.session.get(f"{self.base_url}/stats").json()
+            outcomes = {"player_win", "dealer_bust", "push", "dealer_win", "player_bust"}
+            if set(stats.get("outcomes", {})) != outcomes or sum(stats["outcomes"].values()) != stats["hands"]:
+                self.log_test("Stats And Leaderboard", False, f"Unexpected stats: {stats}")
+                return False
+            leaderboard = self.session.get(f"{self.base_url}/leaderboard").json()
+            balances = [player["balance"] for player in leaderboard.get("players", [])]
+            if "updated_at" not in leaderboard or balances != sorted(balances, reverse=True):
+                self.log_test("Stats And Leaderboard", False, f"Unexpected leaderboard: {leaderboard}")
+                return False
+            self.log_test("Stats And Leaderboard", True, f"Hands: {stats['hands']}, players: {len(balances)}")
+            return True
+        except Exception as e:
+            self.log_test("Stats And Leaderboard", False, f"Exception: {str(e)}")
+            return False
+
     def run_comprehensive_test(self):
         """Run all tests in sequence"""
         print("=== Starting Comprehensive Blackjack API Tests ===\n")
@@ -307,8 +550,8 @@ class BlackjackAPITester:
         # Test 6: Hit action
         hit_result = self.test_hit_action(game_id)
         
-        # Test 7: Stand action (finish the game)
-        if hit_result:
+        # Test 7: Stand action (finish the game unless the hit busted)
+        if hit_result and hit_result["game_status"] == "playing":
             self.test_stand_action(game_id)
             
         # Test 8: Invalid game ID
@@ -319,9 +562,39 @@ class BlackjackAPITester:
         
         # Test 10: Complete game flow
         self.test_complete_game_flow()
+
+        # Test 11: Player wallets
+        self.test_player_wallet()
+
+        # Test 12: A round at a multi-seat table
+        self.test_table_round()
         
+        # Test 13: Session store stats
+        self.test_session_stats()
+
+        # Test 14: Game WebSocket
+        self.test_game_socket()
+
+        # Test 15: Monte Carlo simulation
+        self.test_simulation()
+
+        # Test 16: Exact odds for the live hand
+        self.test_hand_odds()
+
+        # Test 17: Prometheus metrics
+        self.test_metrics()
+
+        # Test 18: Headless batch play
+        self.test_batch_play()
+
+        # Test 19: Basic strategy hints
+        self.test_strategy_hint()
+
+        # Test 20: Play stats and leaderboard
+        self.test_stats_and_leaderboard()
+
         # Summary
-        self.print_summary()
+        return self.print_summary()
         
     def test_complete_game_flow(self):
         """Test a complete game from start to finish"""
@@ -389,6 +662,10 @@ class BlackjackAPITester:
         return passed == total
 
 if __name__ == "__main__":
-    tester = BlackjackAPITester()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", help="base URL of a running API, e.g. http://localhost:8001/api")
+    args = parser.parse_args()
+
+    tester = BlackjackAPITester(args.url)
     success = tester.run_comprehensive_test()
     sys.exit(0 if success else 1)
\ No newline at end of file
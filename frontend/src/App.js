@@ -1,11 +1,88 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import "./App.css";
 import axios from "axios";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const WS_URL = `${API.replace(/^http/, "ws")}/ws/game`;
+
+// One persistent WebSocket for every game action, reconnected with
+// exponential backoff when it drops; actions go over HTTP while the socket
+// is (re)connecting
+const RECONNECT_BASE_MS = 500;
+const RECONNECT_MAX_MS = 30000;
+
+const useGameSocket = () => {
+  const socketRef = useRef(null);
+  const pendingRef = useRef(new Map());
+  const nextIdRef = useRef(1);
+
+  useEffect(() => {
+    let socket = null;
+    let retryTimer = null;
+    let attempts = 0;
+    let stopped = false;
+
+    const connect = () => {
+      socket = new WebSocket(WS_URL);
+      socket.onopen = () => {
+        attempts = 0;
+      };
+      socket.onmessage = (event) => {
+        const reply = JSON.parse(event.data);
+        const settle = pendingRef.current.get(reply.id);
+        if (settle) {
+          pendingRef.current.delete(reply.id);
+          settle(reply);
+        }
+      };
+      socket.onclose = () => {
+        // Not retried over HTTP: the server may have applied them already
+        pendingRef.current.forEach(settle => settle({ type: "error", error: "Connection closed" }));
+        pendingRef.current.clear();
+        if (stopped) return;
+        // Jittered so clients dropped together do not all reconnect together
+        const delay = Math.min(RECONNECT_MAX_MS, RECONNECT_BASE_MS * 2 ** attempts);
+        attempts += 1;
+        retryTimer = setTimeout(connect, delay * (0.5 + Math.random() / 2));
+      };
+      socketRef.current = socket;
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      socket.close();
+    };
+  }, []);
+
+  return (message, httpFallback) => {
+    const socket = socketRef.current;
+    if (!socket || socket.readyState !== WebSocket.OPEN) {
+      return httpFallback().then(response => response.data);
+    }
+    const id = nextIdRef.current++;
+    return new Promise((resolve, reject) => {
+      pendingRef.current.set(id, reply =>
+        reply.type === "state" ? resolve(reply.state) : reject(new Error(reply.error))
+      );
+      socket.send(JSON.stringify({ ...message, id }));
+    });
+  };
+};
+
+// Basic strategy play for a live hand, looked up in the table from
+// /api/strategy (one H/S string per total, for upcards 2-10 then A)
+const basicAction = (strategy, state) => {
+  const soft = state.player_totals?.soft;
+  const row = strategy[soft ? "soft" : "hard"][soft || state.player_score];
+  if (!row) return state.player_score < 12 ? "hit" : "stand";
+  return row[state.dealer_cards[0].value - 2] === "H" ? "hit" : "stand";
+};
 
 const BlackjackGame = () => {
+  const sendAction = useGameSocket();
   const [gameState, setGameState] = useState(null);
   const [gameId, setGameId] = useState(null);
   const [betAmount, setBetAmount] = useState(1);
@@ -16,6 +93,8 @@ const BlackjackGame = () => {
   const [dealingOrder, setDealingOrder] = useState([]);
   const [visibleCards, setVisibleCards] = useState({ player: [], dealer: [] });
   const [editingBalance, setEditingBalance] = useState(false);
+  const [strategy, setStrategy] = useState(null);
+  const [autoPlay, setAutoPlay] = useState(false);
 
   // Simulate realistic card distribution
   const distributeCards = (cards, dealerCards) => {
@@ -39,9 +118,9 @@ const BlackjackGame = () => {
           if (deal.target === 'player') {
             newVisible.player = [...newVisible.player, cards[deal.cardIndex]];
           } else {
-            // Dealer's second card stays hidden during game
-            const card = dealerCards[deal.cardIndex];
+            // Only the upcard is sent during the hand; the hole card is dealt face down
             const isHidden = deal.cardIndex === 1;
+            const card = isHidden ? {} : dealerCards[deal.cardIndex];
             newVisible.dealer = [...newVisible.dealer, { ...card, isHidden }];
           }
           return newVisible;
@@ -60,14 +139,23 @@ const BlackjackGame = () => {
   // Start new game
   const startNewGame = async () => {
     try {
-      const response = await axios.post(`${API}/game/new`);
-      setGameState(response.data);
-      setGameId(response.data.id);
+      // Deal the next hand of the current game (same shoe and balance) if there is one
+      const data = gameId
+        ? await sendAction(
+            { action: "next_hand", game_id: gameId },
+            () => axios.post(`${API}/game/${gameId}/action`, { action: "new_game" })
+          )
+        : await sendAction(
+            { action: "new_game" },
+            () => axios.post(`${API}/game/new`)
+          );
+      setGameState(data);
+      setGameId(data.id);
       setBetAmount(1);
       setShowResult(false);
       
       // Start realistic card distribution
-      distributeCards(response.data.player_cards, response.data.dealer_cards);
+      distributeCards(data.player_cards, data.dealer_cards);
       
     } catch (error) {
       console.error("Error starting new game:", error);
@@ -79,11 +167,12 @@ const BlackjackGame = () => {
     if (!gameId) return;
     
     try {
-      const response = await axios.post(`${API}/game/${gameId}/bet`, {
-        amount: betAmount
-      });
-      setGameState(response.data);
-      setBalance(response.data.balance);
+      const data = await sendAction(
+        { action: "bet", game_id: gameId, amount: betAmount },
+        () => axios.post(`${API}/game/${gameId}/bet`, { amount: betAmount })
+      );
+      setGameState(data);
+      setBalance(data.balance);
     } catch (error) {
       console.error("Error placing bet:", error);
     }
@@ -96,25 +185,26 @@ const BlackjackGame = () => {
     setIsAnimating(true);
     
     try {
-      const response = await axios.post(`${API}/game/${gameId}/action`, {
-        action: "hit"
-      });
+      const data = await sendAction(
+        { action: "hit", game_id: gameId },
+        () => axios.post(`${API}/game/${gameId}/action`, { action: "hit" })
+      );
       
       // Animate new card from deck
       setTimeout(() => {
-        const newCard = response.data.player_cards[response.data.player_cards.length - 1];
+        const newCard = data.player_cards[data.player_cards.length - 1];
         setVisibleCards(prev => ({
           ...prev,
           player: [...prev.player, newCard]
         }));
         
         setTimeout(() => {
-          setGameState(response.data);
-          setBalance(response.data.balance);
+          setGameState(data);
+          setBalance(data.balance);
           setIsAnimating(false);
           
           // Show result if game ended (but only after seeing the card)
-          if (response.data.game_status !== "playing") {
+          if (data.game_status !== "playing") {
             setTimeout(() => setShowResult(true), 800);
           }
         }, 200);
@@ -133,21 +223,22 @@ const BlackjackGame = () => {
     setIsAnimating(true);
     
     try {
-      const response = await axios.post(`${API}/game/${gameId}/action`, {
-        action: "stand"
-      });
+      const data = await sendAction(
+        { action: "stand", game_id: gameId },
+        () => axios.post(`${API}/game/${gameId}/action`, { action: "stand" })
+      );
       
-      // First reveal dealer's hidden card
+      // First reveal dealer's hidden card, sent with the stand
       setTimeout(() => {
         setVisibleCards(prev => ({
           ...prev,
           dealer: prev.dealer.map((card, index) => 
-            index === 1 ? { ...card, isHidden: false } : card
+            index === 1 ? data.dealer_cards[1] : card
           )
         }));
         
         // Then add any additional dealer cards one by one
-        const additionalCards = response.data.dealer_cards.slice(2);
+        const additionalCards = data.dealer_cards.slice(2);
         
         if (additionalCards.length > 0) {
           additionalCards.forEach((card, index) => {
@@ -162,8 +253,8 @@ const BlackjackGame = () => {
         
         // Update game state and show result after all animations
         setTimeout(() => {
-          setGameState(response.data);
-          setBalance(response.data.balance);
+          setGameState(data);
+          setBalance(data.balance);
           setIsAnimating(false);
           setTimeout(() => setShowResult(true), 600);
         }, additionalCards.length * 400 + 800);
@@ -282,8 +373,22 @@ const BlackjackGame = () => {
 
   useEffect(() => {
     startNewGame();
+    axios.get(`${API}/strategy`)
+      .then(response => setStrategy(response.data))
+      .catch(error => console.error("Error loading strategy:", error));
   }, []);
 
+  // Auto-play: once the cards have landed, make the basic strategy play
+  useEffect(() => {
+    if (!autoPlay || !strategy || isAnimating || isDistributing) return;
+    if (gameState?.game_status !== "playing") return;
+    const timer = setTimeout(
+      basicAction(strategy, gameState) === "hit" ? tirer : rester,
+      600
+    );
+    return () => clearTimeout(timer);
+  }, [autoPlay, strategy, gameState, isAnimating, isDistributing]);
+
   if (!gameState) {
     return (
       <div className="blackjack-container">
@@ -370,7 +475,12 @@ const BlackjackGame = () => {
         <div className="player-section">
           <div className="section-label">
             <span>Joueur</span>  
-            <span className="score">{gameState.player_score}</span>
+            <span className="score">
+              {/* Soft hands show both totals, e.g. 7/17 for A-6 */}
+              {gameState.player_totals?.soft
+                ? `${gameState.player_totals.hard}/${gameState.player_totals.soft}`
+                : gameState.player_score}
+            </span>
           </div>
           <div className="cards-container">
             {visibleCards.player.map((card, index) => (
@@ -434,6 +544,13 @@ const BlackjackGame = () => {
             >
               Rester
             </button>
+            <button
+              className={`control-btn auto-btn ${autoPlay ? 'auto-btn-active' : ''}`}
+              onClick={() => setAutoPlay(!autoPlay)}
+              disabled={!strategy}
+            >
+              Auto
+            </button>
           </>
         ) : (
           <button 
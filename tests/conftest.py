@@ -0,0 +1,101 @@
+import asyncio
+import os
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+# server.py reads its configuration from the environment at import
+os.environ.update(SESSION_BACKEND="memory", JOURNAL_DIR="", HAND_EXPORT_DIR="",
+                  RATE_LIMIT_CREATE="0", RATE_LIMIT_ACTIONS="0", RATE_LIMIT_TABLES="0")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+class YieldingCollection(server.InMemoryCollection):
+    """InMemoryCollection that lets other tasks run a few times before every
+    call, the way a network client does, so concurrent requests interleave"""
+
+    rng = random.Random(0)
+
+    async def _round_trip(self):
+        for _ in range(self.rng.randrange(4)):
+            await asyncio.sleep(0)
+
+    async def find_one(self, *args, **kwargs):
+        await self._round_trip()
+        return await super().find_one(*args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        await self._round_trip()
+        return await super().insert_one(*args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        await self._round_trip()
+        return await super().update_one(*args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        await self._round_trip()
+        return await super().find_one_and_update(*args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        await self._round_trip()
+        return await super().bulk_write(*args, **kwargs)
+
+
+class SlowCollection(server.InMemoryCollection):
+    """InMemoryCollection whose bulk writes take long enough for a test to
+    act while a flush is still waiting on one"""
+
+    async def bulk_write(self, *args, **kwargs):
+        await asyncio.sleep(0.2)
+        return await super().bulk_write(*args, **kwargs)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def slow_collection():
+    return SlowCollection
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    """Fresh in-process sessions and wallets, as with SESSION_BACKEND=memory"""
+    store = server.SessionStore(max_size=1000, ttl_seconds=3600, sweep_interval=30)
+    monkeypatch.setattr(server, "session_backend", server.MemorySessionBackend(store))
+    monkeypatch.setattr(server, "wallet_store", server.WalletStore(
+        server.InMemoryCollection(), server.InMemoryCollection(), write_behind=True))
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    """Sessions and wallets shared through collections, as with SESSION_BACKEND=shared"""
+    monkeypatch.setattr(server, "session_backend", server.SharedSessionBackend(YieldingCollection()))
+    monkeypatch.setattr(server, "wallet_store", server.WalletStore(
+        YieldingCollection(), YieldingCollection(), write_behind=False))
+
+
+@pytest.fixture
+def stale(monkeypatch):
+    """Run an action on a game as loaded before another worker moved it on
+    with a hit; returns the action's reply and the game as that hit saved it"""
+    async def run(game_id, action):
+        stale_session = await server.session_backend.get(game_id)
+        await server.game_action(game_id, server.GameAction(action="hit"))
+        saved = await server.session_backend.get(game_id)
+        get = server.session_backend.get
+
+        async def get_stale(loaded_id):
+            return stale_session if loaded_id == game_id else await get(loaded_id)
+
+        with monkeypatch.context() as patch:
+            patch.setattr(server.session_backend, "get", get_stale)
+            return await action(), saved
+
+    return run
@@ -0,0 +1,17 @@
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "s3cret-tøken")
+
+
+@pytest.mark.parametrize("token", [None, "", "wrong", "s3cret-token", "ünïcode"])
+def test_a_wrong_token_is_refused(token):
+    assert server.admin_denied(token).status_code == 403
+
+
+def test_the_admin_token_is_accepted():
+    assert server.admin_denied("s3cret-tøken") is None
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import server
+
+
+def scope(*forwarded):
+    return {"client": ("10.0.0.2", 5000), "headers": [(b"x-forwarded-for", value) for value in forwarded]}
+
+
+def new_admission(trust_forwarded, rate=0):
+    buckets = [server.TokenBuckets(rate=rate, burst=2, max_clients=10) for _ in range(2)]
+    return server.Admission(*buckets, max_in_flight=10, trust_forwarded=trust_forwarded)
+
+
+@pytest.mark.parametrize("forwarded, client", [
+    ((), "10.0.0.2"),
+    ((b"203.0.113.7",), "203.0.113.7"),
+    ((b"1.1.1.1, 203.0.113.7",), "203.0.113.7"),
+    ((b"1.1.1.1", b"8.8.8.8, 203.0.113.7"), "203.0.113.7"),
+])
+def test_clients_are_keyed_on_the_address_the_proxy_appended(forwarded, client):
+    assert new_admission(trust_forwarded=True).client(scope(*forwarded)) == client
+
+
+def test_forwarded_addresses_are_ignored_unless_trusted():
+    assert new_admission(trust_forwarded=False).client(scope(b"203.0.113.7")) == "10.0.0.2"
+
+
+def test_a_client_is_throttled_past_its_burst():
+    admission = new_admission(trust_forwarded=True, rate=1)
+    waits = [admission.take(scope(f"1.1.1.{i}, 203.0.113.7".encode()), "create") for i in range(3)]
+    assert waits[:2] == [0.0, 0.0] and waits[2] > 0
+    assert admission.take(scope(b"203.0.113.8"), "create") == 0.0
+
+
+def test_a_zero_rate_never_throttles():
+    admission = new_admission(trust_forwarded=False)
+    assert all(admission.take(scope(), "action") == 0.0 for _ in range(100))
+
+
+def test_tables_have_a_bucket_of_their_own():
+    buckets = [server.TokenBuckets(rate=rate, burst=1, max_clients=10) for rate in (0, 0, 1)]
+    admission = server.Admission(*buckets[:2], max_in_flight=10, tables=buckets[2])
+    assert admission.take(scope(), "table") == 0.0
+    assert admission.take(scope(), "table") > 0
+    assert admission.take(scope(), "create") == 0.0
+
+
+def test_the_limits_are_on_by_default_and_keyed_on_the_peer():
+    env = {name: value for name, value in os.environ.items() if not name.startswith("RATE_LIMIT_")}
+    script = ("import server; print(*(server.admission.buckets[kind].rate"
+              " for kind in ('create', 'table', 'action')), server.admission.trust_forwarded)")
+    output = subprocess.run([sys.executable, "-c", script], env=env, cwd=Path(server.__file__).parent,
+                            capture_output=True, text=True, check=True).stdout.split()
+    assert all(float(rate) > 0 for rate in output[:3])
+    assert output[3] == "False"
@@ -0,0 +1,11 @@
+from fastapi.testclient import TestClient
+
+import server
+
+
+def test_lifespan_warms_up_before_ready_and_stops_on_shutdown(memory):
+    with TestClient(server.app) as client:
+        assert client.get("/readyz").json() == {"status": "ready", "checks": {"warm": True}}
+        tasks = [server.app.state.shoe_refill, server.app.state.stats_refresh]
+    assert server.app.state.ready is False
+    assert all(task.done() for task in tasks)
@@ -0,0 +1,56 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def socket(memory):
+    with TestClient(server.app).websocket_connect("/api/ws/game") as websocket:
+        yield websocket
+
+
+@pytest.mark.parametrize("player_id", [{"$gt": ""}, "", "x" * 300, "two words", 7])
+def test_invalid_player_id_is_refused_and_the_socket_stays_open(socket, player_id):
+    socket.send_json({"action": "new_game", "player_id": player_id, "id": 1})
+    reply = socket.receive_json()
+    assert reply["type"] == "error"
+    assert reply["error"].startswith("Invalid message")
+
+    socket.send_json({"action": "new_game", "player_id": "alice", "id": 2})
+    reply = socket.receive_json()
+    assert reply["type"] == "state"
+    assert reply["id"] == 2
+    assert reply["state"]["player_id"] == "alice"
+
+
+def test_game_id_must_be_a_string(socket):
+    socket.send_json({"action": "hit", "game_id": {"$ne": None}})
+    assert socket.receive_json()["type"] == "error"
+    socket.send_json({"action": "new_game"})
+    assert socket.receive_json()["type"] == "state"
+
+
+def test_plays_a_hand(socket):
+    socket.send_json({"action": "new_game"})
+    state = socket.receive_json()["state"]
+    socket.send_json({"action": "bet", "amount": 10})
+    assert socket.receive_json()["state"]["bet_amount"] == 10
+    socket.send_json({"action": "stand", "compact": True, "id": "s"})
+    reply = socket.receive_json()
+    assert reply == {"id": "s", "type": "delta", "delta": reply["delta"]}
+    assert reply["delta"]["id"] == state["id"]
+    assert reply["delta"]["game_status"] in server.PAYOFFS
+
+
+def test_table_socket_sends_the_state_before_the_ack(memory):
+    client = TestClient(server.app)
+    table = client.post("/api/tables").json()
+    with client.websocket_connect(f"/api/ws/tables/{table['id']}") as websocket:
+        assert websocket.receive_json()["table"]["version"] == table["version"]
+        websocket.send_json({"action": "join", "player_id": "alice", "id": 1})
+        state = websocket.receive_json()
+        assert state["type"] == "table" and state["table"]["seats"][0]["player_id"] == "alice"
+        assert websocket.receive_json() == {"id": 1, "type": "ack", "seat": 0}
+        websocket.send_json({"action": "bet", "amount": "lots"})
+        assert websocket.receive_json()["error"].startswith("Invalid message")
@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+import server
+
+
+def cards(*ranks):
+    return [next(card for card in server.CARDS if card.rank == rank) for rank in ranks]
+
+
+@pytest.mark.parametrize("ranks, hard, soft", [
+    (("A",), 1, 11),
+    (("A", "K"), 11, 21),
+    (("A", "A"), 2, 12),
+    (("A", "A", "9"), 11, 21),
+    (("A", "6", "K"), 17, None),
+    (("A", "A", "A", "8"), 11, 21),
+    (("K", "Q", "2"), 22, None),
+])
+def test_totals(ranks, hard, soft):
+    totals = server.HandTotals.of(cards(*ranks))
+    assert (totals.hard, totals.soft) == (hard, soft)
+    assert totals.best == server.calculate_score(cards(*ranks))
+
+
+def test_totals_after_every_card_match_calculate_score():
+    rng = random.Random(0)
+    for _ in range(2000):
+        # Ace-heavy shoes too, so multi-ace and soft-to-hard transitions are common
+        pool = list(server.CARDS) * rng.randint(1, 8) + [server.CARDS[0]] * rng.randint(0, 12)
+        hand = rng.sample(pool, rng.randint(1, 12))
+        totals = server.HandTotals()
+        for i, card in enumerate(hand, 1):
+            totals.add(card)
+            score = server.calculate_score(hand[:i])
+            assert totals.best == score, hand[:i]
+            assert totals == server.HandTotals.of(hand[:i])
+            assert totals.hard == sum(1 if c.rank == 'A' else c.value for c in hand[:i])
+            assert (totals.soft is not None) == server.is_soft(hand[:i], score)
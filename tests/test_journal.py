@@ -0,0 +1,170 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def snapshot(session):
+    return (session.player_id, bytes(session.player_cards), bytes(session.dealer_cards),
+            session.player_score, session.dealer_score, session.game_status, session.bet_amount,
+            session.balance, session.version, session.hand, bytes(session.deck), session.shoe_seed)
+
+
+async def play(hands, player_id=None):
+    """A game played `hands` hands in, the last one left at a hit"""
+    game = await server.new_game(player_id)
+    for _ in range(hands):
+        if game.game_status != "playing":
+            game = await server.game_action(game.id, server.GameAction(action="new_game"))
+        await server.place_bet(game.id, server.BetRequest(amount=10))
+        game = await server.game_action(game.id, server.GameAction(action="hit"))
+        if game.game_status == "playing":
+            game = await server.game_action(game.id, server.GameAction(action="stand"))
+    if game.game_status != "playing":
+        game = await server.game_action(game.id, server.GameAction(action="new_game"))
+    await server.game_action(game.id, server.GameAction(action="hit"))
+    return game.id
+
+
+async def live_games(games):
+    return {game_id: snapshot(await server.session_backend.get(game_id)) for game_id in games}
+
+
+def replayed(sessions):
+    return {game_id: snapshot(session) for game_id, session in sessions.items()}
+
+
+@pytest.fixture
+async def journal(memory, tmp_path, monkeypatch):
+    journal = new_journal(tmp_path)
+    monkeypatch.setattr(server, "journal", journal)
+    await journal.start()
+    yield journal
+    await journal.close()
+
+
+def new_journal(directory, **kwargs):
+    options = dict(segment_bytes=64 << 20, fsync_interval=0.01, max_buffer=1 << 20, ttl_seconds=3600)
+    return server.EventJournal(directory, **{**options, **kwargs})
+
+
+async def test_close_finishes_the_write_in_progress(tmp_path, monkeypatch):
+    journal = new_journal(tmp_path)
+    write = journal._write
+    writes = []
+
+    def slow_write(data):
+        writes.append(data)
+        if len(writes) == 1:
+            time.sleep(0.2)
+        write(data)
+
+    monkeypatch.setattr(journal, "_write", slow_write)
+    await journal.start()
+    journal._append(server.EVENT_BET, 0, 1, "00" * 16)
+    await asyncio.sleep(0.05)  # the flusher is now waiting on the write
+    journal._append(server.EVENT_BET, 0, 2, "00" * 16)
+    await journal.close()
+
+    records = [record for segment in server.journal_segments(tmp_path) for record in segment
+               if record["event"] == server.EVENT_BET]
+    assert [record["hand"] for record in records] == [1, 2]
+
+
+async def test_replay_rebuilds_every_game(journal, tmp_path):
+    games = [await play(hands, player_id) for hands in (0, 1, 5, 80)
+             for player_id in (None, "a-player-id-longer-than-thirty-two-bytes")]
+    await journal.flush()
+
+    sessions = server.replay_journal(tmp_path)
+    assert replayed(sessions) == await live_games(games)
+    for game_id in games:
+        # Replayed from the time of the game's first record
+        created_at = (await server.session_backend.get(game_id)).created_at
+        assert abs(sessions[game_id].created_at - created_at) < timedelta(seconds=1)
+
+
+async def test_a_new_segment_checkpoints_the_live_games_and_removes_the_rest(journal, tmp_path):
+    journal.segment_bytes = 20 * server.JOURNAL_RECORD.size
+    games = []
+    for hands in range(20):
+        games.append(await play(hands))
+        await journal.flush()
+    for game_id in games[::2]:
+        await server.game_action(game_id, server.GameAction(action="stand"))
+        await journal.flush()
+
+    segments = sorted(tmp_path.glob("*.journal"))
+    assert len(segments) == 1 and int(segments[0].stem) > 10
+    assert segments[0].read_bytes()[0] == server.EVENT_CHECKPOINT
+    assert replayed(server.replay_journal(tmp_path)) == await live_games(games)
+
+
+async def test_restart_resumes_from_the_checkpoint(journal, tmp_path):
+    games = [await play(hands) for hands in (1, 3, 12)]
+    await journal.close()
+    live = await live_games(games)
+
+    restarted = new_journal(tmp_path)
+    assert replayed(await restarted.start()) == live
+    await restarted.close()
+    assert [path.name for path in tmp_path.glob("*.journal")] == ["0000000001.journal"]
+    assert replayed(server.replay_journal(tmp_path)) == live
+
+
+async def test_checkpoints_leave_out_games_past_the_ttl(journal, tmp_path):
+    old = await play(2)
+    await journal.close()
+    await asyncio.sleep(0.2)
+    recent = await play(2)
+    await journal.flush()
+
+    restarted = new_journal(tmp_path, ttl_seconds=0.1)
+    assert list(await restarted.start()) == [recent]
+    await restarted.close()
+    assert old not in server.replay_journal(tmp_path)
+
+
+async def test_records_that_do_not_match_the_shoe_fail_the_replay(journal, tmp_path):
+    game_id = await play(3)
+    await journal.flush()
+    session = await server.session_backend.get(game_id)
+    session.deck.pop()  # one card more was dealt than the journal knows of
+    journal.hit(session)
+    await journal.flush()
+
+    with pytest.raises(server.JournalError):
+        server.replay_journal(tmp_path)
+    with pytest.raises(server.JournalError):
+        await new_journal(tmp_path).start()
+
+
+async def test_a_checkpoint_torn_by_a_crash_is_not_replayed(journal, tmp_path, monkeypatch):
+    games = [await play(hands) for hands in range(5)]
+    await journal.close()
+    live = await live_games(games)
+
+    checkpoint = server.journal_checkpoint
+
+    def torn_checkpoint(directory, since_ns):
+        data, sessions = checkpoint(directory, since_ns)
+        return data[:4 * server.JOURNAL_RECORD.size], sessions
+
+    def crash(fd):
+        raise OSError("power lost")
+
+    with monkeypatch.context() as patched, pytest.raises(OSError):
+        patched.setattr(server, "journal_checkpoint", torn_checkpoint)
+        patched.setattr(server.os, "fsync", crash)
+        await new_journal(tmp_path).start()
+
+    restarted = new_journal(tmp_path)
+    assert replayed(await restarted.start()) == live
+    await restarted.close()
+    assert not list(tmp_path.glob("*.tmp"))
+    assert replayed(server.replay_journal(tmp_path)) == live
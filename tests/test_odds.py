@@ -0,0 +1,22 @@
+import server
+
+TEN = server.RANK_VALUES.index(10)
+
+
+def test_exact_odds_with_only_tens_left():
+    counts = tuple(20 if group == TEN else 0 for group in range(len(server.RANK_VALUES)))
+    odds = server.exact_odds(20, 0, 10, counts)
+    assert odds["dealer_final"] == {20: 1.0}
+    assert odds["ev_stand"] == 0.0
+    assert odds["ev_hit"] == -1.0
+
+
+def test_hand_odds_agree_with_the_dealer_distribution():
+    seed, deck = server.create_shoes(1, 1, "mt")[0]
+    session = server.GameSession("g", deck, seed, "mt")
+    server.start_hand(session)
+    odds = server.hand_odds(session)
+
+    assert abs(sum(p for key, p in odds["dealer_final"].items()) - 1) < 1e-9
+    assert odds["best_action"] == ("hit" if odds["ev_hit"] > odds["ev_stand"] else "stand")
+    assert server.hand_odds(session) == odds
@@ -0,0 +1,57 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def client(memory):
+    return TestClient(server.app)
+
+
+def documented(client, method, path):
+    schema = client.get("/openapi.json").json()["paths"][path][method]
+    return schema["responses"]["200"]["content"]["application/json"]["schema"]
+
+
+@pytest.mark.parametrize("method, path, model", [
+    ("get", "/api/game/{game_id}/odds", "Odds"),
+    ("get", "/api/players/{player_id}/wallet", "Wallet"),
+    ("post", "/api/sim", "SimResult"),
+    ("post", "/api/games/batch", "BatchTotals"),
+])
+def test_replies_are_documented(client, method, path, model):
+    assert f"#/components/schemas/{model}" in str(documented(client, method, path))
+
+
+def test_replies_match_their_models(client):
+    game = client.post("/api/game/new").json()
+    server.Odds.model_validate(client.get(f"/api/game/{game['id']}/odds").json())
+    server.Wallet.model_validate(client.get("/api/players/alice/wallet").json())
+    server.SimResult.model_validate(client.post("/api/sim", json={"hands": 1000, "seed": 1}).json())
+    batch = client.post("/api/games/batch", json={"hands": 100, "seed": 1}).json()
+    server.BatchTotals.model_validate(batch)
+    assert client.post("/api/sim", json={"strategy": "nonsense"}).json().keys() == {"error"}
+
+
+def test_the_hole_card_is_only_sent_once_the_dealer_plays(client):
+    game = client.post("/api/game/new").json()
+    url = f"/api/game/{game['id']}"
+    assert len(game["dealer_cards"]) == 1
+    while True:
+        hit = client.post(f"{url}/action", json={"action": "hit", "compact": True}).json()
+        if hit.get("game_status") is not None:
+            break  # bust: the dealer does not play, and the hole card is shown
+        assert "dealer_cards" not in hit
+        assert len(client.get(url).json()["dealer_cards"]) == 1
+        stand = client.post(f"{url}/action", json={"action": "stand", "compact": True}).json()
+        assert len(stand["dealer_cards"]) >= 1
+        client.post(f"{url}/action", json={"action": "new_game"})
+
+    dealer_cards = client.get(url).json()["dealer_cards"]
+    assert hit["dealer_cards"] == [f"{card['rank']}{card['suit'][0].upper()}" for card in dealer_cards[1:]]
+
+
+def test_simulations_run_in_workers_that_were_not_forked(client):
+    assert server.get_process_pool()._mp_context.get_start_method() != "fork"
+    assert client.post("/api/sim", json={"hands": 100_000_000}).status_code == 422
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def new_session(game_id: str) -> server.GameSession:
+    seed, deck = server.create_shoes(1, 1)[0]
+    session = server.GameSession(game_id, deck, seed, server.SHUFFLE_RNG)
+    server.deal_hand(session)
+    return session
+
+
+async def test_close_writes_the_batch_being_flushed(slow_collection):
+    collection = slow_collection()
+    backend = server.MongoSessionBackend(
+        server.SessionStore(max_size=100, ttl_seconds=3600, sweep_interval=30),
+        server.SessionWriteBehind(collection, flush_interval=0.01, max_batch=500),
+    )
+    await backend.start()
+    await backend.create("a", new_session("a"))
+    await asyncio.sleep(0.05)  # the flusher is now waiting on bulk_write
+    await backend.create("b", new_session("b"))
+    await backend.close()
+
+    assert len(collection) == 2
+    assert server.session_from_document(await collection.find_one({"_id": "a"})).hand == 1
+
+
+async def test_a_stale_save_is_a_conflict():
+    backend = server.SharedSessionBackend(server.InMemoryCollection())
+    await backend.create("a", new_session("a"))
+    first, second = await backend.get("a"), await backend.get("a")
+    await backend.save("a", first)
+
+    with pytest.raises(server.SessionConflict):
+        await backend.save("a", second)
+    assert second.version == first.version - 1
+    assert backend.conflicts == 1
+    assert (await backend.get("a")).version == first.version
+
+
+async def test_an_action_on_a_stale_game_is_refused_with_409(shared, stale):
+    game = await server.new_game()
+    stand = server.GameAction(action="stand")
+    response, saved = await stale(game.id, lambda: server.game_action(game.id, stand))
+
+    assert response.status_code == 409
+    assert b"updated concurrently" in response.body
+    current = await server.session_backend.get(game.id)
+    assert (current.version, bytes(current.player_cards), current.game_status) == (
+        saved.version, bytes(saved.player_cards), saved.game_status)
+
+
+def test_a_backend_must_define_get_create_and_save():
+    class Unfinished(server.SessionBackend):
+        async def get(self, game_id):
+            return None
+
+    with pytest.raises(TypeError, match="create, save"):
+        Unfinished()
+
+
+async def test_an_unknown_action_is_refused_without_saving(memory):
+    game = await server.new_game()
+    version = (await server.session_backend.get(game.id)).version
+
+    reply = await server.game_action(game.id, server.GameAction(action="bogus"))
+
+    assert reply == {"error": "Unknown action: bogus"}
+    assert (await server.session_backend.get(game.id)).version == version
@@ -0,0 +1,38 @@
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("rng", server.SHUFFLER_NAMES)
+def test_a_seed_replays_its_shoe(rng):
+    for seed, shoe in server.create_shoes(4, 2, rng):
+        assert server.shuffled_indices(2, seed, rng) == list(shoe)
+
+
+@pytest.mark.parametrize("rng", server.SHUFFLER_NAMES)
+def test_no_shoes(rng):
+    assert server.create_shoes(0, 2, rng) == []
+    assert server.SHUFFLERS[rng].shuffle_many(0, 52) == []
+
+
+def test_fast_shoes_in_one_batch_have_unrelated_seeds():
+    shuffler = server.SHUFFLERS["fast"]
+    seeds = [seed for seed, _ in shuffler.shuffle_many(8, 52)]
+    keys = {seed >> shuffler.ROW_BITS for seed in seeds}
+    assert len(keys) == 8
+    assert all(seed & ((1 << shuffler.ROW_BITS) - 1) == 0 for seed in seeds)
+
+
+def test_fast_seeds_from_shared_batches_still_replay():
+    key = 12345
+    shoes = server.np.random.default_rng(key).random((3, 52)).argsort(axis=1, kind="stable").tolist()
+    for row, order in enumerate(shoes):
+        assert server.SHUFFLERS["fast"].shuffle((key << 16) | row, 52) == order
+
+
+def test_a_shuffler_must_define_shuffle():
+    class Unfinished(server.Shuffler):
+        pass
+
+    with pytest.raises(TypeError, match="shuffle"):
+        Unfinished()
@@ -0,0 +1,176 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def seated_table(*player_ids) -> server.Table:
+    state = await server.create_table()
+    for player_id in player_ids:
+        await server.join_table(state.id, server.JoinRequest(player_id=player_id))
+    return server.table_sessions[state.id]
+
+
+async def deal_round(table: server.Table, bet: float = 100):
+    for number, seat in enumerate(table.seats):
+        if seat is not None:
+            await server.table_bet(table.id, number, server.BetRequest(amount=bet))
+    await server.table_deal(table.id)
+
+
+def payout(seat: server.Seat) -> float:
+    return seat.bet_amount * (1 + server.PAYOFFS[seat.status])
+
+
+async def test_every_seat_is_settled_against_one_dealer_hand(memory):
+    table = await seated_table("ann", "ben", None)
+    await deal_round(table)
+    for number in range(3):
+        await server.table_action(table.id, number, server.GameAction(action="stand"))
+
+    assert table.phase == "betting"
+    dealer_score = table.dealer_totals.best
+    assert dealer_score >= 17
+    for seat in table.seats[:3]:
+        if dealer_score > 21:
+            assert seat.status == "dealer_bust"
+        else:
+            assert seat.status == server.determine_winner(seat.totals.best, dealer_score)
+    for number, player_id in enumerate(["ann", "ben"]):
+        assert (await server.wallet_store.balance(player_id)
+                == server.STARTING_BALANCE - 100 + payout(table.seats[number]))
+    assert table.seats[2].balance == server.STARTING_BALANCE - 100 + payout(table.seats[2])
+
+
+async def test_a_stood_seat_cannot_leave_before_the_round_is_settled(memory):
+    table = await seated_table("ann", "ben")
+    await deal_round(table)
+    await server.table_action(table.id, 0, server.GameAction(action="stand"))
+    assert await server.leave_table(table.id, 0) == {"error": "Seat has a bet in play"}
+
+    await server.table_action(table.id, 1, server.GameAction(action="stand"))
+    owed = payout(table.seats[0])
+    assert (await server.leave_table(table.id, 0)).seats[0] is None
+    assert await server.wallet_store.balance("ann") == server.STARTING_BALANCE - 100 + owed
+
+
+async def test_a_seat_left_while_waiting_for_the_lock_is_reported_empty(memory):
+    table = await seated_table(None)
+    async with table.lock:
+        requests = [
+            asyncio.create_task(server.leave_table(table.id, 0)),
+            asyncio.create_task(server.table_bet(table.id, 0, server.BetRequest(amount=10))),
+            asyncio.create_task(server.table_action(table.id, 0, server.GameAction(action="hit"))),
+        ]
+        await asyncio.sleep(0)
+    left, bet, action = await asyncio.gather(*requests)
+
+    assert left.seats[0] is None
+    assert bet == action == {"error": "Seat is empty"}
+
+
+async def test_idle_seats_are_stood_for_when_the_turn_time_is_up(memory, monkeypatch):
+    monkeypatch.setattr(server, "TABLE_TURN_SECONDS", 0.05)
+    table = await seated_table(None, None)
+    await deal_round(table)
+    await server.table_action(table.id, 0, server.GameAction(action="stand"))
+    assert table.phase == "playing"
+
+    await asyncio.sleep(0.2)
+    assert table.phase == "betting"
+    assert table.seats[1].status in server.PAYOFFS
+    assert table.turn_timer is None
+
+
+async def test_the_turn_timer_stops_once_the_round_is_settled(memory):
+    table = await seated_table(None)
+    await deal_round(table)
+    timer = table.turn_timer
+    await server.table_action(table.id, 0, server.GameAction(action="stand"))
+    await asyncio.sleep(0)
+
+    assert timer.cancelled()
+    assert table.turn_timer is None
+
+
+@pytest.mark.parametrize("dealt", [False, True], ids=["bet", "dealt"])
+async def test_stakes_at_an_evicted_table_are_refunded(memory, monkeypatch, dealt):
+    monkeypatch.setattr(server, "table_sessions", server.SessionStore(
+        max_size=1, ttl_seconds=3600, sweep_interval=30, on_evict=server.table_dropped))
+    table = await seated_table("pam", None)
+    for number in range(2):
+        await server.table_bet(table.id, number, server.BetRequest(amount=100))
+    if dealt:
+        await server.table_deal(table.id)
+    assert await server.wallet_store.balance("pam") == server.STARTING_BALANCE - 100
+
+    await server.create_table()
+    await asyncio.gather(*server._closing_tables)
+
+    assert table.id not in server.table_sessions
+    assert table.phase == "closed"
+    assert await server.wallet_store.balance("pam") == server.STARTING_BALANCE
+    server.table_sessions[table.id] = table  # as if a handler had looked it up before the eviction
+    assert "error" in await server.table_bet(table.id, 0, server.BetRequest(amount=50))
+    assert "error" in await server.table_deal(table.id)
+    assert await server.wallet_store.balance("pam") == server.STARTING_BALANCE
+
+
+async def test_an_expired_table_without_stakes_refunds_nothing(memory, monkeypatch):
+    table = await seated_table("quinn")
+    refunded = server.tables_refunded
+    monkeypatch.setattr(server, "table_sessions", server.SessionStore(
+        max_size=10, ttl_seconds=0, sweep_interval=30, on_evict=server.table_dropped))
+    server.table_sessions[table.id] = table
+    server.table_sessions.sweep()
+    await asyncio.gather(*server._closing_tables)
+
+    assert table.phase == "closed"
+    assert server.tables_refunded == refunded
+    assert await server.wallet_store.balance("quinn") == server.STARTING_BALANCE
+
+
+class StalledSocket:
+    """A watcher whose sends never complete, as with a full send buffer"""
+
+    client_state = server.WebSocketState.CONNECTED
+
+    def __init__(self):
+        self.closed = asyncio.Event()
+
+    async def send_text(self, message):
+        await asyncio.Event().wait()
+
+    async def close(self):
+        self.client_state = server.WebSocketState.DISCONNECTED
+        self.closed.set()
+
+
+async def test_a_stalled_watcher_does_not_hold_up_the_table(memory, monkeypatch):
+    monkeypatch.setattr(server, "table_hub", server.TableHub(max_queue=3, send_timeout=0.2))
+    table = await seated_table()
+    socket = StalledSocket()
+    server.table_hub.watch(table.id, socket)
+
+    await asyncio.wait_for(server.join_table(table.id, server.JoinRequest()), 1)
+    assert server.table_hub.dropped == 0
+    for _ in range(5):  # until it is more than max_queue behind
+        server.changed(table)
+        await asyncio.sleep(0)
+    assert server.table_hub.dropped == 1
+    assert not server.table_hub._watchers
+    await asyncio.wait_for(socket.closed.wait(), 1)  # once the send in progress times out
+
+
+async def test_a_watcher_whose_send_times_out_is_closed(memory, monkeypatch):
+    monkeypatch.setattr(server, "table_hub", server.TableHub(max_queue=3, send_timeout=0.05))
+    table = await seated_table()
+    socket = StalledSocket()
+    server.table_hub.watch(table.id, socket)
+    await server.join_table(table.id, server.JoinRequest())
+
+    await asyncio.wait_for(socket.closed.wait(), 1)
+    assert not server.table_hub._watchers
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("trial", range(20))
+async def test_concurrent_bets_stake_only_what_was_debited(shared, trial):
+    game = await server.new_game(f"player-{trial}")
+    await asyncio.gather(
+        server.place_bet(game.id, server.BetRequest(amount=10)),
+        server.place_bet(game.id, server.BetRequest(amount=500)),
+    )
+
+    session = await server.session_backend.get(game.id)
+    balance = await server.wallet_store.balance(f"player-{trial}")
+    assert session.bet_amount in (0, 10, 500)
+    assert balance + session.bet_amount == server.STARTING_BALANCE
+
+
+async def test_concurrent_retries_of_one_bet_debit_once(shared):
+    game = await server.new_game("alice")
+    await asyncio.gather(*(server.place_bet(game.id, server.BetRequest(amount=25)) for _ in range(3)))
+
+    session = await server.session_backend.get(game.id)
+    assert session.bet_amount == 25
+    assert await server.wallet_store.balance("alice") == server.STARTING_BALANCE - 25
+
+
+async def test_a_failed_payout_credit_is_retried_on_the_next_load(shared, monkeypatch):
+    apply = server.wallet_store.apply
+    failed = []
+
+    async def flaky_apply(player_id, amount, key, kind, game_id):
+        if kind == "payout" and not failed:
+            failed.append(key)
+            raise ConnectionError("wallet store unavailable")
+        return await apply(player_id, amount, key, kind, game_id)
+
+    monkeypatch.setattr(server.wallet_store, "apply", flaky_apply)
+    game = await server.new_game("bob")
+    while True:
+        await server.place_bet(game.id, server.BetRequest(amount=100))
+        staked = await server.wallet_store.balance("bob")
+        state = await server.game_action(game.id, server.GameAction(action="stand"))
+        payout = 100 * (1 + server.PAYOFFS[state.game_status])
+        if payout:
+            break
+        await server.game_action(game.id, server.GameAction(action="new_game"))
+
+    # The outcome is saved with the payout still owed
+    assert failed
+    assert await server.wallet_store.balance("bob") == staked
+    assert (await server.session_backend.get(game.id)).pending_payout == payout
+
+    state = await server.get_game_state(game.id)
+    assert state.balance == staked + payout
+    assert (await server.session_backend.get(game.id)).pending_payout == 0
+    await server.get_game_state(game.id)
+    assert await server.wallet_store.balance("bob") == staked + payout
+
+
+async def test_payout_is_credited_once_per_hand(memory):
+    game = await server.new_game("carol")
+    await server.place_bet(game.id, server.BetRequest(amount=50))
+    state = await server.game_action(game.id, server.GameAction(action="stand"))
+    payout = 50 * (1 + server.PAYOFFS[state.game_status])
+    for _ in range(2):
+        await server.get_game_state(game.id)
+    await server.game_action(game.id, server.GameAction(action="new_game"))
+
+    assert await server.wallet_store.balance("carol") == server.STARTING_BALANCE - 50 + payout
+
+
+async def test_close_writes_the_wallet_entries_being_flushed(slow_collection):
+    wallets, ledger = slow_collection(), slow_collection()
+    store = server.WalletStore(wallets, ledger, write_behind=True, flush_interval=0.01)
+    await store.start()
+    await store.apply("dave", -10, "g:1:bet", "bet", "g")
+    await asyncio.sleep(0.05)  # the flusher is now waiting on bulk_write
+    await store.apply("dave", 30, "g:1:payout", "payout", "g")
+    await store.close()
+
+    assert (await wallets.find_one({"_id": "dave"}))["balance"] == server.STARTING_BALANCE + 20
+    assert len(ledger) == 2
+
+
+@pytest.fixture(params=[True, False], ids=["write_behind", "direct"])
+def wallets(request):
+    return server.WalletStore(server.InMemoryCollection(), server.InMemoryCollection(),
+                              write_behind=request.param)
+
+
+async def test_an_entry_is_applied_once_per_key(wallets):
+    assert await wallets.apply("frank", -30, "g:1:bet", "bet", "g") == (server.STARTING_BALANCE - 30, True)
+    assert await wallets.apply("frank", -30, "g:1:bet", "bet", "g") == (server.STARTING_BALANCE - 30, False)
+    await wallets.flush()
+
+    wallet = await wallets.wallets.find_one({"_id": "frank"})
+    assert wallet["balance"] == server.STARTING_BALANCE - 30
+    assert len(wallets.ledger) == 1
+
+
+async def test_a_debit_past_the_balance_is_refused(wallets):
+    assert await wallets.apply("gina", -server.STARTING_BALANCE - 1, "g:1:bet", "bet", "g") == (None, False)
+    assert await wallets.balance("gina") == server.STARTING_BALANCE
+    assert len(wallets.ledger) == 0
+
+
+async def test_a_reverted_entry_can_be_applied_again(wallets):
+    await wallets.apply("hugo", -30, "g:1:bet", "bet", "g")
+    assert await wallets.revert("hugo", -30, "g:1:bet", "g") == server.STARTING_BALANCE
+    assert await wallets.revert("hugo", -30, "g:1:bet", "g") == server.STARTING_BALANCE
+    assert await wallets.apply("hugo", -30, "g:1:bet", "bet", "g") == (server.STARTING_BALANCE - 30, True)
+    await wallets.flush()
+
+    wallet = await wallets.wallets.find_one({"_id": "hugo"})
+    assert wallet["balance"] == server.STARTING_BALANCE - 30
+    assert len(wallets.ledger) == 3  # bet, revert, bet
+
+
+async def test_a_bet_on_a_stale_game_is_refused_and_not_debited(shared, stale):
+    game = await server.new_game("erin")
+    response, _ = await stale(game.id, lambda: server.place_bet(game.id, server.BetRequest(amount=40)))
+
+    assert response.status_code == 409
+    assert (await server.session_backend.get(game.id)).bet_amount == 0
+    assert await server.wallet_store.balance("erin") == server.STARTING_BALANCE
+
+
+@pytest.mark.parametrize("action", ["stand", "hit"])
+async def test_a_bet_after_the_first_action_is_refused_and_not_debited(memory, action):
+    game = await server.new_game("ivan")
+    await server.game_action(game.id, server.GameAction(action=action))
+    session = await server.session_backend.get(game.id)
+    expected = "Game is not in progress" if session.game_status != "playing" else \
+        "Bets are placed before the first card is drawn"
+
+    assert await server.place_bet(game.id, server.BetRequest(amount=100)) == {"error": expected}
+    assert (await server.session_backend.get(game.id)).bet_amount == 0
+    assert await server.wallet_store.balance("ivan") == server.STARTING_BALANCE
+
+
+async def test_the_cache_evicts_the_least_recently_used_flushed_wallets():
+    store = server.WalletStore(server.InMemoryCollection(), server.InMemoryCollection(),
+                               write_behind=True, max_cached=2)
+    await store.apply("kim", -10, "g:1:bet", "bet", "g")
+    for player_id in ("lee", "max", "ned"):
+        await store.balance(player_id)
+
+    # kim's entry is not flushed yet, so only the others make way
+    assert list(store._cache) == ["kim", "ned"]
+    await store.flush()
+    await store.balance("oz")
+    assert list(store._cache) == ["ned", "oz"]
+    assert await store.balance("kim") == server.STARTING_BALANCE - 10
+
+
+@pytest.mark.parametrize("player_id", ["x" * 65, " has spaces", "héllo"])
+def test_the_wallet_route_refuses_invalid_player_ids(memory, player_id):
+    assert TestClient(server.app).get(f"/api/players/{player_id}/wallet").status_code == 422
+
+
+def test_reading_a_wallet_does_not_create_it(memory):
+    reply = TestClient(server.app).get("/api/players/nobody-yet/wallet").json()
+
+    assert reply == {"player_id": "nobody-yet", "balance": server.STARTING_BALANCE}
+    assert len(server.wallet_store.wallets) == 0
+    assert not server.wallet_store._cache